@@ -0,0 +1,323 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+import CheapTools
+from CheapTools import *
+
+# Benchmark suite of the analytic solver and its helpers. Each function is timed for all the
+# bundled DTDs, several numbers of infalls and several numbers of time nodes. The results
+# (wall time, peak memory and throughput) are written as JSON lines, one record per case,
+# so that two runs (e.g. two releases) can be compared with the --compare option:
+#
+#    python Benchmark.py --output bench_output.txt
+#    python Benchmark.py --output new.txt --compare bench_output.txt
+#
+# The first record of the output file contains the metadata of the run (versions, platform).
+# With --dtype float32, the functions that support it run in the float32 throughput mode. With --precision,
+# the errors of the float32 mode (with respect to float64) are measured instead of the timings. With --erf-count,
+# the number of calls to erf/erfc (and of evaluated elements) of each function is counted instead. With --memory, the
+# peak memory of each analytic kernel (traced by tracemalloc) is measured instead, in units of float64 arrays of the length of t.
+
+TypeIa_SNe_ratio = 0.54/100.*1E9;# +/-0.12 events/cent
+Area = np.pi*(20.**2-3.**2)*1E6;# In pc**2
+today = 13.8; # Gyr
+
+Loaders = {"MR01":Load_MR01_dict, "G05Wide":Load_G05Wide_dict, "G05Close":Load_G05Close_dict, "P08":Load_P08_dict,
+		   "T08":Load_T08_dict, "S05":Load_S05_dict, "MVP06":Load_MVP06_dict}
+
+# Functions to benchmark. Each entry returns a callable without arguments (the work to time) for a
+# given time array, chemical dictionary and dtype; everything that is not part of the work (e.g. the sigma_X
+# used by FromSigmaToAbundance) is computed when the callable is built.
+# Get_CIa only evaluates R1a at the present-day time, so it does not depend on the number of nodes.
+# Only the functions in Dtype_aware use the dtype (the others always run in float64).
+def _bench_FromSigmaToAbundance(t, chemdict, dtype):
+	sigmaX = SolveChemEvolModel(t, chemdict, dtype=dtype)
+	return( lambda: FromSigmaToAbundance(t, sigmaX, chemdict, dtype=dtype) )
+
+Functions = {
+	"SolveChemEvolModel": lambda t, chemdict, dtype: (lambda: SolveChemEvolModel(t, chemdict, dtype=dtype)),
+	"R1a_analytic": lambda t, chemdict, dtype: (lambda: R1a_analytic(t, chemdict, dtype=dtype)),
+	"iR1a_analytic": lambda t, chemdict, dtype: (lambda: iR1a_analytic(t, chemdict)),
+	"R1a_numeric": lambda t, chemdict, dtype: (lambda: R1a_numeric(t, chemdict)),
+	"Get_CIa": lambda t, chemdict, dtype: (lambda: Get_CIa(TypeIa_SNe_ratio, Area, chemdict, present_day_time=today)),
+	"ChemicalSolutionVerifier": lambda t, chemdict, dtype: (lambda: ChemicalSolutionVerifier(t, chemdict)),
+	"FromSigmaToAbundance": _bench_FromSigmaToAbundance,
+}
+Node_independent = ["Get_CIa"]
+Dtype_aware = ["SolveChemEvolModel", "R1a_analytic", "FromSigmaToAbundance"]
+
+# Analytic kernels of the --memory report: DTD family (key of its parameters in Family_keys) and kernel.
+# Each kernel is called with the first component of the family in the DTD of the loader.
+Kernels = {"R1a_analytic_gaussian":("G", R1a_analytic_gaussian), "R1a_analytic_exponential":("E", R1a_analytic_exponential),
+		   "R1a_analytic_inverse":("I", R1a_analytic_inverse), "SolveChemEvolModel_GaussianTerm":("G", SolveChemEvolModel_GaussianTerm),
+		   "SolveChemEvolModel_ExponentialTerm":("E", SolveChemEvolModel_ExponentialTerm), "SolveChemEvolModel_InverseTerm":("I", SolveChemEvolModel_InverseTerm)}
+Family_keys = {"G":["AG", "taup", "sigma_p", "tau1G", "tau2G"], "E":["AE", "tauD", "tau1E", "tau2E"], "I":["AI", "tauI", "tau0", "tau1I", "tau2I"]}
+# ----------------------------------------------------------------------------------------------------
+
+
+def build_chemdict(loader, n_infalls):
+	'''Chemical dictionary of the benchmark: the parameters of QuickTest.py with n_infalls
+	infalls (deterministic, equally spaced in time), iron yields and the DTD of the loader.'''
+	chemdict = {"omega" : 0.4, "R" : 0.285, "nuL" : 2., "sigma_gas_0" : 1E-8}
+	chemdict["tj"] = np.linspace(0., 10., n_infalls+1)[:-1]
+	chemdict["tauj"] = np.linspace(7., 0.5, n_infalls)
+	chemdict["Aj"] = np.full(n_infalls, 9.98032680842189/n_infalls)
+	chemdict = add_element(chemdict, "Fe", 0.0)
+	chemdict = Loaders[loader](chemdict)
+	chemdict["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, chemdict, present_day_time=today)
+	return( chemdict )
+
+
+def run_case(function, loader, n_infalls, n_nodes, repeat=3, memory=True, dtype="float64"):
+	'''Times one case. Returns a dictionary (one record of the output).
+	The wall time is the minimum over the repetitions (and the median is also given). The peak memory
+	(traced by tracemalloc, which includes the numpy buffers) is measured in an extra, untimed call.'''
+	dtype = dtype if function in Dtype_aware else "float64"
+	record = {"function":function, "loader":loader, "n_infalls":n_infalls, "n_nodes":n_nodes, "repeat":repeat, "dtype":dtype}
+	try:
+		chemdict = build_chemdict(loader, n_infalls)
+		t = np.linspace(0.01, today, n_nodes)
+		work = Functions[function](t, chemdict, np.dtype(dtype))
+
+		times = []
+		for _ in range(repeat):
+			start = time.perf_counter()
+			work()
+			times.append(time.perf_counter()-start)
+		record["wall_time_s"] = min(times)
+		record["wall_time_median_s"] = float(np.median(times))
+		record["nodes_per_s"] = n_nodes/record["wall_time_s"] if record["wall_time_s"]>0 else None
+
+		if memory:
+			tracemalloc.start()
+			work()
+			record["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+		record["status"] = "ok"
+	except Exception as error:# Report the failure and carry on with the other cases
+		if tracemalloc.is_tracing(): tracemalloc.stop()
+		record["status"] = "error: %s: %s"%(type(error).__name__, error)
+	return( record )
+
+
+def precision_case(loader, n_infalls, n_nodes):
+	'''Errors of the float32 mode with respect to float64 for one case. Returns a dictionary (one record of the output).
+	The errors of the Type Ia term of sigma_X and of R1a are given per DTD family (G: Gaussian, E: Exponential,
+	I: Inverse), relative to the maximum of the term. Those of sigma_X and psi are relative to their maximum, and
+	those of [Fe/H] are absolute (dex), for t>=0.1 and t>=1 Gyr (the relative error of sigma_X grows at early times,
+	where it is much smaller than its maximum).'''
+	record = {"precision":True, "loader":loader, "n_infalls":n_infalls, "n_nodes":n_nodes}
+	try:
+		chemdict = build_chemdict(loader, n_infalls)
+		t = np.linspace(0.01, today, n_nodes)
+		models = [ChemModel(chemdict, dtype=dtype) for dtype in (np.float64, np.float32)]
+		relative = lambda x32, x64: float(np.max(np.abs(x32-x64))/np.max(np.abs(x64))) if np.any(x64!=0) else None
+		bases = [model.linear_bases(t) for model in models]
+		rates = [model.r1a(t, separated_terms=True) for model in models]
+		for k, family in enumerate("GEI"):
+			record["sigma_%s"%family] = relative(bases[1][2+k], bases[0][2+k])
+			record["r1a_%s"%family] = relative(rates[1][k], rates[0][k])
+		sigma = [model.sigma(t) for model in models]
+		record["sigma"] = relative(sigma[1], sigma[0])
+		record["psi"] = relative(models[1].psi(t), models[0].psi(t))
+		with np.errstate(divide="ignore", invalid="ignore"):
+			error = np.abs(models[1].abundance(t, sigma[1]).astype(np.float64) - models[0].abundance(t, sigma[0]))
+		record["FeH_dex_t0.1"] = float(np.nanmax(error[t>=0.1]))
+		record["FeH_dex_t1"] = float(np.nanmax(error[t>=1.]))
+		times = []
+		for model in models:
+			start = time.perf_counter()
+			model.sigma(t)
+			times.append(time.perf_counter()-start)
+		record["speedup"] = times[0]/times[1]
+		record["status"] = "ok"
+	except Exception as error:
+		record["status"] = "error: %s: %s"%(type(error).__name__, error)
+	return( record )
+
+
+def erf_count_case(function, loader, n_infalls, n_nodes, dtype="float64"):
+	'''Number of calls to erf and erfc, and of evaluated elements, in one call of the function. Returns a dictionary
+	(one record of the output). The erf and erfc of CheapTools are replaced by counting wrappers while the function
+	runs (the scalar constants computed once per infall are also counted).'''
+	dtype = dtype if function in Dtype_aware else "float64"
+	record = {"erf_count":True, "function":function, "loader":loader, "n_infalls":n_infalls, "n_nodes":n_nodes, "dtype":dtype}
+	special = {"erf":CheapTools.erf, "erfc":CheapTools.erfc}
+	count = {"calls":0, "elements":0}
+	def _counting(name):
+		def wrapper(x, *args, **kwargs):
+			count["calls"] += 1
+			count["elements"] += np.size(x)
+			return( special[name](x, *args, **kwargs) )
+		return( wrapper )
+	try:
+		chemdict = build_chemdict(loader, n_infalls)
+		t = np.linspace(0.01, today, n_nodes)
+		work = Functions[function](t, chemdict, np.dtype(dtype))
+		for name in special: setattr(CheapTools, name, _counting(name))
+		try:
+			work()
+		finally:
+			for name in special: setattr(CheapTools, name, special[name])
+		record.update(count)
+		record["status"] = "ok"
+	except Exception as error:
+		record["status"] = "error: %s: %s"%(type(error).__name__, error)
+	return( record )
+
+
+def memory_case(kernel, loader, n_infalls, n_nodes):
+	'''Peak memory of one call of an analytic kernel. Returns a dictionary (one record of the output).
+	The peak is traced by tracemalloc (which includes the numpy buffers) in a call after an untraced one, and it is
+	also given in units of float64 arrays of the length of t ("arrays"). It does not include t nor the parameters.'''
+	record = {"memory":True, "kernel":kernel, "loader":loader, "n_infalls":n_infalls, "n_nodes":n_nodes}
+	try:
+		chemdict = build_chemdict(loader, n_infalls)
+		family, function = Kernels[kernel]
+		if len(chemdict.get(Family_keys[family][0], []))==0:
+			record["status"] = "skipped: no %s components"%Family_keys[family][0]
+			return( record )
+		t = np.linspace(0.01, today, n_nodes)
+		alpha = (1.+chemdict["omega"]-chemdict["R"])*chemdict["nuL"]
+		args = [t, alpha, chemdict["nuL"], chemdict["Aj"], chemdict["tauj"], chemdict["tj"], chemdict["sigma_gas_0"], chemdict["CIa"]]
+		args += [chemdict[key][0] for key in Family_keys[family]]
+		if kernel.startswith("SolveChemEvolModel_"): args.append(chemdict["mx1a"])
+		function(*args)
+		tracemalloc.start()
+		function(*args)
+		record["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		record["arrays"] = record["peak_memory_bytes"]/(8.*n_nodes)
+		record["status"] = "ok"
+	except Exception as error:
+		if tracemalloc.is_tracing(): tracemalloc.stop()
+		record["status"] = "error: %s: %s"%(type(error).__name__, error)
+	return( record )
+
+
+def metadata():
+	'''Information of the environment of the run'''
+	return( {"metadata":True, "date":time.strftime("%Y-%m-%dT%H:%M:%S"), "python":sys.version.split()[0], "numpy":np.__version__,
+			 "scipy":scipy.__version__, "platform":platform.platform(), "processor":platform.processor()} )
+
+
+def compare(records, baseline_file, threshold=1.2):
+	'''Prints the ratio of the wall times (new/baseline) of the cases in both runs, flagging those slower than threshold'''
+	key = lambda r: (r["function"], r["loader"], r["n_infalls"], r["n_nodes"], r.get("dtype", "float64"))
+	with open(baseline_file) as f:
+		baseline = [json.loads(line) for line in f if line.strip()]
+	baseline = {key(r):r for r in baseline if (not r.get("metadata")) and r.get("status")=="ok"}
+
+	print("\n%-26s %-9s %3s %8s %7s %10s %10s %7s"%("function", "loader", "Nj", "nodes", "dtype", "base [s]", "new [s]", "ratio"))
+	for r in records:
+		if (r["status"]!="ok") or (key(r) not in baseline): continue
+		ratio = r["wall_time_s"]/baseline[key(r)]["wall_time_s"]
+		flag = "  <-- slower" if ratio>threshold else ""
+		print("%-26s %-9s %3d %8d %7s %10.3e %10.3e %7.2f%s"%(*key(r), baseline[key(r)]["wall_time_s"], r["wall_time_s"], ratio, flag))
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark of the ChEAP analytic solver and its helpers")
+	parser.add_argument("--functions", nargs="+", default=list(Functions), choices=list(Functions))
+	parser.add_argument("--loaders", nargs="+", default=list(Loaders), choices=list(Loaders))
+	parser.add_argument("--infalls", nargs="+", type=int, default=[1, 3, 10], help="Numbers of infalls")
+	parser.add_argument("--nodes", nargs="+", type=float, default=[1e3, 1e4, 1e5, 1e6], help="Numbers of time nodes")
+	parser.add_argument("--max-nodes-numeric", type=float, default=1e5, help="Largest number of nodes for R1a_numeric and iR1a_analytic (slow)")
+	parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each case (the minimum time is reported)")
+	parser.add_argument("--no-memory", action="store_true", help="Do not measure the peak memory")
+	parser.add_argument("--quick", action="store_true", help="Small run: 1 and 3 infalls, 1e3 and 1e4 nodes, one repetition")
+	parser.add_argument("--output", default=None, help="Output file (JSON lines). By default, only the table is printed")
+	parser.add_argument("--compare", default=None, help="Previous output file to compare with")
+	parser.add_argument("--dtype", default="float64", choices=["float64", "float32"], help="Precision of %s"%", ".join(Dtype_aware))
+	parser.add_argument("--precision", action="store_true", help="Measure the errors of the float32 mode (per DTD family) instead of the timings")
+	parser.add_argument("--memory", action="store_true", help="Measure the peak memory of the analytic kernels (per DTD family) instead of the timings")
+	parser.add_argument("--erf-count", action="store_true", help="Count the calls to erf/erfc (and the evaluated elements) instead of the timings")
+	args = parser.parse_args(argv)
+	if args.quick: args.infalls, args.nodes, args.repeat = [1, 3], [1e3, 1e4], 1
+
+	if args.precision:
+		records = []
+		columns = ["sigma_G", "sigma_E", "sigma_I", "r1a_G", "r1a_E", "r1a_I", "sigma", "psi", "FeH_dex_t0.1", "FeH_dex_t1", "speedup"]
+		print("%-9s %3s %8s "%("loader", "Nj", "nodes") + " ".join("%12s"%name for name in columns) + "  status")
+		for loader in args.loaders:
+			for n_infalls in args.infalls:
+				for n_nodes in [int(n) for n in args.nodes]:
+					r = precision_case(loader, n_infalls, n_nodes)
+					records.append(r)
+					values = ["%12s"%"-" if r.get(name) is None else "%12.2e"%r[name] for name in columns]
+					print("%-9s %3d %8d "%(loader, n_infalls, n_nodes) + " ".join(values) + "  " + r["status"])
+		if args.output is not None:
+			with open(args.output, "w") as f:
+				for r in [metadata()]+records: f.write(json.dumps(r)+"\n")
+		return( records )
+
+	if args.memory:
+		records = []
+		print("%-36s %-9s %3s %8s %10s %8s  %s"%("kernel", "loader", "Nj", "nodes", "peak [MB]", "arrays", "status"))
+		for kernel in Kernels:
+			for loader in args.loaders:
+				for n_infalls in args.infalls:
+					for n_nodes in [int(n) for n in args.nodes]:
+						r = memory_case(kernel, loader, n_infalls, n_nodes)
+						records.append(r)
+						if r["status"]=="ok":
+							print("%-36s %-9s %3d %8d %10.2f %8.2f  %s"%(kernel, loader, n_infalls, n_nodes, r["peak_memory_bytes"]/2.**20, r["arrays"], r["status"]))
+						else:
+							print("%-36s %-9s %3d %8d %10s %8s  %s"%(kernel, loader, n_infalls, n_nodes, "-", "-", r["status"]))
+		if args.output is not None:
+			with open(args.output, "w") as f:
+				for r in [metadata()]+records: f.write(json.dumps(r)+"\n")
+		return( records )
+
+	if args.erf_count:
+		records = []
+		print("%-26s %-9s %3s %8s %7s %10s %12s  %s"%("function", "loader", "Nj", "nodes", "dtype", "calls", "elements", "status"))
+		for function in args.functions:
+			nodes = [1] if function in Node_independent else [int(n) for n in args.nodes]
+			if function in ["R1a_numeric", "iR1a_analytic"]: nodes = [n for n in nodes if n<=args.max_nodes_numeric]
+			for loader in args.loaders:
+				for n_infalls in args.infalls:
+					for n_nodes in nodes:
+						r = erf_count_case(function, loader, n_infalls, n_nodes, dtype=args.dtype)
+						records.append(r)
+						if r["status"]=="ok":
+							print("%-26s %-9s %3d %8d %7s %10d %12d  %s"%(function, loader, n_infalls, n_nodes, r["dtype"], r["calls"], r["elements"], r["status"]))
+						else:
+							print("%-26s %-9s %3d %8d %7s %10s %12s  %s"%(function, loader, n_infalls, n_nodes, r["dtype"], "-", "-", r["status"]))
+		if args.output is not None:
+			with open(args.output, "w") as f:
+				for r in [metadata()]+records: f.write(json.dumps(r)+"\n")
+		return( records )
+
+	slow = ["R1a_numeric", "iR1a_analytic"]
+	records = []
+	print("%-26s %-9s %3s %8s %10s %12s %10s  %s"%("function", "loader", "Nj", "nodes", "time [s]", "nodes/s", "peak [MB]", "status"))
+	for function in args.functions:
+		nodes = [1] if function in Node_independent else [int(n) for n in args.nodes]
+		if function in slow: nodes = [n for n in nodes if n<=args.max_nodes_numeric]
+		for loader in args.loaders:
+			for n_infalls in args.infalls:
+				for n_nodes in nodes:
+					r = run_case(function, loader, n_infalls, n_nodes, repeat=args.repeat, memory=not args.no_memory, dtype=args.dtype)
+					records.append(r)
+					if r["status"]=="ok":
+						peak = r["peak_memory_bytes"]/2.**20 if "peak_memory_bytes" in r else np.nan
+						print("%-26s %-9s %3d %8d %10.3e %12.3e %10.2f  %s"%(function, loader, n_infalls, n_nodes, r["wall_time_s"], r["nodes_per_s"], peak, r["status"]))
+					else:
+						print("%-26s %-9s %3d %8d %10s %12s %10s  %s"%(function, loader, n_infalls, n_nodes, "-", "-", "-", r["status"]))
+
+	if args.output is not None:
+		with open(args.output, "w") as f:
+			for r in [metadata()]+records: f.write(json.dumps(r)+"\n")
+	if args.compare is not None: compare(records, args.compare)
+	return( records )
+
+
+if __name__ == "__main__":
+	main()
@@ -1,21 +1,52 @@
+import os
+import io
+import contextlib
+import multiprocessing
 import numpy as np
-from scipy.special import erf, expi
+from scipy.special import erf, erfc, expi
+from scipy.signal import fftconvolve, lfilter
+from DualNumbers import Dual as _Dual # Forward-mode derivatives of the analytic kernels (see ChemModel.sigma_jacobian)
 
 # -----------------------------------------------
 #heaviside
 #_safelog10
 #_safelog
 #_safeexpi
+#_frozen_array
+#_erf_reference
+#_erf_difference
+#_float_array
+#_check_dtype
+#_betaj
+#_kernel_buffers
+#_shared_buffers
+#_is_sorted_1d
+#_unique_times
+#_time_windows
+#_sum_over_components
 #GaussWeightsAndNodes
+#GaussPanelWeightsAndNodes
+#AdaptiveGaussQuadrature
+#AdaptiveChebyshevFit
+#ChebyshevEvaluate
 #FromSigmaToAbundance
+#_GaussianTermConstants
+#_ExponentialTermConstants
+#_InverseTermConstants
 # -----------------------------------------------
 #Get_psi
 #Get_ipsi
+#Get_stellar_mass
+#Get_returned_mass
+#Get_gas_fraction
 #Get_DTD
 #Get_DTD_arr
 #Get_infall
 # -----------------------------------------------
+#_DTD_breakpoints
 #R1a_numeric
+#R1a_FFT
+#_R1a_FFT_grid
 #R1a_analytic_gaussian
 #R1a_analytic_exponential
 #R1a_analytic_inverse
@@ -27,12 +58,57 @@ from scipy.special import erf, expi
 #SolveChemEvolModel_ExponentialTerm
 #SolveChemEvolModel_InverseTerm
 #SolveChemEvolModel_InhomogeneousTrivialTerm
+#SolveChemEvolModel_Bases
+#SolveChemEvolModel_LinearBases
+#SolveChemEvolModel_FromLinearBases
 #SolveChemEvolModel
+#SolveChemEvolModel_Blocks
+#SolveChemEvolModel_Streaming
+#SolveChemEvolModel_Rate
+#SolveChemEvolModel_Unique
+#SolveChemEvolModel_numeric
+#SolveChemEvolModel_FFT
+#SolveChemEvolModel_MultiElement
+#SolveChemEvolModel_Batch
+#_SolveChemEvolModel_Batch
+#_batch_regular_bases
+#_batch_bases
+#Get_psi_Batch
+#FromSigmaToAbundance_Batch
+#SolveChemEvolModel_Grid
+#_grid_initializer
+#_grid_chunk
 # -----------------------------------------------
 #ChemicalSolutionVerifier
+#Fuzz_ChemicalSolutions
+#_fuzz_chemdict
+#_fuzz_chunk
 # -----------------------------------------------
+#ChemModel
+#ChemDenseOutput
+# -----------------------------------------------
+#Get_MDF
+#Get_MDF_2D
+#_mdf_abundances
+#_mdf_sampling
+#_mdf_histogram
+# -----------------------------------------------
+#Get_time_at_abundance
+#_abundance_breakpoints
+#_abundance_and_rate
+# -----------------------------------------------
+#Get_loglikelihood
+#Get_loglikelihood_Batch
+#_stellar_loglikelihood
+#_parse_ratios
+# -----------------------------------------------
+#Element_yields
 #add_element
+#_linear_coefficients
 #prepare_chemdict
+#_prepare_batchdict
+#_batch_subset
+#_batch_row_chemdict
 #QD
 #PD
 #SD
@@ -94,47 +170,459 @@ def _safelog(num, den):
 # ---------------------------------
 
 # _safeexpi--------------------------------------------
-def _safeexpi(x): return( (x>0)*expi(x + 1.*(x<=0)) );# Avoid the divergence when expi(0)
+def _safeexpi(x, out=None, mask=None):
+	'''expi(x) for x>0, and zero otherwise (the argument is set to 1 where x<=0, which avoids the divergence at expi(0)).
+	With out (and the boolean scratch array mask), it is evaluated in place: out may be x itself.'''
+	if out is None: return( (x>0)*expi(x*(x>0) + 1.*(x<=0)) )
+	np.greater(x, 0., out=mask)
+	np.multiply(x, mask, out=out)
+	np.logical_not(mask, out=mask)
+	out += mask
+	expi(out, out=out)
+	np.logical_not(mask, out=mask)
+	out *= mask
+	return(out)
+# -----------------------------------------------------
+
+# _frozen_array--------------------------------------------
+def _frozen_array(x):
+	'''Read-only contiguous float64 copy of x'''
+	x = np.array(x, dtype=np.float64)
+	x.setflags(write=False)
+	return(x)
+# -----------------------------------------------------
+
+# _erf_reference--------------------------------------------
+def _erf_reference(z_ref):
+	'''Sign and erfc(|z_ref|) of a constant argument, stacked along the first axis (see _erf_difference)'''
+	return( np.stack([np.where(z_ref>=0, 1., -1.), erfc(np.abs(z_ref))]) )
+# -----------------------------------------------------
+
+# _erf_difference--------------------------------------------
+def _erf_difference(z, reference, out=None):
+	'''erf(z)-erf(z_ref), with reference=_erf_reference(z_ref).
+	Evaluated as sign*(erfc(|z_ref|)-erfc(sign*z)) with the sign of z_ref, so there is no cancellation
+	when both arguments are large and have the same sign (erf close to +-1). Only one special function
+	is evaluated per call. With out, it is evaluated in place (out may be z itself).'''
+	sign_ref, erfc_ref = reference
+	if out is None: return( sign_ref*(erfc_ref-erfc(sign_ref*z)) )
+	np.multiply(sign_ref, z, out=out)
+	erfc(out, out=out)
+	np.subtract(erfc_ref, out, out=out)
+	out *= sign_ref
+	return(out)
+# -----------------------------------------------------
+
+# _float_array--------------------------------------------
+def _float_array(x):
+	'''float64 array of x (or x itself, if it carries derivatives: see _Dual)'''
+	return( x if isinstance(x, _Dual) else np.asarray(x, dtype=np.float64) )
+# -----------------------------------------------------
+
+# _check_dtype--------------------------------------------
+def _check_dtype(dtype):
+	'''np.dtype of the precision policy: np.float64 (default, reference mode) or np.float32 (throughput mode).
+	The analytic kernels compute in the dtype of their inputs (see _kernel_buffers), so the functions with a dtype
+	argument only cast the times and the parameters. The time-independent constants are always computed in float64'''
+	dtype = np.dtype(dtype)
+	if dtype not in (np.float32, np.float64): raise ValueError("ERROR: dtype must be np.float32 or np.float64")
+	return(dtype)
+# -----------------------------------------------------
+
+# _betaj--------------------------------------------
+def _betaj(alpha, tauj):
+	'''alpha-1/tauj of the infalls. The values at the round-off level (e.g. tauj=1/alpha computed in floating point)
+	are set to exactly zero, so all the functions use the special case alpha==1/tauj for them'''
+	betaj = alpha - 1./tauj
+	return( np.where(np.abs(betaj)<=4.*np.finfo(np.float64).eps*np.abs(alpha), 0., betaj) )
+# -----------------------------------------------------
+
+# _kernel_buffers--------------------------------------------
+def _kernel_buffers(n_scratch, *arrays, scratch_only=False):
+	'''Buffers of the analytic kernels, with the broadcast shape of the arrays (times and parameters):
+	(accumulator, scratch, masks) = _kernel_buffers(n_scratch, t, alpha, ...)
+	accumulator: zeros. scratch: n_scratch arrays. masks: two boolean arrays.
+	The scratch arrays (and the masks) are views of a single allocation, so a kernel allocates
+	a fixed number of arrays whatever the number of infalls and terms.
+	Their dtype is float32 only if all the arrays are float32 (Python scalars do not count), and float64 otherwise.
+	If some of the arrays carry derivatives (see _Dual), the accumulator and the scratch arrays carry them too.
+	scratch_only: only the scratch arrays are allocated and returned.'''
+	shape = np.broadcast_shapes(*[np.shape(x) for x in arrays])
+	n_tangents = [len(x.der) for x in arrays if isinstance(x, _Dual)]
+	if n_tangents:
+		scratch = _Dual.empty((n_scratch,)+shape, n_tangents[0])
+		if scratch_only: return(scratch)
+		return( _Dual.zeros(shape, n_tangents[0]), scratch, np.empty((2,)+shape, dtype=bool) )
+	dtype = np.result_type(np.float32, *arrays)
+	scratch = np.empty((n_scratch,)+shape, dtype=dtype)
+	if scratch_only: return(scratch)
+	return( np.zeros(shape, dtype=dtype), scratch, np.empty((2,)+shape, dtype=bool) )
+# -----------------------------------------------------
+
+# _shared_buffers--------------------------------------------
+def _shared_buffers(n_scratch, t, alpha, *infall_args):
+	'''Scratch arrays of the factors that do not depend on the DTD components, e.g. exp(-alpha*deltatj):
+	shared = _shared_buffers(n_scratch, t, alpha, Aj[0], tauj[0], tj[0])
+	Their shape is the broadcast of the times, alpha and the infall parameters (without the DTD parameters),
+	so these factors are evaluated once per infall and broadcast over the (n_components, n_times) arrays.
+	A recurrence for the exponentials on uniform time grids (exp at anchors times a table of exp(rate*h*i)) was tried
+	and not kept: it was never faster than the vectorised np.exp, which is only a small part of the cost of a solve.'''
+	return( _kernel_buffers(n_scratch, t, alpha, *infall_args, scratch_only=True) )
+# -----------------------------------------------------
+
+# _is_sorted_1d--------------------------------------------
+def _is_sorted_1d(t):
+	'''True if t is a 1D array sorted in increasing order'''
+	return( (np.ndim(t)==1) and bool(np.all(t[1:]>=t[:-1])) )
+# -----------------------------------------------------
+
+# _unique_times--------------------------------------------
+def _unique_times(t, tolerance=0.):
+	'''Sorted distinct values of the times and the inverse index:
+	(t_unique, inverse) = _unique_times(t, tolerance=0.), with t.ravel() ~ t_unique[inverse]
+
+	tolerance: if positive, the times are first rounded to multiples of tolerance (an error of tolerance/2 at most),
+	    so the near-duplicated times (e.g. ages in bins) are also merged.'''
+	t = np.asarray(t, dtype=np.float64).ravel()
+	if tolerance>0: t = np.round(t/tolerance)*tolerance
+	return( np.unique(t, return_inverse=True) )
+# -----------------------------------------------------
+
+# _time_windows--------------------------------------------
+def _time_windows(t, lower, upper, restrict=True):
+	'''Index ranges (along the time axis) of the piecewise terms of the analytic kernels:
+	(active, window, tail) = _time_windows(t, lower, upper, restrict=_is_sorted_1d(t))
+
+	lower, upper: times (one per row of the broadcast, e.g. tj+tau1 and tj+tau2) where the term switches on,
+	    and where its integration limit reaches tau2 (mint2=tau2).
+	active: times t>min(lower), to be applied to the full arrays. The term vanishes before them in all the rows.
+	window, tail: split of the active times (indices relative to the active slice) at t=max(upper). In the tail,
+	    mint2=tau2 in all the rows, so the special functions of mint2 are time-independent constants.
+	The limits are found with searchsorted on the sorted times, with a conservative (relative) margin of 1e-12.
+	Without restriction (e.g. unsorted times), active=window=(...,) and tail=None.'''
+	if not restrict: return( (Ellipsis,), (Ellipsis,), None )
+	margin = 1e-12*(1. + np.max(np.abs(upper)))
+	start = int(np.searchsorted(t, np.min(lower)-margin, side="right"))
+	stop = max(start, int(np.searchsorted(t, np.max(upper)+margin, side="left")))
+	return( (Ellipsis, slice(start, None)), (Ellipsis, slice(0, stop-start)), (Ellipsis, slice(stop-start, None)) )
+# -----------------------------------------------------
+
+# _sum_over_components--------------------------------------------
+def _sum_over_components(function, t, n_components, max_elements=2**16):
+	'''Sum over the DTD components of function(t_block), which returns an array with shape
+	(n_components, len(t_block)) for a 1D block of times. t is flattened and evaluated in blocks
+	of max_elements/n_components values, so the peak memory does not depend on len(t).
+	The output has the shape of t (and its dtype, if t is float32; float64 otherwise).'''
+	t = np.asarray(t)
+	t = np.asarray(t, dtype=np.result_type(np.float32, t.dtype))
+	t_flat = t.ravel()
+	output = np.zeros(t_flat.shape, dtype=t.dtype)
+	if n_components==0: return(output.reshape(t.shape))
+	block = max(1, max_elements//n_components)
+	for start in range(0, len(t_flat), block):
+		output[start:start+block] = function(t_flat[start:start+block]).sum(0)
+	return(output.reshape(t.shape))
 # -----------------------------------------------------
 
 
 # GaussWeightsAndNodes---------------------------------------------------------------------
+_Gauss_rules = dict() # Cache of the Gauss-Legendre rules already computed
+
 def GaussWeightsAndNodes(order=64):
-	''' Return the weights and nodes for the Gaussian Quadrature method
-	weights, nodes = GaussWeightsAndNodes(order=100)'''
-	if order==20:
-		Gauss_nodes = [-0.148874338981631, 0.148874338981631, -0.433395394129247, 0.433395394129247, -0.679409568299024, 0.679409568299024, -0.865063366688985, 0.865063366688985, -0.973906528517172, 0.973906528517172]
-		weights = [0.295524224714753, 0.295524224714753, 0.269266719309996, 0.269266719309996, 0.219086362515982, 0.219086362515982, 0.149451349150581, 0.149451349150581, 0.066671344308688, 0.066671344308688]
-
-	elif order==40:
-		weights = [0.0775059479784248,0.0775059479784248,0.077039818164248,0.077039818164248,0.0761103619006262,0.0761103619006262,0.0747231690579683,0.0747231690579683,0.0728865823958041,0.0728865823958041,0.0706116473912868,0.0706116473912868,0.0679120458152339,0.0679120458152339,0.064804013456601,0.064804013456601,0.0613062424929289,0.0613062424929289,0.0574397690993916,0.0574397690993916,0.0532278469839368,0.0532278469839368,0.0486958076350722,0.0486958076350722,0.0438709081856733,0.0438709081856733,0.038782167974472,0.038782167974472,0.0334601952825478,0.0334601952825478,0.0279370069800234,0.0279370069800234,0.022245849194167,0.022245849194167,0.0164210583819079,0.0164210583819079,0.0104982845311528,0.0104982845311528,0.0045212770985332,0.0045212770985332]
-		Gauss_nodes = [-0.0387724175060508,0.0387724175060508,-0.1160840706752552,0.1160840706752552,-0.1926975807013711,0.1926975807013711,-0.2681521850072537,0.2681521850072537,-0.3419940908257585,0.3419940908257585,-0.413779204371605,0.413779204371605,-0.4830758016861787,0.4830758016861787,-0.5494671250951282,0.5494671250951282,-0.6125538896679802,0.6125538896679802,-0.6719566846141796,0.6719566846141796,-0.7273182551899271,0.7273182551899271,-0.7783056514265194,0.7783056514265194,-0.8246122308333117,0.8246122308333117,-0.8659595032122595,0.8659595032122595,-0.9020988069688743,0.9020988069688743,-0.9328128082786765,0.9328128082786765,-0.9579168192137917,0.9579168192137917,-0.9772599499837743,0.9772599499837743,-0.990726238699457,0.990726238699457,-0.9982377097105593,0.9982377097105593]		
-		
-	elif order==100:
-		Gauss_nodes = [-0.0243502926634244, 0.0243502926634244, -0.072993121787799, 0.072993121787799, -0.1214628192961206, 0.1214628192961206, -0.1696444204239928, 0.1696444204239928, -0.2174236437400071, 0.2174236437400071, -0.2646871622087674, 0.2646871622087674, -0.311322871990211, 0.311322871990211, -0.3572201583376681, 0.3572201583376681, -0.4022701579639916, 0.4022701579639916, -0.4463660172534641, 0.4463660172534641, -0.489403145707053, 0.489403145707053, -0.5312794640198946, 0.5312794640198946, -0.571895646202634, 0.571895646202634, -0.6111553551723933, 0.6111553551723933, -0.6489654712546573, 0.6489654712546573, -0.6852363130542333, 0.6852363130542333, -0.7198818501716109, 0.7198818501716109, -0.7528199072605319, 0.7528199072605319, -0.7839723589433414, 0.7839723589433414, -0.8132653151227975, 0.8132653151227975, -0.8406292962525803, 0.8406292962525803, -0.8659993981540928, 0.8659993981540928, -0.8893154459951141, 0.8893154459951141, -0.9105221370785028, 0.9105221370785028, -0.9295691721319396, 0.9295691721319396, -0.9464113748584028, 0.9464113748584028, -0.9610087996520538, 0.9610087996520538, -0.973326827789911, 0.973326827789911, -0.983336253884626, 0.983336253884626, -0.9910133714767443, 0.9910133714767443, -0.9963401167719553, 0.9963401167719553, -0.9993050417357722, 0.9993050417357722]
+	''' Return the weights and nodes for the Gaussian Quadrature method in [-1, 1]
+	weights, nodes = GaussWeightsAndNodes(order=64)
+	Any order is supported. Each rule is computed once and cached, so the output arrays are read-only.'''
+	order = int(order)
+	assert(order>0), "ERROR: the order must be positive"
+	if not (order in _Gauss_rules.keys()):
+		Gauss_nodes, weights = np.polynomial.legendre.leggauss(order)
+		_Gauss_rules[order] = (_frozen_array(weights), _frozen_array(Gauss_nodes))
+	return(_Gauss_rules[order])
+# ---------------------------------------------------------------------------------
+
+
+# GaussPanelWeightsAndNodes---------------------------------------------------------------------
+def GaussPanelWeightsAndNodes(a, b, breakpoints=[], order=20):
+	''' Return the weights and nodes of the composite Gaussian Quadrature in [a, b]
+	weights, nodes = GaussPanelWeightsAndNodes(a, b, breakpoints=[], order=20)
+
+	The interval is split at the breakpoints inside [a, b] (those outside are ignored) and a
+	Gauss rule of the given order is used in each panel, so discontinuities of the integrand
+	at the breakpoints do not spoil the convergence.
+	a, b: lower and upper limits (floats or arrays with the same shape)
+	breakpoints: 1D array, or array with shape a.shape + (n_breakpoints,)
+	returns: weights, nodes with shape a.shape + ((n_breakpoints+1)*order,)'''
+	weights, Gauss_nodes = GaussWeightsAndNodes(order)
+	a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+	breakpoints = np.asarray(breakpoints, dtype=np.float64)
+	breakpoints = np.broadcast_to(breakpoints, a.shape + breakpoints.shape[-1:])
+
+	# Edges of the panels (empty panels have zero weight):
+	edges = np.concatenate([a[...,None], np.clip(breakpoints, a[...,None], b[...,None]), b[...,None]], axis=-1)
+	edges = np.sort(edges, axis=-1)
+	half_width = 0.5*np.diff(edges, axis=-1)[...,None]
+	centre = 0.5*(edges[...,1:]+edges[...,:-1])[...,None]
+
+	# Nodes and weights of each panel:
+	panel_nodes = centre + half_width*Gauss_nodes
+	panel_weights = half_width*weights
+	return(panel_weights.reshape(a.shape+(-1,)), panel_nodes.reshape(a.shape+(-1,)))
+# ---------------------------------------------------------------------------------
 
-		weights = [0.0486909570091397, 0.0486909570091397, 0.0485754674415034, 0.0485754674415034, 0.048344762234803, 0.048344762234803, 0.0479993885964583, 0.0479993885964583, 0.0475401657148303, 0.0475401657148303, 0.04696818281621, 0.04696818281621, 0.0462847965813144, 0.0462847965813144, 0.0454916279274181, 0.0454916279274181, 0.0445905581637566, 0.0445905581637566, 0.0435837245293235, 0.0435837245293235, 0.0424735151236536, 0.0424735151236536, 0.0412625632426235, 0.0412625632426235, 0.0399537411327203, 0.0399537411327203, 0.0385501531786156, 0.0385501531786156, 0.03705512854024, 0.03705512854024, 0.0354722132568824, 0.0354722132568824, 0.0338051618371416, 0.0338051618371416, 0.0320579283548516, 0.0320579283548516, 0.0302346570724025, 0.0302346570724025, 0.0283396726142595, 0.0283396726142595, 0.0263774697150547, 0.0263774697150547, 0.0243527025687109, 0.0243527025687109, 0.0222701738083833, 0.0222701738083833, 0.0201348231535302, 0.0201348231535302, 0.0179517157756973, 0.0179517157756973, 0.0157260304760247, 0.0157260304760247, 0.0134630478967186, 0.0134630478967186, 0.0111681394601311, 0.0111681394601311, 0.0088467598263639, 0.0088467598263639, 0.0065044579689784, 0.0065044579689784, 0.0041470332605625, 0.0041470332605625, 0.0017832807216964, 0.0017832807216964]
-	
-	else:
 
-		Gauss_nodes = [-0.99971372677344123367822847, -0.99849195063959581840016336, -0.99629513473312514918613173, -0.99312493703744345965200989, -0.98898439524299174800441875, -0.98387754070605701549610016, -0.97780935848691828855378109, -0.97078577576370633193089786, -0.96281365425581552729365933, -0.95390078292549174284933693, -0.94405587013625597796277471, -0.93328853504307954592433367, -0.92160929814533395266695133, -0.90902957098252969046712634, -0.89556164497072698669852102, -0.88121867938501841557331683, -0.86601468849716462341074, -0.84996452787959128429336259, -0.83308387988840082354291583, -0.8153892383391762543939888, -0.7968978923903144763895729, -0.7776279096494954756275514, -0.757598118519707176035668, -0.73682808980202070551242772, -0.71533811757305644645996712, -0.69314919935580196594864794, -0.67028301560314101580258701, -0.6467619085141292798326303, -0.62260886020370777160419085, -0.59784747024717872126480655, -0.57250193262138119131687044, -0.54659701206509416746799426, -0.52015801988176305664681575, -0.4932107892081909335693088, -0.4657816497733580422492166, -0.43789740217203151310897804, -0.4095852916783015425288684, -0.3808729816246299567633625, -0.35178852637242172097234383, -0.32236034390052915172247658, -0.2926171880384719647375559, -0.26258812037150347916892934, -0.23230248184497396964950996, -0.20178986409573599723604886, -0.17108008053860327488753238, -0.14020313723611397320751461, -0.10918920358006111500342601, -0.07806858281343663669481737, -0.046871682421591631614923913, -0.0156289844215430828722167, 0.0156289844215430828722167, 0.04687168242159163161492391, 0.07806858281343663669481737, 0.10918920358006111500342601, 0.14020313723611397320751461, 0.17108008053860327488753238, 0.20178986409573599723604886, 0.23230248184497396964950996, 0.2625881203715034791689293, 0.29261718803847196473755589, 0.3223603439005291517224766, 0.35178852637242172097234383, 0.38087298162462995676336255, 0.4095852916783015425288684, 0.437897402172031513108978, 0.4657816497733580422492166, 0.4932107892081909335693088, 0.52015801988176305664681575, 0.54659701206509416746799426, 0.57250193262138119131687044, 0.59784747024717872126480655, 0.62260886020370777160419085, 0.6467619085141292798326303, 0.67028301560314101580258701, 0.69314919935580196594864794, 0.71533811757305644645996712, 0.73682808980202070551242772, 0.75759811851970717603566796, 0.77762790964949547562755139, 0.79689789239031447638957288, 0.81538923833917625439398876, 0.83308387988840082354291583, 0.84996452787959128429336259, 0.86601468849716462341073997, 0.88121867938501841557331683, 0.89556164497072698669852102, 0.90902957098252969046712634, 0.92160929814533395266695133, 0.93328853504307954592433367, 0.94405587013625597796277471, 0.95390078292549174284933693, 0.96281365425581552729365933, 0.97078577576370633193089786, 0.97780935848691828855378109, 0.98387754070605701549610016, 0.98898439524299174800441875, 0.99312493703744345965200989, 0.99629513473312514918613173, 0.99849195063959581840016336, 0.99971372677344123367822847]
-		weights = [7.3463449050567173040632E-4, 0.0017093926535181052395294, 0.0026839253715534824194396, 0.00365596120132637518234246, 0.004624450063422119351095789, 0.00558842800386551515721195, 0.0065469484508453227641521, 0.00749907325546471157882874, 0.00844387146966897140262083, 0.00938041965369445795141824, 0.0103078025748689695857821, 0.01122511402318597711722157, 0.0121314576629794974077448, 0.01302594789297154228555858, 0.01390771070371877268795415, 0.01477588452744130176887999, 0.01562962107754600272393687, 0.01646808617614521264310498, 0.0172904605683235824393442, 0.0180959407221281166643908, 0.01888373961337490455294117, 0.01965308749443530586538147, 0.02040323264620943276683885, 0.0211334421125276415426723, 0.02184300241624738631395374, 0.022531220256336272701796971, 0.02319742318525412162248885, 0.0238409602659682059625604, 0.024461202707957052719975, 0.0250575444815795897037642, 0.02562940291020811607564201, 0.02617621923954567634230874, 0.02669745918357096266038466, 0.02719261344657688013649157, 0.02766119822079238829420416, 0.02810275565910117331764833, 0.02851685432239509799093676, 0.0289030896011252031348762, 0.02926108411063827662011902, 0.02959048805991264251175451, 0.02989097959333283091683681, 0.0301622651051691449190687, 0.03040407952645482001650786, 0.03061618658398044849645944, 0.0307983790311525904277139, 0.0309504788504909882340635, 0.03107233742756651658781017, 0.03116383569620990678381832, 0.0312248842548493577323765, 0.0312554234538633569476425, 0.03125542345386335694764247, 0.0312248842548493577323765, 0.0311638356962099067838183, 0.03107233742756651658781017, 0.0309504788504909882340635, 0.0307983790311525904277139, 0.03061618658398044849645944, 0.03040407952645482001650786, 0.03016226510516914491906868, 0.02989097959333283091683681, 0.0295904880599126425117545, 0.029261084110638276620119, 0.02890308960112520313487623, 0.0285168543223950979909368, 0.0281027556591011733176483, 0.0276611982207923882942042, 0.0271926134465768801364916, 0.02669745918357096266038466, 0.02617621923954567634230874, 0.025629402910208116075642, 0.0250575444815795897037642, 0.024461202707957052719975, 0.02384096026596820596256041, 0.0231974231852541216224889, 0.022531220256336272701797, 0.0218430024162473863139537, 0.0211334421125276415426723, 0.0204032326462094327668389, 0.0196530874944353058653815, 0.0188837396133749045529412, 0.01809594072212811666439075, 0.0172904605683235824393442, 0.01646808617614521264310498, 0.01562962107754600272393687, 0.01477588452744130176888, 0.013907710703718772687954149, 0.0130259478929715422855586, 0.0121314576629794974077448, 0.01122511402318597711722157, 0.0103078025748689695857821, 0.00938041965369445795141824, 0.0084438714696689714026208, 0.00749907325546471157882874, 0.0065469484508453227641521, 0.00558842800386551515721195, 0.00462445006342211935109579, 0.003655961201326375182342459, 0.00268392537155348241943959, 0.001709392653518105239529358, 7.34634490505671730406321E-4]
+# AdaptiveGaussQuadrature---------------------------------------------------------------------
+def AdaptiveGaussQuadrature(f, a, b, breakpoints=[], rtol=1e-10, atol=0., order=10, max_iter=60, max_panels=100000):
+	''' Adaptive Gaussian Quadrature of several integrals at once
+	integral, error, n_evals = AdaptiveGaussQuadrature(f, a, b, breakpoints=[], rtol=1e-10, atol=0., order=10)
+
+	f(rows, x): integrand of the integrals given by the integer array rows (shape (n,)) evaluated
+	at the nodes x (shape (n, order)). It must return an array with the shape of x.
+	a, b: 1D arrays with the lower and upper limits of each integral
+	breakpoints: known kinks/discontinuities of the integrand. 1D array, or array with shape (len(a), n_breakpoints)
+	The interval is split at the breakpoints and every panel is bisected until the difference between
+	the Gauss rule on the panel and on its two halves is below max(atol, rtol*|integral|) times the
+	relative width of the panel. The halves of a rejected panel are reused as the coarse estimates of
+	its children, so each iteration only evaluates f on the bisected panels.
+	A panel is also accepted when the bisection does not reduce the error estimate of its parent and this
+	error is below 100*rtol*|panel integral| (the integrand is noisy at that level), and all the panels are
+	accepted if more than max_panels are active.
+	returns: integral, error (estimated absolute error) and n_evals (total number of evaluations of the integrand)'''
+	weights, Gauss_nodes = GaussWeightsAndNodes(order)
+	a = np.atleast_1d(np.asarray(a, dtype=np.float64))
+	b = np.broadcast_to(np.asarray(b, dtype=np.float64), a.shape)
+	assert(a.ndim==1), "ERROR: a and b must be 1D arrays"
+	assert(np.all(b>=a)), "ERROR: the upper limits must be greater or equal than the lower limits"
+	Nint = len(a)
+
+	# Gauss rule in each of the panels [lo, hi] (one evaluation of f for all of them):
+	def _gauss(rows, lo, hi):
+		half_width = 0.5*(hi-lo)
+		x = 0.5*(hi+lo)[:,None] + half_width[:,None]*Gauss_nodes
+		return( half_width*np.dot(f(rows, x), weights) )
+
+	# Initial panels, given by the breakpoints inside each interval:
+	breakpoints = np.asarray(breakpoints, dtype=np.float64)
+	breakpoints = np.broadcast_to(breakpoints, (Nint,) + breakpoints.shape[-1:])
+	edges = np.sort(np.concatenate([a[:,None], np.clip(breakpoints, a[:,None], b[:,None]), b[:,None]], axis=1), axis=1)
+	rows = np.repeat(np.arange(Nint), edges.shape[1]-1)
+	lo, hi = edges[:,:-1].ravel(), edges[:,1:].ravel()
+	nonempty = hi>lo
+	rows, lo, hi = rows[nonempty], lo[nonempty], hi[nonempty]
+
+	coarse = _gauss(rows, lo, hi)
+	n_evals = len(rows)*order
+	width = b-a
+	integral = np.zeros(Nint)
+	error = np.zeros(Nint)
+	estimate = np.bincount(rows, coarse, minlength=Nint) # Current estimate of each integral
+	parent_err = np.full(len(rows), np.inf)
+
+	for iteration in range(max_iter):
+		if len(rows)==0: break
+		# Gauss rule on both halves of every active panel:
+		mid = 0.5*(lo+hi)
+		halves = _gauss(np.concatenate([rows, rows]), np.concatenate([lo, mid]), np.concatenate([mid, hi]))
+		n_evals += len(halves)*order
+		left, right = halves[:len(rows)], halves[len(rows):]
+		fine = left+right
+		err = np.abs(fine-coarse)
+
+		# Accept the panels below their share of the tolerance (or at the round-off level):
+		local_tol = np.maximum(atol, rtol*np.abs(estimate[rows]))*(hi-lo)/width[rows]
+		done = (err<=local_tol) | (err<=64*np.finfo(np.float64).eps*np.abs(fine)) | ((err>=parent_err) & (err<=100.*rtol*np.abs(fine)))
+		if (iteration==max_iter-1) or (2*np.count_nonzero(~done)>max_panels): done[:] = True
+		integral += np.bincount(rows[done], fine[done], minlength=Nint)
+		error += np.bincount(rows[done], err[done], minlength=Nint)
+
+		# Bisect the rejected panels:
+		todo = ~done
+		estimate = integral + np.bincount(rows[todo], fine[todo], minlength=Nint)
+		rows = np.concatenate([rows[todo], rows[todo]])
+		lo, hi = np.concatenate([lo[todo], mid[todo]]), np.concatenate([mid[todo], hi[todo]])
+		coarse = np.concatenate([left[todo], right[todo]])
+		parent_err = np.concatenate([err[todo], err[todo]])
+
+	return(integral, error, n_evals)
+# ---------------------------------------------------------------------------------
+
+
+# AdaptiveChebyshevFit---------------------------------------------------------------------
+_Chebyshev_rules = dict() # Cache of the Chebyshev rules already computed
+
+def _chebyshev_rule(order):
+	'''Chebyshev nodes of the first kind in [-1, 1] (in increasing order) and the matrix that maps the values at the
+	nodes to the Chebyshev coefficients: coefficients = np.dot(transform, values). Each rule is computed once and cached.'''
+	order = int(order)
+	assert(order>2), "ERROR: the order must be greater than 2"
+	if not (order in _Chebyshev_rules.keys()):
+		theta = np.pi*(np.arange(order)[::-1]+0.5)/order
+		transform = 2./order*np.cos(np.arange(order)[:,None]*theta[None,:])
+		transform[0] *= 0.5
+		_Chebyshev_rules[order] = (_frozen_array(np.cos(theta)), _frozen_array(transform))
+	return(_Chebyshev_rules[order])
+
+def AdaptiveChebyshevFit(f, a, b, breakpoints=[], rtol=1e-10, atol=0., order=24, max_iter=60, max_panels=100000):
+	''' Adaptive piecewise Chebyshev interpolation of several functions at once in [a, b]
+	edges, coefficients, error, n_evals = AdaptiveChebyshevFit(f, a, b, breakpoints=[], rtol=1e-10, atol=0., order=24)
+
+	f(x): functions evaluated at the increasing 1D array x. It must return an array with shape (n_functions, len(x)).
+	breakpoints: known kinks/discontinuities of the functions (1D array). Those outside (a, b) are ignored.
+	The interval is split at the breakpoints and every panel is bisected until the last two Chebyshev coefficients
+	of all the functions are below max(atol, rtol*max|f|), with max|f| on the panel (a relative error on each panel).
+	f is evaluated at the Chebyshev nodes of the first kind (never at the edges of the panels), with one call
+	per iteration for all the active panels.
+	A panel is also accepted when the bisection reduces the error estimate of its parent less than 4 times and it is
+	below sqrt(eps)*max|f| (the functions are noisy at that level), when it is not finite, or when the panel is
+	narrower than sqrt(eps)*(b-a). All the panels are accepted if more than max_panels are active. Unlike in AdaptiveGaussQuadrature, larger errors that do not decrease are
+	bisected again, since a narrow feature (e.g. a peak) can leave the error of a panel unchanged for several bisections.
+	returns: edges (shape (n_panels+1,)), coefficients (shape (n_functions, order, n_panels)),
+	    error (estimated maximum absolute error of each function) and n_evals (number of times evaluated). See ChebyshevEvaluate'''
+	nodes, transform = _chebyshev_rule(order)
+	a, b = float(a), float(b)
+	assert(b>a), "ERROR: b must be greater than a"
+	breakpoints = np.asarray(breakpoints, dtype=np.float64).ravel()
+	edges = np.unique(np.concatenate([[a], breakpoints[(breakpoints>a) & (breakpoints<b)], [b]]))
+	lo, hi = edges[:-1], edges[1:]
+	min_width = np.sqrt(np.finfo(np.float64).eps)*(b-a)
+	parent_err = np.inf
+	n_evals = 0
+	accepted = [] # (lo, coefficients, error) of the accepted panels
+
+	for iteration in range(max_iter):
+		if len(lo)==0: break
+		# Values and coefficients of all the active panels (the nodes are increasing, since the panels are sorted):
+		x = 0.5*(hi+lo)[:,None] + 0.5*(hi-lo)[:,None]*nodes
+		values = np.asarray(f(x.ravel()), dtype=np.float64).reshape(-1, len(lo), order)
+		n_evals += x.size
+		coefficients = np.einsum("jk,fpk->fjp", transform, values)
+		err = np.abs(coefficients[:,-1]) + np.abs(coefficients[:,-2])
+
+		# Accept the panels below the tolerance of all the functions (or at the noise level):
+		scale = np.max(np.abs(values), axis=-1)
+		noisy = (err>=0.25*parent_err) & (err<=np.sqrt(np.finfo(np.float64).eps)*scale)
+		converged = (err<=np.maximum(atol, rtol*scale)) | noisy | ~np.isfinite(err)
+		done = np.all(converged, axis=0) | (hi-lo<=min_width)
+		if (iteration==max_iter-1) or (2*np.count_nonzero(~done)>max_panels): done[:] = True
+		accepted.append( (lo[done], coefficients[...,done], err[:,done]) )
+
+		# Bisect the rejected panels:
+		todo = ~done
+		mid = 0.5*(lo+hi)
+		lo, hi = np.concatenate([lo[todo], mid[todo]]), np.concatenate([mid[todo], hi[todo]])
+		parent_err = np.concatenate([err[:,todo], err[:,todo]], axis=1)
+
+	# Sort the panels:
+	lo = np.concatenate([panel[0] for panel in accepted])
+	coefficients = np.concatenate([panel[1] for panel in accepted], axis=-1)
+	err = np.concatenate([panel[2] for panel in accepted], axis=-1)
+	index = np.argsort(lo)
+	return(np.append(lo[index], b), coefficients[...,index], np.max(err, axis=-1), n_evals)
+# ---------------------------------------------------------------------------------
 
-	weights = np.array(weights)
-	Gauss_nodes = np.array(Gauss_nodes)
 
-	return(weights, Gauss_nodes)
+# ChebyshevEvaluate---------------------------------------------------------------------
+def ChebyshevEvaluate(edges, coefficients, t):
+	''' Evaluates a piecewise Chebyshev expansion (see AdaptiveChebyshevFit) with the Clenshaw recurrence
+	values = ChebyshevEvaluate(edges, coefficients, t)
+
+	coefficients: array with shape (order, n_panels) or (n_functions, order, n_panels)
+	The times outside [edges[0], edges[-1]] are extrapolated from the first and last panels.
+	returns: values with shape t.shape (or (n_functions,)+t.shape)'''
+	t = np.asarray(t, dtype=np.float64)
+	t_flat = t.ravel()
+	edges = np.asarray(edges, dtype=np.float64)
+	panel = np.clip(np.searchsorted(edges, t_flat, side="right")-1, 0, len(edges)-2)
+	# Variable of each panel in [-1, 1] (times 2 for the recurrence):
+	x2 = t_flat - 0.5*(edges[1:]+edges[:-1])[panel]
+	x2 *= (4./np.diff(edges))[panel]
+	# Clenshaw recurrence, with the coefficients of the panel of each time:
+	order = coefficients.shape[-2]
+	b1 = np.zeros(coefficients.shape[:-2]+t_flat.shape)
+	b2 = np.zeros_like(b1)
+	for k in range(order-1, 0, -1):
+		b2 *= -1.
+		b2 += x2*b1
+		b2 += np.take(coefficients[...,k,:], panel, axis=-1)
+		b1, b2 = b2, b1
+	values = np.take(coefficients[...,0,:], panel, axis=-1) + 0.5*x2*b1 - b2
+	return(values.reshape(coefficients.shape[:-2]+t.shape))
 # ---------------------------------------------------------------------------------
 
 # FromSigmaToAbundance---------------------------------------------------------------------
-def FromSigmaToAbundance(t, sigmaX, chemdict):
-	'''Computes the abundance ratio [X/H] at the time t from the density of the X-element sigmaX.''' 
-	sigma_gas = Get_psi(t, chemdict)/chemdict["nuL"];
-	abundance = _safelog10(sigmaX, sigma_gas)
+def FromSigmaToAbundance(t, sigmaX, chemdict, dtype=np.float64):
+	'''Computes the abundance ratio [X/H] at the time t from the density of the X-element sigmaX (in the given dtype, see _check_dtype).''' 
+	sigma_gas = Get_psi(t, chemdict, dtype=dtype)/np.asarray(chemdict["nuL"], dtype=dtype);
+	abundance = _safelog10(np.asarray(sigmaX, dtype=dtype), sigma_gas)
 	return(abundance)	
 # -------------------------# End of FromSigmaToAbundance ----------------------------------
 
 
+# _GaussianTermConstants---------------------------------------------------------------------
+def _GaussianTermConstants(alpha, Aj, tauj, taup, sigma_p, tau1, tau2):
+	'''Time-independent constants of the Gaussian DTD terms (one value per infall).
+	The erf and exp values at the DTD limits tau1 and tau2 are also computed here, so the
+	time-dependent part of the kernels only evaluates the erf/exp of the upper integration limit.
+	The arguments broadcast, so the constants of several DTD components can be computed at once.'''
+	Aj = _float_array(Aj)
+	tauj = _float_array(tauj)
+	betaj = _betaj(alpha, tauj)
+	safe_betaj = np.where(betaj!=0, betaj, 1.)# The case betaj==0 is treated separately
+	constants = dict()
+	constants["betaj"] = betaj
+	constants["etaj"] = taup + sigma_p**2/tauj
+	constants["etaalpha"] = taup + sigma_p**2*alpha
+	constants["Kj_gorro"] = Aj/safe_betaj*np.exp(taup/tauj + 0.5*sigma_p**2/tauj**2)
+	constants["Kjalpha_gorro"] = Aj/safe_betaj*np.exp(taup*alpha + 0.5*sigma_p**2*alpha**2)
+	constants["K0_gorro"] = np.exp(taup*alpha + 0.5*sigma_p**2*alpha**2)
+	constants["Ej_gorro"] = np.exp(betaj*constants["etaj"] + 0.5*betaj**2*sigma_p**2)/safe_betaj
+	# Scaled arguments (x-eta)/(sqrt(2)*sigma_p) at the DTD limits:
+	inv_sqrt2_sigma = 1./(np.sqrt(2.)*sigma_p)
+	constants["inv_sqrt2_sigma"] = inv_sqrt2_sigma
+	constants["erf_tau1_etaj"] = _erf_reference( (tau1-constants["etaj"])*inv_sqrt2_sigma )
+	constants["erf_tau1_etaalpha"] = _erf_reference( (tau1-constants["etaalpha"])*inv_sqrt2_sigma )
+	constants["derf_tau2_etaj"] = _erf_difference( (tau2-constants["etaj"])*inv_sqrt2_sigma, constants["erf_tau1_etaj"] )
+	constants["derf_tau2_etaalpha"] = _erf_difference( (tau2-constants["etaalpha"])*inv_sqrt2_sigma, constants["erf_tau1_etaalpha"] )
+	constants["gauss_tau1_etaalpha"] = np.exp( -((tau1-constants["etaalpha"])*inv_sqrt2_sigma)**2 )
+	return(constants)
+# ---------------------------------------------------------------------------------
+
+
+# _ExponentialTermConstants---------------------------------------------------------------------
+def _ExponentialTermConstants(alpha, Aj, tauj, tauD, tau1, tau2):
+	'''Time-independent constants of the Exponential DTD terms (one value per infall).'''
+	Aj = _float_array(Aj)
+	tauj = _float_array(tauj)
+	inv_alpha = 1./alpha;
+	constants = dict()
+	constants["betaj"] = _betaj(alpha, tauj)
+	constants["QD_tau1_tauj"] = QD(tau1, tauj, tauD)
+	constants["QD_tau2_tauj"] = QD(tau2, tauj, tauD)
+	constants["QD_tau1_alpha"] = QD(tau1, inv_alpha, tauD)
+	constants["QD_tau2_alpha"] = QD(tau2, inv_alpha, tauD)
+	return(constants)
+# ---------------------------------------------------------------------------------
+
+
+# _InverseTermConstants---------------------------------------------------------------------
+def _InverseTermConstants(alpha, Aj, tauj, tau0, tau1, tau2):
+	'''Time-independent constants of the Inverse DTD terms (one value per infall).
+	tau1_0 and tau2_0 already include the shift in tau0.'''
+	Aj = _float_array(Aj)
+	tauj = _float_array(tauj)
+	tau1_0 = tau1 - tau0;
+	tau2_0 = tau2 - tau0;
+	constants = dict()
+	constants["betaj"] = _betaj(alpha, tauj)
+	constants["tau1_0"] = tau1_0
+	constants["tau2_0"] = tau2_0
+	constants["expi_tau1_tauj"] = _safeexpi(tau1_0/tauj)
+	constants["expi_tau2_tauj"] = _safeexpi(tau2_0/tauj)
+	constants["expi_tau1_alpha"] = _safeexpi(alpha*tau1_0)
+	constants["expi_tau2_alpha"] = _safeexpi(alpha*tau2_0)
+	return(constants)
+# ---------------------------------------------------------------------------------
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #
 # 				 MODEL FUNCTION DEFINITIONS
@@ -142,9 +630,9 @@ def FromSigmaToAbundance(t, sigmaX, chemdict):
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 # psi ---------------------------------------------------------------------------------
-def Get_psi(t, chemdict):
-	'''Psi function Get_psi(t, chemdict)
-	Returns the SFR'''
+def Get_psi(t, chemdict, dtype=np.float64):
+	'''Psi function Get_psi(t, chemdict, dtype=np.float64)
+	Returns the SFR, computed in the given dtype (see _check_dtype)'''
 	# Extract the values of the parameters:
 	omega = chemdict["omega"];
 	R = chemdict["R"];
@@ -160,22 +648,27 @@ def Get_psi(t, chemdict):
 	alpha = (1.+omega-R)*nuL
 	inv_alpha = 1./alpha;
 	N = len(tj)
+	# The time-dependent part is evaluated in dtype (the special cases are found in float64):
+	dtype = _check_dtype(dtype)
+	cast = lambda x: np.asarray(x, dtype=dtype)
+	t = cast(t)
 
 	# Evaluate each infall
 	value = 0.;
 	for j in range(N):
-		deltatj = t-tj[j];
-		if tauj[j]!=inv_alpha:
+		deltatj = t-cast(tj[j]);
+		betaj = _betaj(alpha, tauj[j])
+		if np.all(betaj!=0):
 			# Case when alpha!=1/tauj[j]:
-			value += Aj[j]/(alpha-1./tauj[j])*heaviside(deltatj)*( np.exp(-deltatj/tauj[j] )-np.exp(-alpha*deltatj) )
+			value += cast(Aj[j]/betaj)*(deltatj>0)*( np.exp(-deltatj/cast(tauj[j]) )-np.exp(-cast(alpha)*deltatj) )
 		else:
 			# Special case when alpha=1/tauj[j]:
-			value += Aj[j]*heaviside(deltatj)*deltatj*np.exp(-alpha*deltatj)
+			value += cast(Aj[j])*(deltatj>0)*deltatj*np.exp(-cast(alpha)*deltatj)
 	# Add the zero-th case
-	value += + sigma_gas_0*np.exp(-alpha*t)*heaviside(t)
+	value += + cast(sigma_gas_0)*np.exp(-cast(alpha)*t)*(t>0)
 
 	# Multiply by nuL
-	value = nuL*value;
+	value = cast(nuL)*value;
 	return(value)
 # -------------------------# End of psi -------------------------------------------------
 
@@ -184,8 +677,8 @@ def Get_psi(t, chemdict):
 # ipsi ------------------------------------------------------------------------------------
 def Get_ipsi(t, chemdict):
 	'''Get_ipsi(t, chemdict)
-	Returns a primitive of psi(t) function evaluated at time t'''
-	assert(0), "Add the tauj=1/alpha case!!!!"
+	Returns the primitive of psi(t) that vanishes at t=0, i.e. the stellar mass formed from t=0 to t
+	(the infalls must start at tj>=0). t may be a scalar or an array of any shape'''
 	# Extract the values of the parameters:
 	omega = chemdict["omega"];
 	R = chemdict["R"];
@@ -193,10 +686,10 @@ def Get_ipsi(t, chemdict):
 	tauj = chemdict["tauj"]
 	tj = chemdict["tj"];
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	N = len(tj)
 	Aj = chemdict["Aj"]
 	assert(len(tauj)==len(Aj)), "Aj, tauj lengths mismatch"
 	sigma_gas_0 = chemdict["sigma_gas_0"]
+	t = np.asarray(t, dtype=np.float64)
 
 	# Useful definitions
 	alpha = (1.+omega-R)*nuL
@@ -204,36 +697,70 @@ def Get_ipsi(t, chemdict):
 
 	# Now separate the cases tauj!=1/alpha and tauj==1/alpha:
 	(tauj, tj, Aj, tj_gorro, Aj_gorro) = _separate_cases(alpha, tauj, tj, Aj)
-
 	N, N_gorro = len(tj), len(tj_gorro)
-	Kj = [nuL*Aj[j]/(alpha-1./tauj[j]) for j in range(N)]
-
-	value = 0.;
-	# Case when alpha!=1/tauj[j]:
 
-	# 3) Integration of Psi (alpha!=1/tauj[j]):
-	IntPsi = 0.;
+	# The integrals start at tj (psi vanishes before), so the elapsed times are clipped at zero instead of
+	# using heaviside (-expm1(-x)=1-exp(-x) keeps the precision for small x)
+	# 1) Integration of Psi (alpha!=1/tauj[j]):
+	IntPsi = np.zeros(t.shape)
 	for j in range(N):
-		deltatj = t-tj[j]
-		# Positive j:
-		IntPsi += Kj[j]*heaviside(deltatj)*tauj[j]*(1.-np.exp(-deltatj/tauj[j]))
-		# Negative j:
-		IntPsi -= Kj[j]*heaviside(deltatj)/alpha*(1.-np.exp(-deltatj*alpha))
+		deltatj = np.maximum(t-tj[j], 0.)
+		# Positive j and negative j:
+		IntPsi += Aj[j]/(alpha-1./tauj[j])*( -tauj[j]*np.expm1(-deltatj/tauj[j]) + inv_alpha*np.expm1(-alpha*deltatj) )
 	# "Zero" term:
-	IntPsi += nuL*sigma_gas_0*heaviside(t)/alpha*(1.-np.exp(-t*alpha))
+	IntPsi -= sigma_gas_0*inv_alpha*np.expm1(-alpha*np.maximum(t, 0.))
 
-	# 4) Integration of Psi (alpha!=1/tauj[j]):
+	# 2) Integration of Psi (alpha==1/tauj[j]):
 	for j in range(N_gorro):
-		deltatj = t-tj_gorro[j]
+		deltatj = np.maximum(t-tj_gorro[j], 0.)
 		# Unique term:
-		IntPsi += nuL*Aj_gorro[j]*heaviside(deltatj)*(inv_alpha**2)*(1.-(1.+alpha*deltatj)*np.exp(-alpha*deltatj))
+		IntPsi += Aj_gorro[j]*(inv_alpha**2)*( -np.expm1(-alpha*deltatj) - alpha*deltatj*np.exp(-alpha*deltatj) )
 
+	# Multiply by nuL
+	IntPsi *= nuL
 	return(IntPsi)
-
 # -------------------------# End of ipsi -------------------------------------------------
 
 
 
+# Get_stellar_mass ------------------------------------------------------------------------------------
+def Get_stellar_mass(t, chemdict, locked=True):
+	'''Get_stellar_mass(t, chemdict, locked=True)
+	Surface density of stellar mass at time t (same units as sigma_gas_0), from the analytic primitive of psi.
+	locked=True: mass in long-lived stars and stellar remnants, (1-R)*ipsi(t) (instantaneous recycling)
+	locked=False: total mass of the stars formed up to t, ipsi(t)'''
+	formed = Get_ipsi(t, chemdict)
+	if locked: formed *= 1.-chemdict["R"]
+	return(formed)
+# -------------------------# End of Get_stellar_mass -------------------------------------------------
+
+
+
+# Get_returned_mass ------------------------------------------------------------------------------------
+def Get_returned_mass(t, chemdict):
+	'''Get_returned_mass(t, chemdict)
+	Surface density of the mass returned to the gas by the stars formed up to t, R*ipsi(t)
+	(instantaneous recycling)'''
+	returned = Get_ipsi(t, chemdict)
+	returned *= chemdict["R"]
+	return(returned)
+# -------------------------# End of Get_returned_mass -------------------------------------------------
+
+
+
+# Get_gas_fraction ------------------------------------------------------------------------------------
+def Get_gas_fraction(t, chemdict):
+	'''Get_gas_fraction(t, chemdict)
+	Gas fraction sigma_gas/(sigma_gas + sigma_star), where sigma_gas=psi/nuL and sigma_star is the
+	mass locked in stars and remnants (Get_stellar_mass). It is nan where both vanish'''
+	sigma_gas = Get_psi(t, chemdict)/chemdict["nuL"]
+	sigma_star = Get_stellar_mass(t, chemdict)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return( sigma_gas/(sigma_gas+sigma_star) )
+# -------------------------# End of Get_gas_fraction -------------------------------------------------
+
+
+
 
 # Get_DTD ------------------------------------------------------------------------------------
 def Get_DTD(t, chemdict):
@@ -285,42 +812,32 @@ def Get_DTD_arr(t, chemdict):
 	#-------------------------------------
 
 
-	# ------------------------------------
-	DTD_value = np.zeros_like(t) # Cumulative value
+	assert(np.all(np.asarray(tau0_arr)<np.asarray(tau1I_arr))), "   ERROR: tau0 must be LOWER than tau1"
+	#-------------------------------------
 
-	# The Gaussian term
-	for i in range(Ng):
-		AG = AG_arr[i]
-		if AG==0: continue
-		# Extract the DTD parameters:
-		sigma_p = sigma_p_arr[i]
-		taup = taup_arr[i]
-		tau1 = tau1G_arr[i]
-		tau2 = tau2G_arr[i]
-		DTD_value += AG*np.exp(-0.5*((t-taup)/sigma_p)**2 )*(t>=tau1)*(t<tau2);
 
-	# The Exponential term
-	for i in range(Ne):
-		AE = AE_arr[i]
-		if AE==0: continue
-		# Extract the DTD parameters:
-		tauD = tauD_arr[i]
-		tau1 = tau1E_arr[i]
-		tau2 = tau2E_arr[i]
-		DTD_value += AE*np.exp(-t/tauD)*(t>=tau1)*(t<tau2);
+	# ------------------------------------
+	# Each family is evaluated for all its (non-zero) components at once, as rows of a (n_components, n_times) array
+	def _stack(*columns):
+		columns = [np.asarray(column, dtype=np.float64) for column in columns]
+		nonzero = columns[0]!=0
+		return([column[nonzero][:,None] for column in columns])
+
+	def _DTD_gaussian(t_block):
+		return( AG*np.exp(-0.5*((t_block-taup)/sigma_p)**2 )*(t_block>=tau1)*(t_block<tau2) )
+	def _DTD_exponential(t_block):
+		return( AE*np.exp(-t_block/tauD)*(t_block>=tau1E)*(t_block<tau2E) )
+	def _DTD_inverse(t_block):
+		return( AI*(tauI/((t_block-tau0)*(t_block>tau0)+1.*(t_block<=tau0)))*(t_block!=tau0)*(t_block>=tau1I)*(t_block<tau2I) )
+
+	AG, taup, sigma_p, tau1, tau2 = _stack(AG_arr, taup_arr, sigma_p_arr, tau1G_arr, tau2G_arr)
+	AE, tauD, tau1E, tau2E = _stack(AE_arr, tauD_arr, tau1E_arr, tau2E_arr)
+	AI, tauI, tau0, tau1I, tau2I = _stack(AI_arr, tauI_arr, tau0_arr, tau1I_arr, tau2I_arr)
+
+	DTD_value = _sum_over_components(_DTD_gaussian, t, len(AG)) # The Gaussian term
+	DTD_value += _sum_over_components(_DTD_exponential, t, len(AE)) # The Exponential term
+	DTD_value += _sum_over_components(_DTD_inverse, t, len(AI)) # The 1/(t-tau0) term
 
-	# The 1/(t-tau0) term
-	for i in range(Ni):
-		AI = AI_arr[i]
-		if AI==0: continue
-		# Extract the DTD parameters:
-		tauI = tauI_arr[i]
-		tau0 = tau0_arr[i]
-		tau1 = tau1I_arr[i]
-		tau2 = tau2I_arr[i]
-		assert(tau0<tau1), "   ERROR: tau0 must be LOWER than tau1"
-		DTD_value += AI*(tauI/((t-tau0)*(t>tau0)+1.*(t<=tau0)))*(t!=tau0)*(t>=tau1)*(t<tau2);
-	
 	return(DTD_value)
 # -------------------------# End of Get_DTD_arr -------------------------------------------------
 
@@ -353,10 +870,31 @@ def Get_infall(t, chemdict):
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
+# _DTD_breakpoints------------------------
+def _DTD_breakpoints(chemdict):
+	''' Sorted delay times where the DTD of a prepared chemdict is not smooth or varies quickly:
+	the tau1 and tau2 of every component, the peak and tails of the Gaussians and a geometric
+	sequence for the 1/(t-tau0) terms (steep near tau1)'''
+	Gaussian_peaks = (np.asarray(chemdict["taup"])[:,None] + np.asarray(chemdict["sigma_p"])[:,None]*np.array([-10., -6., -2., 0., 2., 6., 10.])).flatten()
+	tau0_arr, tau1I_arr, tau2I_arr = np.asarray(chemdict["tau0"]), np.asarray(chemdict["tau1I"]), np.asarray(chemdict["tau2I"])
+	Inverse_steps = tau0_arr[:,None] + (tau1I_arr-tau0_arr)[:,None]*4.**np.arange(1, 8)
+	Inverse_steps = Inverse_steps[Inverse_steps<tau2I_arr[:,None]]
+	return( np.unique(np.concatenate([chemdict["tau1G"], chemdict["tau2G"], chemdict["tau1E"], chemdict["tau2E"], tau1I_arr, tau2I_arr, Gaussian_peaks, Inverse_steps])) )
+# ---------------------------------------------------------------
+
+
 # R1a_numeric------------------------
-def R1a_numeric(t, chemdict):
+def R1a_numeric(t, chemdict, order=None, panels=True, chunk_size=1024, tol=None, full_output=False):
 	''' Numeric solution for R1a(t)
-	R1a_numeric(t, chemdict) '''
+	R1a_numeric(t, chemdict)
+	panels: if True, the integration interval is split at the DTD breakpoints (tau1, tau2) and
+	at the starting time of the infalls, and a Gauss rule of the given order (20 by default) is
+	used in each panel. Otherwise, a single Gauss rule (order 100 by default) is used in [0, t].
+	The integrand is evaluated on a (n_times, n_nodes) matrix of nodes, in blocks of
+	chunk_size time values to bound the memory usage.
+	tol: if given, the panels are bisected (see AdaptiveGaussQuadrature, order 10 by default) until
+	the estimated relative error of each R1a(t) is below tol. This is the reference mode.
+	full_output: (only with tol) return R1a, the estimated absolute error and the number of integrand evaluations'''
 
 	chemdict = prepare_chemdict( chemdict )
 
@@ -406,25 +944,39 @@ def R1a_numeric(t, chemdict):
 	# Useful definitions
 	Ninfall = len(tj)# Number of infalls
 	alpha = (1.+omega-R)*nuL
-	betaj = [alpha - 1./tauj[j] for j in range(Ninfall)]
+	betaj = [_betaj(alpha, tauj[j]) for j in range(Ninfall)]
 
-	# Load the weights and the nodes
-	weights, Gauss_nodes = GaussWeightsAndNodes()
+	# Breakpoints of the integrand:
+	DTD_breakpoints = _DTD_breakpoints(chemdict)
 
 	# We want t to be an array:
-	try:
-		len(t)
-	except:
-		t = [t];
+	t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+
+	if not (tol is None):
+		# Adaptive quadrature, seeded with the breakpoints of DTD(tau)*psi(t-tau):
+		def _integrand(rows, tau_nodes):
+			return( Get_DTD_arr(tau_nodes, chemdict)*Get_psi(t[rows,None]-tau_nodes, chemdict) )
+		breakpoints = np.concatenate([np.broadcast_to(DTD_breakpoints, (len(t), len(DTD_breakpoints))), t[:,None]-np.asarray(tj)[None,:]], axis=1)
+		Integr, error, n_evals = AdaptiveGaussQuadrature(_integrand, np.zeros(len(t)), np.maximum(t, 0.), breakpoints, rtol=tol, order=10 if order is None else order)
+		if full_output: return(CIa*Integr, CIa*error, n_evals)
+		return(CIa*Integr)
+
+	if order is None: order = 20 if panels else 100
 
 	#-------------------------------------
 	# Numerical integration of the R1a term
-	Integr = np.zeros(len(t), dtype=np.float32);
-
-	for t_n, t_now in enumerate(t):
-		tau_nodes = 0.5*t_now*(1.+Gauss_nodes); # Nodes of integration
+	Integr = np.zeros(len(t));
+
+	for start in range(0, len(t), chunk_size):
+		t_now = t[start:start+chunk_size, None]; # Column with the time values of this block
+		# Nodes of integration (one row per time value)
+		if panels:
+			breakpoints = np.concatenate([np.broadcast_to(DTD_breakpoints, (len(t_now), len(DTD_breakpoints))), t_now-np.asarray(tj)[None,:]], axis=1)# psi(t-tau) has a kink at tau=t-tj
+			weights, tau_nodes = GaussPanelWeightsAndNodes(0., t_now[:,0], breakpoints, order)
+		else:
+			weights, tau_nodes = GaussPanelWeightsAndNodes(0., t_now[:,0], [], order)
 		DTD = Get_DTD_arr(tau_nodes, chemdict) # Perfomed over all the i-th individual DTDs
-		psi_t_tau = 0.*tau_nodes
+		psi_t_tau = np.zeros_like(tau_nodes)
 		for j in range(Ninfall):
 			deltatj = t_now-tj[j]
 			if betaj[j]!=0:
@@ -437,8 +989,8 @@ def R1a_numeric(t, chemdict):
 		# Zero term:
 		psi_t_tau += sigma_gas_0*heaviside(t_now-tau_nodes)*np.exp(-alpha*(t_now-tau_nodes))
 		Integr_tau = DTD*psi_t_tau*(t_now>0);
-			
-		Integr[t_n] = np.dot(weights, Integr_tau)*(0.5*t_now);
+
+		Integr[start:start+chunk_size] = np.einsum("ij,ij->i", Integr_tau, weights);
 
 	# Multiply by nuL and CIa:
 	Integr = CIa*nuL*Integr;
@@ -447,182 +999,328 @@ def R1a_numeric(t, chemdict):
 # ---------------------------------------------------------------
 
 
+# R1a_FFT------------------------
+def R1a_FFT(t, chemdict, DTD=None, dt=None, n_grid=2**16):
+	''' TypeIa SNe rate of an arbitrary (tabulated) DTD, by a FFT convolution with the SFR
+	R1a = R1a_FFT(t, chemdict, DTD=None, dt=None, n_grid=2**16)
+
+	DTD: the DTD on the uniform grid of delay times tau_k = k*dt, with the normalization of Get_DTD_arr (it is
+	multiplied by CIa). It may be a 1D array with the values at tau_k (dt is then required, and the DTD is zero
+	beyond the table), a function DTD(tau), or None to tabulate the DTD of chemdict (e.g. to cross-check the
+	analytic R1a). By default, dt = max(t)/n_grid.
+	R1a(t_n) = CIa*sum_k DTD_k*int psi over the k-th cell: the DTD is averaged in each cell (trapezoidal rule)
+	and the mass formed in each cell is exact (Get_ipsi), so the error is O(dt**2) where the DTD is smooth and
+	O(dt) at its discontinuities. The convolution costs O(n log n) for the n cells in [0, max(t)], and R1a
+	is linearly interpolated at t. Only the infall parameters and CIa of chemdict are used when DTD is given.'''
+	chemdict = prepare_chemdict( chemdict.copy() )
+	t = np.asarray(t, dtype=np.float64)
+	dt, R1a = _R1a_FFT_grid(np.max(t, initial=0.), chemdict, DTD, dt, n_grid)
+	return( np.interp(t, dt*np.arange(len(R1a)), R1a, left=0.) )
+# ---------------------------------------------------------------
+
+
+# _R1a_FFT_grid------------------------
+def _R1a_FFT_grid(t_max, chemdict, DTD=None, dt=None, n_grid=2**16):
+	''' R1a on the uniform grid t_k = k*dt that covers [0, t_max], with a prepared chemdict (see R1a_FFT)
+	(dt, R1a) = _R1a_FFT_grid(t_max, chemdict, DTD, dt, n_grid)'''
+	tabulated = not ((DTD is None) or callable(DTD))
+	assert(not (tabulated and (dt is None))), "ERROR: dt is required for a tabulated DTD"
+	if dt is None: dt = t_max/n_grid if t_max>0 else 1.
+	assert(dt>0), "ERROR: dt must be positive"
+	n_cells = max(int(np.ceil(t_max/dt*(1.-1e-12))), 1)
+	tau = dt*np.arange(n_cells+1)
+
+	if DTD is None:
+		DTD_values = Get_DTD_arr(tau, chemdict)
+	elif callable(DTD):
+		DTD_values = np.asarray(DTD(tau), dtype=np.float64)
+	else:
+		table = np.asarray(DTD, dtype=np.float64).ravel()[:n_cells+1]
+		DTD_values = np.zeros(n_cells+1)
+		DTD_values[:len(table)] = table
+
+	# Mean DTD and mass formed in each cell, convolved: R1a(t_n) = CIa*sum_k DTD_cells[k]*mass_cells[n-1-k]
+	DTD_cells = 0.5*(DTD_values[1:]+DTD_values[:-1])
+	mass_cells = np.diff(Get_ipsi(tau, chemdict))
+	R1a = np.zeros(n_cells+1)
+	R1a[1:] = chemdict["CIa"]*fftconvolve(DTD_cells, mass_cells)[:n_cells]
+	return( dt, R1a )
+# ---------------------------------------------------------------
+
+
 
 # R1a_analytic_gaussian------------------------
-def R1a_analytic_gaussian(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2):
+def R1a_analytic_gaussian(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2, constants=None):
 	''' Exact solution for R1a(t) using Gaussian DTD
-	R1a_analytic_gaussian(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2) '''
-
-	# Extract the values of the parameters:
-	N = len(tj)
+	R1a_analytic_gaussian(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2)
+	constants: output of _GaussianTermConstants (computed here if not provided)'''
 
 	#-------------------------------------
 	# Safety checks:
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
 	assert(len(Aj)==len(tj)), "tj, Aj lengths mismatch"
-	assert(tau1<tau2),"    Error: tau2 must be GREATER than tau1"
+	assert(np.all(tau1<tau2)),"    Error: tau2 must be GREATER than tau1"
 	#-------------------------------------
 
 	# Useful definitions
 	Ninfall = len(tj)# Number of infalls
-	inv_alpha = 1./alpha;
-	betaj = [alpha - 1./tauj[j] for j in range(Ninfall)]	
-
-	# 1) R1a Gaussian term
-	# ---------
-	R1a_g = 0.
+	if constants is None: constants = _GaussianTermConstants(alpha, Aj, tauj, taup, sigma_p, tau1, tau2)
+	betaj = constants["betaj"]
+	sqrt_half_pi = np.sqrt(0.5*np.pi)
 
 	# Useful definitions
-	etaalpha = taup + sigma_p**2*alpha
-
-	# Useful param.
-	R1a_gj = np.zeros(N+1, dtype=np.float32).tolist();
+	etaalpha = constants["etaalpha"]
+	inv_sqrt2_sigma = constants["inv_sqrt2_sigma"]
+	# The integrals vanish for deltatj<=tau1. Otherwise, the lower limit is tau1 and its erf values are constant:
+	erf_tau1_etaalpha = constants["erf_tau1_etaalpha"]
+	gauss_tau1_etaalpha = constants["gauss_tau1_etaalpha"]
+	erf_tau1_etaj = constants["erf_tau1_etaj"]
+
+	# 1) R1a Gaussian term, accumulated in place (the scratch arrays are reused for all the infalls).
+	# Only the times after tj+tau1 are evaluated, and the erf are only evaluated before tj+tau2 (see _time_windows)
+	# ---------
+	infall_args = [Aj[0], tauj[0], tj[0]] if Ninfall>0 else []
+	restrict = _is_sorted_1d(t) # Before the buffers (the comparison of the times allocates a temporary)
+	R1a_g, scratch, masks = _kernel_buffers(4, t, alpha, nuL, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2, *infall_args)
+	shared = _shared_buffers(2, t, alpha, *infall_args)
 	for j in range(Ninfall):
-		deltatj = t - tj[j] 
-		mint1 = deltatj*(deltatj<tau1) + tau1*(deltatj>=tau1)
-		mint2 = deltatj*(deltatj<tau2) + tau2*(deltatj>=tau2)
+		active, window, tail = _time_windows(t, tj[j]+tau1, tj[j]+tau2, restrict)
+		(mint2, z2alpha, derf_z2alpha, term), (mask, _) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+		# deltatj and its exponentials are the same for all the DTD components:
+		(deltatj, decay) = shared[(slice(None),)+active]
+		np.subtract(t[active], tj[j], out=deltatj)
+		np.minimum(deltatj, tau2, out=mint2)
+		np.greater(deltatj, tau1, out=mask)# heaviside(deltatj-tau1)
+		# Only one erf per distinct argument and infall:
+		np.subtract(mint2, etaalpha, out=z2alpha)
+		z2alpha *= inv_sqrt2_sigma
+		_erf_difference(z2alpha[window], erf_tau1_etaalpha, out=derf_z2alpha[window])
+		if tail is not None: derf_z2alpha[tail] = constants["derf_tau2_etaalpha"]
 		if(betaj[j]!=0):
-			# Useful definitions
-			etaj = taup + sigma_p**2/tauj[j]
-			Kj_gorro = Aj[j]/betaj[j]*np.exp(taup/tauj[j] + 0.5*sigma_p**2/tauj[j]**2)
-			Kjalpha_gorro = Aj[j]/betaj[j]*np.exp(taup*alpha + 0.5*sigma_p**2*alpha**2)
-
 			# Positive j:
-			R1a_gj[j] += Kj_gorro*np.sqrt(np.pi*0.5)*np.exp(-deltatj/tauj[j])*(erf( (mint2-etaj)/np.sqrt(2.)/sigma_p )-erf( (mint1-etaj)/np.sqrt(2.)/sigma_p ))*heaviside(deltatj)
-			# Negative j:
-			R1a_gj[j] -= Kjalpha_gorro*np.sqrt(np.pi*0.5)*np.exp(-alpha*deltatj)*(erf( (mint2-etaalpha)/np.sqrt(2.)/sigma_p )-erf( (mint1-etaalpha)/np.sqrt(2.)/sigma_p ))*heaviside(deltatj)
+			np.subtract(mint2, constants["etaj"][j], out=term)
+			term *= inv_sqrt2_sigma
+			_erf_difference(term[window], erf_tau1_etaj[:,j], out=term[window])
+			if tail is not None: term[tail] = constants["derf_tau2_etaj"][j]
+			np.divide(deltatj, -tauj[j], out=decay)
+			np.exp(decay, out=decay)
+			term *= decay
+			term *= constants["Kj_gorro"][j]
+			# Negative j (z2alpha is no longer needed, so its array is reused):
+			work = z2alpha
+			np.multiply(deltatj, -alpha, out=decay)
+			np.exp(decay, out=decay)
+			np.multiply(derf_z2alpha, decay, out=work)
+			work *= constants["Kjalpha_gorro"][j]
+			term -= work
+			term *= sqrt_half_pi
 		else:
 			# Unique term:
-			R1a_gj[j] += Aj[j]*np.exp(-alpha*(deltatj-taup-0.5*alpha*sigma_p**2))*(np.sqrt(0.5*np.pi)*(deltatj-etaalpha)*(erf((mint2-etaalpha)/(np.sqrt(2)*sigma_p))-erf((mint1-etaalpha)/(np.sqrt(2)*sigma_p))) + sigma_p*(np.exp(-0.5*((mint2-etaalpha)/sigma_p)**2)-np.exp(-0.5*((mint1-etaalpha)/sigma_p)**2) ) )*heaviside(deltatj)
+			term[...] = Aj[j]*np.exp(-alpha*(deltatj-taup-0.5*alpha*sigma_p**2))*(sqrt_half_pi*(deltatj-etaalpha)*derf_z2alpha + sigma_p*(np.exp(-z2alpha**2)-gauss_tau1_etaalpha) )
 			print("  Unique term used in the Gaussian DTD")
-
+		term *= mask
+		R1a_g[active] += term
 
 	# "Zero" term:
-	mint1 = t*(t<tau1) + tau1*(t>=tau1)
-	mint2 = t*(t<tau2) + tau2*(t>=tau2)
-	R1a_gj[-1] = sigma_gas_0*np.exp(-alpha*t)*np.sqrt(np.pi*0.5)*np.exp(taup*alpha+0.5*sigma_p**2*alpha**2)*(erf( (mint2-etaalpha)/np.sqrt(2.)/sigma_p )-erf( (mint1-etaalpha)/np.sqrt(2.)/sigma_p ))*heaviside(t)
-
+	active, window, tail = _time_windows(t, tau1, tau2, restrict)
+	(mint2, z2alpha, term), (mask, _) = scratch[(slice(0, 3),)+active], masks[(slice(None),)+active]
+	decay = shared[(1,)+active]
+	np.minimum(t[active], tau2, out=mint2)
+	np.subtract(mint2, etaalpha, out=z2alpha)
+	z2alpha *= inv_sqrt2_sigma
+	_erf_difference(z2alpha[window], erf_tau1_etaalpha, out=term[window])
+	if tail is not None: term[tail] = constants["derf_tau2_etaalpha"]
+	np.multiply(t[active], -alpha, out=decay)
+	np.exp(decay, out=decay)
+	term *= decay
+	term *= sigma_gas_0*sqrt_half_pi*constants["K0_gorro"]
+	np.greater(t[active], tau1, out=mask)
+	term *= mask
+	R1a_g[active] += term
 
 	# Constant factor (including nuL)
-	for j in range(Ninfall+1): R1a_gj[j] = CIa*AG*sigma_p*nuL*R1a_gj[j];
-	R1a_g += np.array(R1a_gj).sum(0); # Sumation
-	del(R1a_gj)
-
+	R1a_g *= CIa*AG*sigma_p*nuL
 	return(R1a_g)
 # -------------------------# End of R1a_analytic_gaussian -------------------------------------------------	
 
 
 
 # R1a_analytic_exponential------------------------
-def R1a_analytic_exponential(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2):
+def R1a_analytic_exponential(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2, constants=None):
 	''' Exact solution for R1a(t) using the Exponential DTD
-	R1a_analytic_exponential(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2) '''
-
-	# Extract the values of the parameters:
-	N = len(tj)
+	R1a_analytic_exponential(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2)
+	constants: output of _ExponentialTermConstants (computed here if not provided)'''
 
 	#-------------------------------------
 	# Safety checks:
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
 	assert(len(Aj)==len(tj)), "tj, Aj lengths mismatch"
-	assert(tau1<tau2),"    Error: tau2 must be GREATER than tau1"
+	assert(np.all(tau1<tau2)),"    Error: tau2 must be GREATER than tau1"
 	#-------------------------------------
 
 	# Useful definitions
 	Ninfall = len(tj)# Number of infalls
-	betaj = [alpha - 1./tauj[j] for j in range(Ninfall)]
+	if constants is None: constants = _ExponentialTermConstants(alpha, Aj, tauj, tauD, tau1, tau2)
+	betaj = constants["betaj"]
 	inv_alpha = 1./alpha;
 
-	# 1) R1a Exponential term
+	# 1) R1a Exponential term, accumulated in place (the scratch arrays are reused for all the infalls).
+	# mint1=mint2 for deltatj<=tau1, where the terms vanish, so only the times after tj+tau1 are evaluated
 	# ---------
-	R1a_e = 0.
-
-	R1a_ej = np.zeros(N+1, dtype=np.float32).tolist();
+	infall_args = [Aj[0], tauj[0], tj[0]] if Ninfall>0 else []
+	restrict = _is_sorted_1d(t) # Before the buffers (the comparison of the times allocates a temporary)
+	R1a_e, scratch, masks = _kernel_buffers(5, t, alpha, nuL, sigma_gas_0, CIa, AE, tauD, tau1, tau2, *infall_args)
+	shared = _shared_buffers(2, t, alpha, *infall_args)
 	for j in range(Ninfall):
-		deltatj = t - tj[j] 
-		mint1 = deltatj*(deltatj<tau1) + tau1*(deltatj>=tau1)
-		mint2 = deltatj*(deltatj<tau2) + tau2*(deltatj>=tau2)
+		active, window, tail = _time_windows(t, tj[j]+tau1, tj[j]+tau2, restrict)
+		(mint1, mint2, term, work, aux2), (mask, _) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+		# deltatj and its exponentials are the same for all the DTD components:
+		(deltatj, decay) = shared[(slice(None),)+active]
+		np.subtract(t[active], tj[j], out=deltatj)
+		np.minimum(deltatj, tau1, out=mint1)
+		np.minimum(deltatj, tau2, out=mint2)
 		if betaj[j]!=0:
 			# Qj will discern the special case with taueff-> inf
 			# Positive j:
-			R1a_ej[j] += Aj[j]/betaj[j]*(QD(mint1, tauj[j], tauD)-QD(mint2, tauj[j], tauD))*np.exp(-deltatj/tauj[j])*heaviside(deltatj)
-			# Negative j:
-			R1a_ej[j] -= Aj[j]/betaj[j]*(QD(mint1, inv_alpha, tauD)-QD(mint2, inv_alpha, tauD))*np.exp(-deltatj*alpha)*heaviside(deltatj)
+			QD(mint1, tauj[j], tauD, out=term, work=aux2)
+			term -= QD(mint2, tauj[j], tauD, out=work, work=aux2)
+			np.divide(deltatj, -tauj[j], out=decay)
+			np.exp(decay, out=decay)
+			term *= decay
+			# Negative j (each QD is multiplied by the decay and accumulated, so no extra scratch array is needed):
+			np.multiply(deltatj, -alpha, out=decay)
+			np.exp(decay, out=decay)
+			QD(mint1, inv_alpha, tauD, out=work, work=aux2)
+			work *= decay
+			term -= work
+			QD(mint2, inv_alpha, tauD, out=work, work=aux2)
+			work *= decay
+			term += work
+			term *= Aj[j]/betaj[j]
+			np.greater(deltatj, 0., out=mask)# heaviside(deltatj)
+			term *= mask
 		else:
 			# Unique term
-			R1a_ej[j] += Aj[j]*np.exp(-alpha*deltatj)*( QD_gorro(mint2, deltatj, inv_alpha, tauD)-QD_gorro(mint1, deltatj, inv_alpha, tauD) )
+			term[...] = Aj[j]*np.exp(-alpha*deltatj)*( QD_gorro(mint2, deltatj, inv_alpha, tauD)-QD_gorro(mint1, deltatj, inv_alpha, tauD) )
 			print("  Unique term used in the Exponential DTD")
+		R1a_e[active] += term
 
 	# "Zero" term:
-	mint1 = t*(t<tau1) + tau1*(t>=tau1)
-	mint2 = t*(t<tau2) + tau2*(t>=tau2)
-	R1a_ej[-1] += sigma_gas_0*np.exp(-t*alpha)*( QD(mint1, inv_alpha, tauD)-QD(mint2, inv_alpha, tauD) )*heaviside(t)
+	active, window, tail = _time_windows(t, tau1, tau2, restrict)
+	(mint1, mint2, term, work, aux2), (mask, _) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+	decay = shared[(1,)+active]
+	np.minimum(t[active], tau1, out=mint1)
+	np.minimum(t[active], tau2, out=mint2)
+	QD(mint1, inv_alpha, tauD, out=term, work=aux2)
+	term -= QD(mint2, inv_alpha, tauD, out=work, work=aux2)
+	np.multiply(t[active], -alpha, out=decay)
+	np.exp(decay, out=decay)
+	term *= decay
+	term *= sigma_gas_0
+	np.greater(t[active], 0., out=mask)
+	term *= mask
+	R1a_e[active] += term
 
 	# Constant factor
-	for j in range(Ninfall+1): R1a_ej[j] = CIa*AE*nuL*R1a_ej[j];# Including nuL
-	R1a_e += np.array(R1a_ej).sum(0); # Sumation
-	del(R1a_ej)
-
+	R1a_e *= CIa*AE*nuL# Including nuL
 	return(R1a_e)
 # -------------------------# End of R1a_analytic_exponential -------------------------------------------------
 
 
 
 # R1a_analytic_inverse------------------------
-def R1a_analytic_inverse(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2):
+def R1a_analytic_inverse(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2, constants=None):
 	''' Exact solution for R1a(t) using the Inverse of t DTD
-	R1a_analytic_inverse(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2) '''
-
-	# Extract the values of the parameters:
-	N = len(tj)
+	R1a_analytic_inverse(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2)
+	constants: output of _InverseTermConstants (computed here if not provided)'''
 
 	#-------------------------------------
 	# Safety checks:
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
 	assert(len(Aj)==len(tj)), "tj, Aj lengths mismatch"
-	assert(tau1<tau2),"    Error: tau2 must be GREATER than tau1"
-	assert(tau0<tau1),"    Error: tau0 must be LOWER than tau1"
+	assert(np.all(tau1<tau2)),"    Error: tau2 must be GREATER than tau1"
+	assert(np.all(tau0<tau1)),"    Error: tau0 must be LOWER than tau1"
 	#-------------------------------------
 
 	# Useful definitions
 	Ninfall = len(tj)# Number of infalls
 	inv_alpha = 1./alpha;
-	betaj = [alpha - 1./tauj[j] for j in range(Ninfall)]
+	if constants is None: constants = _InverseTermConstants(alpha, Aj, tauj, tau0, tau1, tau2)
+	betaj = constants["betaj"]
 
-	# 1) R1a Inverse term
+	# 1) R1a Inverse term, accumulated in place (the scratch arrays are reused for all the infalls).
+	# Only the times after tj+tau1 are evaluated, and the expi are only evaluated before tj+tau2 (see _time_windows)
 	# ---------
-	R1a_i = 0.
-
-	# Offset correction:
-	t = t - tau0;
-	tau1 = tau1 - tau0;
-	tau2 = tau2 - tau0;
+	infall_args = [Aj[0], tauj[0], tj[0]] if Ninfall>0 else []
+	restrict = _is_sorted_1d(t) # Before the buffers (the comparison of the times allocates a temporary)
+	R1a_i, scratch, masks = _kernel_buffers(4, t, alpha, nuL, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2, *infall_args)
+	shared = _shared_buffers(1, t, alpha, *infall_args)
 
-	R1a_ij = np.zeros(N+1, dtype=np.float32).tolist();
 	for j in range(Ninfall):
-		deltatj = t - tj[j]
-		mint1 = deltatj*(deltatj<tau1) + tau1*(deltatj>=tau1)
-		mint2 = deltatj*(deltatj<tau2) + tau2*(deltatj>=tau2)
+		active, window, tail = _time_windows(t, tj[j]+tau1, tj[j]+tau2, restrict)
+		(deltatj, mint1, mint2, term), (mask, expi_mask) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+		# Exponentials of t-tj, the same for all the DTD components (the shift by tau0 is a constant factor)
+		decay = shared[(0,)+active]
+		# Offset correction (tau1 and tau2 are shifted in the constants):
+		np.subtract(t[active], tj[j], out=deltatj)
+		deltatj -= tau0
+		np.minimum(deltatj, constants["tau2_0"], out=mint2)
 		if betaj[j]!=0:
-			# Positive j:
-			R1a_ij[j] += Aj[j]/betaj[j]*heaviside(deltatj-tau1)*(np.exp(-deltatj/tauj[j])*_safeexpi(mint2/tauj[j])-np.exp(-alpha*deltatj)*_safeexpi(alpha*mint2))
-			# Negative j:
-			R1a_ij[j] -= Aj[j]/betaj[j]*heaviside(deltatj-tau1)*(np.exp(-deltatj/tauj[j])*_safeexpi(tau1/tauj[j])-np.exp(-alpha*deltatj)*_safeexpi(alpha*tau1))
+			# Positive j (minus its value at tau1):
+			np.divide(mint2, tauj[j], out=term)
+			_safeexpi(term[window], out=term[window], mask=expi_mask[window])
+			if tail is not None: term[tail] = constants["expi_tau2_tauj"][j]
+			term -= constants["expi_tau1_tauj"][j]
+			np.subtract(t[active], tj[j], out=decay)
+			decay /= -tauj[j]
+			np.exp(decay, out=decay)
+			term *= decay
+			term *= np.exp(tau0/tauj[j])
+			# Negative j (minus its value at tau1):
+			np.multiply(mint2, alpha, out=mint1)
+			_safeexpi(mint1[window], out=mint1[window], mask=expi_mask[window])
+			if tail is not None: mint1[tail] = constants["expi_tau2_alpha"]
+			mint1 -= constants["expi_tau1_alpha"]
+			np.subtract(t[active], tj[j], out=decay)
+			decay *= -alpha
+			np.exp(decay, out=decay)
+			mint1 *= decay
+			mint1 *= np.exp(alpha*tau0)
+			term -= mint1
+			term *= Aj[j]/betaj[j]
+			np.greater(deltatj, constants["tau1_0"], out=mask)# heaviside(deltatj-tau1)
+			term *= mask
 		else:
 			# Unique term:
-			R1a_ij[j] += Aj[j]*( deltatj*np.exp(-alpha*deltatj)*(_safeexpi(alpha*mint2)-_safeexpi(alpha*mint1)) + inv_alpha*np.exp(alpha*(mint1-deltatj)) - inv_alpha*np.exp(alpha*(mint2-deltatj))   )
+			np.minimum(deltatj, constants["tau1_0"], out=mint1)
+			term[...] = Aj[j]*( deltatj*np.exp(-alpha*deltatj)*(_safeexpi(alpha*mint2)-_safeexpi(alpha*mint1)) + inv_alpha*np.exp(alpha*(mint1-deltatj)) - inv_alpha*np.exp(alpha*(mint2-deltatj))   )
 			print("  Unique term used in the inverse DTD")
+		R1a_i[active] += term
 
 	# "Zero" term:
-	mint1 = t*(t<tau1) + tau1*(t>=tau1)
-	mint2 = t*(t<tau2) + tau2*(t>=tau2)
-	R1a_ij[-1] += sigma_gas_0*np.exp(-alpha*t)*(_safeexpi(mint2*alpha)-_safeexpi(mint1*alpha))*heaviside(t)
+	active, window, tail = _time_windows(t, tau1, tau2, restrict)
+	(t_0, mint1, mint2, term), (mask, expi_mask) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+	decay = shared[(0,)+active]
+	np.subtract(t[active], tau0, out=t_0)
+	np.minimum(t_0, constants["tau1_0"], out=mint1)
+	np.minimum(t_0, constants["tau2_0"], out=mint2)
+	np.multiply(mint2, alpha, out=term)
+	_safeexpi(term[window], out=term[window], mask=expi_mask[window])
+	if tail is not None: term[tail] = constants["expi_tau2_alpha"]
+	mint1 *= alpha
+	_safeexpi(mint1[window], out=mint1[window], mask=expi_mask[window])
+	if tail is not None: mint1[tail] = constants["expi_tau1_alpha"]
+	term -= mint1
+	np.multiply(t[active], -alpha, out=decay)
+	np.exp(decay, out=decay)
+	term *= decay
+	term *= sigma_gas_0*np.exp(alpha*tau0)
+	np.greater(t_0, 0., out=mask)
+	term *= mask
+	R1a_i[active] += term
 
 	# Constant factor
-	for j in range(Ninfall+1): R1a_ij[j] = CIa*tauI*AI*nuL*R1a_ij[j];# Includes the nuL term
-	R1a_i += np.array(R1a_ij).sum(0); # Sumation
-	del(R1a_ij)
-
+	R1a_i *= CIa*tauI*AI*nuL# Includes the nuL term
 	return(R1a_i)
 # -------------------------# End of R1a_analytic_inverse -------------------------------------------------
 
@@ -630,110 +1328,16 @@ def R1a_analytic_inverse(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI
 
 
 # R1a_analytic------------------------
-def R1a_analytic(t, chemdict, separated_terms=False):
+def R1a_analytic(t, chemdict, separated_terms=False, jacobian=False, dtype=np.float64):
 	''' Exact solution for R1a(t)
 	R1a_analytic(t, chemdict) 
-	When separated_terms is True, the output is a 3-element array'''
-
-	chemdict = prepare_chemdict( chemdict )
-
-	# Extract the values of the parameters:
-	omega = chemdict["omega"];
-	R = chemdict["R"];
-	nuL = chemdict["nuL"];
-	tauj = chemdict["tauj"]
-	tj = chemdict["tj"];
-	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	N = len(tj)
-	Aj = chemdict["Aj"]
-	sigma_gas_0 = chemdict["sigma_gas_0"]
-	# DTD
-	CIa = chemdict["CIa"]
-	#-------------------------------------
-
-
-	#-------------------------------------
-	# Safety checks:
-	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	assert(len(Aj)==len(tj)), "tj, Aj lengths mismatch"
-	#-------------------------------------
-
-	# Useful definitions
-	alpha = (1.+omega-R)*nuL
-	gamma = nuL*(1.+omega-R);
-	
-
-	# 1) R1a Gaussian term
-	# ---------
-	# Gaussian DTD parameters
-	AG_arr = chemdict["AG"]
-	Ng = len(AG_arr)# Get the number of Gaussians
-	sigma_p_arr = chemdict["sigma_p"]
-	taup_arr = chemdict["taup"]
-	tau1G_arr = chemdict["tau1G"]
-	tau2G_arr = chemdict["tau2G"]
-
-	assert( (len(sigma_p_arr)==Ng) and  (len(taup_arr)==Ng) and (len(tau1G_arr)==Ng) and (len(tau2G_arr)==Ng)), "Dimensions of Gaussian DTD parameters mismatch"
-
-	R1a_g = 0. # Cumulative value
-	for i in range(Ng):
-		AG = AG_arr[i]
-		taup = taup_arr[i]
-		sigma_p = sigma_p_arr[i]
-		tau1 = tau1G_arr[i]
-		tau2 = tau2G_arr[i]
-
-		R1a_g += R1a_analytic_gaussian(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2)
-
-
-	# 2) R1a Exponential term
-	# ---------
-	# Exponential DTD parameters
-	AE_arr = chemdict["AE"]
-	Ne = len(AE_arr)# Get the number of Exponentials
-	tauD_arr = chemdict["tauD"]
-	tau1E_arr = chemdict["tau1E"]
-	tau2E_arr = chemdict["tau2E"]
-
-	assert( (len(tauD_arr)==Ne) and  (len(tau1E_arr)==Ne) and (len(tau2E_arr)==Ne) ), "Dimensions of Exponential DTD parameters mismatch"
-
-	R1a_e = 0.# Cumulative value
-	for i in range(Ne):
-		AE = AE_arr[i]
-		tauD = tauD_arr[i]
-		tau1 = tau1E_arr[i]
-		tau2 = tau2E_arr[i]
-
-		R1a_e += R1a_analytic_exponential(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2);
-
-
-	# 3) R1a Inverse term
-	# ---------
-	# Inverse DTD parameters
-	AI_arr = chemdict["AI"]
-	Ni = len(AI_arr)# Get the number of Inverses
-	tauI_arr = chemdict["tauI"]
-	tau0_arr = chemdict["tau0"]
-	tau1I_arr = chemdict["tau1I"]
-	tau2I_arr = chemdict["tau2I"]
-
-	assert( (len(tauI_arr)==Ni) and  (len(tau0_arr)==Ni) and  (len(tau1I_arr)==Ni) and (len(tau2I_arr)==Ni) ), "Dimensions of 1/t DTD parameters mismatch"
-
-	R1a_i = 0.# Cumulative value
-	for i in range(Ni):
-		AI = AI_arr[i]
-		tauI = tauI_arr[i]
-		tau0 = tau0_arr[i]
-		tau1 = tau1I_arr[i]
-		tau2 = tau2I_arr[i]
-
-		R1a_i += R1a_analytic_inverse(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2)
-
-	# Prepare the output
-	if separated_terms:
-		return([R1a_g,R1a_e,R1a_i])
-	else:
-		return(R1a_g+R1a_e+R1a_i)
+	When separated_terms is True, the output is a 3-element array
+	When jacobian is True, the output is (R1a, jacobian) for the total rate. See ChemModel.r1a_jacobian
+	dtype: precision of the kernels (np.float64 or np.float32, see ChemModel)'''
+	if jacobian:
+		assert(not separated_terms), "ERROR: the jacobian is only available for the total rate"
+		return( ChemModel(chemdict, dtype=dtype).r1a_jacobian(t) )
+	return( ChemModel(chemdict, dtype=dtype).r1a(t, separated_terms=separated_terms) )
 # -------------------------# End of R1a_analytic -------------------------------------------------
 
 
@@ -958,73 +1562,134 @@ def Get_CIa(TypeIa_SNe_ratio, Area, chemdict, present_day_time=13.8):
 
 
 # SolveChemEvolModel_GaussianTerm -------------------------------------------------------------------------------
-def SolveChemEvolModel_GaussianTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2, mx1a):
+def SolveChemEvolModel_GaussianTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2, mx1a, constants=None):
 	'''
 	Returns the part of the solution that corresponds to the Gaussian DTD.
+	constants: output of _GaussianTermConstants (computed here if not provided)
 	'''
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	N = len(tj)
-	assert(tau2>tau1), "tau2<=tau1"
+	assert(np.all(tau2>tau1)), "tau2<=tau1"
 	#-------------------------------------
 
 	#-------------------------------------
 	# Useful definitions
 	gamma = alpha
 	N = len(tj)
-	betaj = [gamma - 1./tauj[j] for j in range(N)]
-	etaalpha = taup + sigma_p**2*alpha
-	#-------------------------------------
-
-	#-------------------------------------
-	#problem = [betaj[j]*etaj[j]+betaj[j]**2*sigma_p**2*0.5 for j in range(N)]
-	#for j in range(N): print(j, problem[j], np.round(np.exp(problem[j]),3) )
-	#print("....")
-	#problem = [taup/tauj[j]+0.5*sigma_p**2/tauj[j]**2 for j in range(N)]
-	#for j in range(N): print(j, problem[j], np.round(np.exp(problem[j]),3) )
-	#del(problem)
+	if constants is None: constants = _GaussianTermConstants(alpha, Aj, tauj, taup, sigma_p, tau1, tau2)
+	betaj = constants["betaj"]
+	etaalpha = constants["etaalpha"]
+	inv_sqrt2_sigma = constants["inv_sqrt2_sigma"]
+	# All the terms vanish for deltatj<=tau1. Otherwise the lower integration limit is tau1, whose erf/exp are constant:
+	erf_tau1_etaalpha = constants["erf_tau1_etaalpha"]
+	derf_tau2_etaalpha = constants["derf_tau2_etaalpha"]
+	gauss_tau1_etaalpha = constants["gauss_tau1_etaalpha"]
+	sqrt_2_over_pi_sigma = np.sqrt(2./np.pi)*sigma_p
 	#-------------------------------------
 
 	# ------------------------------------------------------------------------
-	# 1) Non-Homogeneous non-trivial gaussian term:
-	sol_gauss = 0.;
+	# 1) Non-Homogeneous non-trivial gaussian term, accumulated in place (the scratch arrays are reused for all the infalls).
+	# Only the times after tj+tau1 are evaluated, and the erf are only evaluated before tj+tau2 (see _time_windows):
+	infall_args = [Aj[0], tauj[0], tj[0]] if N>0 else []
+	restrict = _is_sorted_1d(t) # Before the buffers (the comparison of the times allocates a temporary)
+	sol_gauss, scratch, masks = _kernel_buffers(6, t, alpha, nuL, sigma_gas_0, CIa, AG, taup, sigma_p, tau1, tau2, mx1a, *infall_args)
+	shared = _shared_buffers(2, t, alpha, *infall_args)
 	for j in range(N):
+		active, window, tail = _time_windows(t, tj[j]+tau1, tj[j]+tau2, restrict)
+		(mint2, z2alpha, derf_z2alpha, term, work, aux), (mask, _) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+		# deltatj and its exponentials are the same for all the DTD components:
+		(deltatj, growth) = shared[(slice(None),)+active]
 		# Time variables
-		deltatj = t - tj[j];
-		mint1 = deltatj*(deltatj<tau1) + tau1*(deltatj>=tau1)
-		mint2 = deltatj*(deltatj<tau2) + tau2*(deltatj>=tau2)
-
-		if betaj[j]!=0:
+		np.subtract(t[active], tj[j], out=deltatj)
+		np.minimum(deltatj, tau2, out=mint2)
+		# Time-dependent erf (computed once per infall)
+		np.subtract(mint2, etaalpha, out=z2alpha)
+		z2alpha *= inv_sqrt2_sigma
+		_erf_difference(z2alpha[window], erf_tau1_etaalpha, out=derf_z2alpha[window])
+		if tail is not None: derf_z2alpha[tail] = derf_tau2_etaalpha
+
+		if np.all(betaj[j]!=0):
 			# Case alpha!=1/tauj[j]
-
-			# Useful parameters
-			etaj = taup+sigma_p**2/tauj[j]
-			Kj_gorro = Aj[j]/betaj[j]*np.exp(taup/tauj[j] + 0.5*sigma_p**2/tauj[j]**2)
-			Kjalpha_gorro = Aj[j]/betaj[j]*np.exp(taup*alpha + 0.5*sigma_p**2*alpha**2)
-
-			# From 0 to tau2:
-			sol_gauss += Kj_gorro*heaviside(deltatj-tau1)*np.exp(-gamma*deltatj)/betaj[j]*np.exp(betaj[j]*etaj+0.5*betaj[j]**2*sigma_p**2)*(erf( (betaj[j]*sigma_p**2+etaj-mint2)/(np.sqrt(2.)*sigma_p))-erf( (betaj[j]*sigma_p**2+etaj-mint1)/(np.sqrt(2.)*sigma_p))); # Positive (first term)
-			sol_gauss += Kj_gorro*heaviside(deltatj-tau1)*np.exp(-gamma*deltatj)/betaj[j]*np.exp(betaj[j]*mint2)*(erf( (mint2-etaj)/(np.sqrt(2.)*sigma_p)   )-erf( (tau1-etaj)/(np.sqrt(2.)*sigma_p)   ))# Positive (second term)
-
-			sol_gauss -= Kjalpha_gorro*heaviside(deltatj-tau1)*np.exp(-gamma*deltatj)*( (mint2-etaalpha)*erf( (mint2-etaalpha)/(np.sqrt(2.)*sigma_p) )-(mint2-mint1)*erf( (tau1-etaalpha)/(np.sqrt(2.)*sigma_p) )    - (mint1-etaalpha)*erf( (mint1-etaalpha)/(np.sqrt(2.)*sigma_p) )  ); # Negative (first term)
-			sol_gauss -= Kjalpha_gorro*heaviside(deltatj-tau1)*np.exp(-gamma*deltatj)*np.sqrt(2./np.pi)*sigma_p*( np.exp(-(mint2-etaalpha)**2/(2.*sigma_p**2) )-np.exp(-(mint1-etaalpha)**2/(2.*sigma_p**2) ) ) # Negative (second term)
+			# From 0 to tau2. Positive terms (the first one uses betaj*sigma_p**2+etaj = etaalpha):
+			np.subtract(mint2, constants["etaj"][j], out=term)
+			term *= inv_sqrt2_sigma
+			_erf_difference(term[window], constants["erf_tau1_etaj"][:,j], out=term[window])
+			if tail is not None: term[tail] = constants["derf_tau2_etaj"][j]
+			np.multiply(mint2, betaj[j], out=work)
+			np.exp(work, out=work)
+			term *= work
+			term /= betaj[j]
+			np.multiply(derf_z2alpha, constants["Ej_gorro"][j], out=work)
+			term -= work
+			term *= constants["Kj_gorro"][j]
+			# Negative terms:
+			np.subtract(mint2, etaalpha, out=work)
+			work *= derf_z2alpha
+			np.square(z2alpha, out=aux)
+			np.negative(aux, out=aux)
+			np.exp(aux, out=aux)
+			aux -= gauss_tau1_etaalpha
+			aux *= sqrt_2_over_pi_sigma
+			work += aux
+			work *= constants["Kjalpha_gorro"][j]
+			term -= work
+			np.greater(deltatj, tau1, out=mask)# heaviside(deltatj-tau1)
+			term *= mask
 
 			# From tau2 to t:
-			sol_gauss += Kj_gorro*heaviside(deltatj-tau2)/betaj[j]*np.exp(-gamma*deltatj)*( erf( (tau2-etaj)/(np.sqrt(2.)*sigma_p)) - erf( (tau1-etaj)/(np.sqrt(2.)*sigma_p))  )*(np.exp(betaj[j]*deltatj)-np.exp(betaj[j]*tau2) ); # Positive (unique term)
-			sol_gauss -= Kjalpha_gorro*heaviside(deltatj-tau2)*np.exp(-gamma*deltatj)*(deltatj-tau2)*( erf( (tau2-etaalpha)/(np.sqrt(2.)*sigma_p)) - erf( (tau1-etaalpha)/(np.sqrt(2.)*sigma_p))  ) # Negative (unique term)
+			np.multiply(deltatj, betaj[j], out=growth)
+			np.exp(growth, out=growth)
+			np.subtract(growth, np.exp(betaj[j]*tau2), out=work)
+			work *= constants["Kj_gorro"][j]/betaj[j]*constants["derf_tau2_etaj"][j] # Positive (unique term)
+			np.subtract(deltatj, tau2, out=aux)
+			aux *= constants["Kjalpha_gorro"][j]*derf_tau2_etaalpha
+			work -= aux # Negative (unique term)
+			np.greater(deltatj, tau2, out=mask)# heaviside(deltatj-tau2)
+			work *= mask
+			term += work
+			decay = growth # growth is no longer needed, so its array is reused
+			np.multiply(deltatj, -gamma, out=decay)
+			np.exp(decay, out=decay)
+			term *= decay
 		else:
-			sol_gauss += Aj[j]*np.exp(-alpha*(deltatj-taup-0.5*alpha*sigma_p**2))*( (deltatj-etaalpha)*(erf( (mint2-etaalpha)/(np.sqrt(2.)*sigma_p ) ) - erf( (mint1-etaalpha)/(np.sqrt(2.)*sigma_p) ) ) + sigma_p*(np.exp(-0.5*((mint2-etaalpha)/sigma_p)**2)-np.exp(-0.5*((mint1-etaalpha)/sigma_p)**2) ) ); # Unique term
+			# Case alpha==1/tauj[j]: integral of the DTD times (deltatj-tau)**2/2 (with erf and gaussian moments), valid also after tau2
+			gauss_z2alpha = np.exp(-z2alpha**2)
+			term[...] = 0.5*Aj[j]*heaviside(deltatj-tau1)*np.exp(-alpha*(deltatj-taup-0.5*alpha*sigma_p**2))*( ((deltatj-etaalpha)**2+sigma_p**2)*derf_z2alpha - sqrt_2_over_pi_sigma*(2.*(deltatj-etaalpha)*(gauss_tau1_etaalpha-gauss_z2alpha) + (mint2-etaalpha)*gauss_z2alpha - (tau1-etaalpha)*gauss_tau1_etaalpha) ); # Unique term
+		sol_gauss[active] += term
 
 	# Zero term. From 0 to tau2:
-	mint1 = t*(t<tau1) + tau1*(t>=tau1)
-	mint2 = t*(t<tau2) + tau2*(t>=tau2)
-	sol_gauss += sigma_gas_0*np.exp(taup*alpha+0.5*sigma_p**2*alpha**2)*heaviside(t-tau1)*np.exp(-gamma*t)*( (mint2-etaalpha)*erf( (mint2-etaalpha)/(np.sqrt(2.)*sigma_p) )-mint2*erf( (tau1-etaalpha)/(np.sqrt(2.)*sigma_p) )    - (mint1-etaalpha)*erf( (mint1-etaalpha)/(np.sqrt(2.)*sigma_p) ) + mint1*erf( (tau1-etaalpha)/(np.sqrt(2.)*sigma_p) )   ); # Zero term (first term)
-	sol_gauss += sigma_gas_0*np.exp(taup*alpha+0.5*sigma_p**2*alpha**2)*heaviside(t-tau1)*np.exp(-gamma*t)*np.sqrt(2./np.pi)*sigma_p*( np.exp(-(mint2-etaalpha)**2/(2.*sigma_p**2) )-np.exp(-(mint1-etaalpha)**2/(2.*sigma_p**2) ) ) # Zero term (second term)
+	active, window, tail = _time_windows(t, tau1, tau2, restrict)
+	(mint2, z2alpha, term, work, aux), (mask, _) = scratch[(slice(0, 5),)+active], masks[(slice(None),)+active]
+	decay = shared[(1,)+active]
+	np.minimum(t[active], tau2, out=mint2)
+	np.multiply(t[active], -gamma, out=decay)
+	np.exp(decay, out=decay)
+	np.subtract(mint2, etaalpha, out=z2alpha)
+	z2alpha *= inv_sqrt2_sigma
+	_erf_difference(z2alpha[window], erf_tau1_etaalpha, out=term[window])
+	if tail is not None: term[tail] = derf_tau2_etaalpha
+	np.subtract(mint2, etaalpha, out=work)
+	term *= work # Zero term (first term)
+	np.square(z2alpha, out=aux)
+	np.negative(aux, out=aux)
+	np.exp(aux, out=aux)
+	aux -= gauss_tau1_etaalpha
+	aux *= sqrt_2_over_pi_sigma
+	term += aux # Zero term (second term)
+	np.greater(t[active], tau1, out=mask)
+	term *= mask
 
 	# Zero term. From tau2 to t:
-	sol_gauss += sigma_gas_0*np.exp(taup*alpha+0.5*sigma_p**2*alpha**2)*heaviside(t-tau2)*np.exp(-gamma*t)*(t-tau2)*( erf( (tau2-etaalpha)/(np.sqrt(2.)*sigma_p)) - erf( (tau1-etaalpha)/(np.sqrt(2.)*sigma_p))  ) # Zero term (unique term)
+	np.subtract(t[active], tau2, out=work)
+	work *= derf_tau2_etaalpha
+	np.greater(t[active], tau2, out=mask)
+	work *= mask
+	term += work # Zero term (unique term)
+	term *= decay
+	term *= sigma_gas_0*constants["K0_gorro"]
+	sol_gauss[active] += term
 
 	# Combine all the terms
-	sol_gauss = mx1a*np.sqrt(np.pi*0.5)*sigma_p*CIa*AG*nuL*sol_gauss# Multiply by the constants (including nuL)
+	sol_gauss *= mx1a*np.sqrt(np.pi*0.5)*sigma_p*CIa*AG*nuL# Multiply by the constants (including nuL)
 	# ------------------------------------------------------------------------
 
 
@@ -1036,13 +1701,13 @@ def SolveChemEvolModel_GaussianTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CI
 
 
 # SolveChemEvolModel_ExponentialTerm -------------------------------------------------------------------------------
-def SolveChemEvolModel_ExponentialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2, mx1a):
+def SolveChemEvolModel_ExponentialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE, tauD, tau1, tau2, mx1a, constants=None):
 	'''
 	Returns the part of the solution that corresponds to the Exponential DTD.
+	constants: output of _ExponentialTermConstants (computed here if not provided)
 	'''
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	N = len(tj)
-	assert(tau2>tau1), "tau2<=tau1"
+	assert(np.all(tau2>tau1)), "tau2<=tau1"
 	#-------------------------------------
 
 	#-------------------------------------
@@ -1050,35 +1715,86 @@ def SolveChemEvolModel_ExponentialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0,
 	gamma = alpha
 	inv_alpha = 1./alpha;
 	N = len(tj)
-	betaj = [gamma - 1./tauj[j] for j in range(N)]
+	if constants is None: constants = _ExponentialTermConstants(alpha, Aj, tauj, tauD, tau1, tau2)
+	betaj = constants["betaj"]
+	QD_tau1_alpha = constants["QD_tau1_alpha"]
+	QD_tau2_alpha = constants["QD_tau2_alpha"]
 	#-------------------------------------
 
 
 	# ------------------------------------------------------------------------
-	# 1) Non-Homogeneous non-trivial exponential term:
-	sol_expo = 0.;
+	# 1) Non-Homogeneous non-trivial exponential term, accumulated in place (the scratch arrays are reused for all the infalls).
+	# mint1=mint2=deltatj for deltatj<=tau1, where the terms vanish, so only the times after tj+tau1 are evaluated:
+	infall_args = [Aj[0], tauj[0], tj[0]] if N>0 else []
+	restrict = _is_sorted_1d(t) # Before the buffers (the comparison of the times allocates a temporary)
+	sol_expo, scratch, _ = _kernel_buffers(5, t, alpha, nuL, sigma_gas_0, CIa, AE, tauD, tau1, tau2, mx1a, *infall_args)
+	shared = _shared_buffers(3, t, alpha, *infall_args)
 	for j in range(N):
+		active, window, tail = _time_windows(t, tj[j]+tau1, tj[j]+tau2, restrict)
+		(mint1, mint2, term, work, aux) = scratch[(slice(None),)+active]
+		# deltatj and its functions alone are the same for all the DTD components:
+		(deltatj, QD_deltatj, decay) = shared[(slice(None),)+active]
 		# Time variable
-		deltatj = t - tj[j];
-		mint1 = deltatj*(deltatj<tau1) + tau1*(deltatj>=tau1)
-		mint2 = deltatj*(deltatj<tau2) + tau2*(deltatj>=tau2)
+		np.subtract(t[active], tj[j], out=deltatj)
+		np.minimum(deltatj, tau1, out=mint1)
+		np.minimum(deltatj, tau2, out=mint2)
 
-		if betaj[j]!=0:
+		if np.all(betaj[j]!=0):
 			# Case alpha!=1/tauj[j]
-			# From 0 to t:
-			##print("Normal case")
-			sol_expo += Aj[j]/betaj[j]*np.exp(-gamma*deltatj)*( QD(tau2, tauj[j], tauD)*(QD(deltatj, inv_alpha, tauj[j]) -QD(mint2, inv_alpha, tauj[j]) ) +QD(tau1, tauj[j], tauD)*( QD(mint1, inv_alpha, tauj[j])-QD(deltatj, inv_alpha, tauj[j]) ) + QD(tau2, inv_alpha, tauD)*( QD(mint2, inv_alpha, inv_alpha) - QD(deltatj, inv_alpha, inv_alpha)  )+QD(tau1, inv_alpha, tauD)*( QD(deltatj, inv_alpha, inv_alpha) - QD(mint1, inv_alpha, inv_alpha) )+PD(mint2, tauj[j], inv_alpha, tauD) - SD(mint2, inv_alpha, tauD) - PD(mint1, tauj[j], inv_alpha, tauD) + SD(mint1, inv_alpha, tauD)  );# Positive and negative terms
+			# From 0 to t (positive and negative terms):
+			QD(deltatj, inv_alpha, tauj[j], out=QD_deltatj, work=decay)
+			np.subtract(QD_deltatj, QD(mint2, inv_alpha, tauj[j], out=work, work=aux), out=term)
+			term *= constants["QD_tau2_tauj"][j]
+			QD(mint1, inv_alpha, tauj[j], out=work, work=aux)
+			work -= QD_deltatj
+			work *= constants["QD_tau1_tauj"][j]
+			term += work
+
+			QD(deltatj, inv_alpha, inv_alpha, out=QD_deltatj, work=decay)
+			QD(mint2, inv_alpha, inv_alpha, out=work, work=aux)
+			work -= QD_deltatj
+			work *= QD_tau2_alpha
+			term += work
+			np.subtract(QD_deltatj, QD(mint1, inv_alpha, inv_alpha, out=work, work=aux), out=work)
+			work *= QD_tau1_alpha
+			term += work
+
+			term += PD(mint2, tauj[j], inv_alpha, tauD, out=work, work=aux)
+			term -= SD(mint2, inv_alpha, tauD, out=work, work=aux)
+			term -= PD(mint1, tauj[j], inv_alpha, tauD, out=work, work=aux)
+			term += SD(mint1, inv_alpha, tauD, out=work, work=aux)
+
+			np.multiply(deltatj, -gamma, out=decay)
+			np.exp(decay, out=decay)
+			term *= decay
+			term *= Aj[j]/betaj[j]
 		else:
 			# Case alpha==1/tauj[j]
-			sol_expo += Aj[j]*np.exp(-deltatj/tauD)*(SD_gorro(deltatj-mint2, inv_alpha, tauD) - SD_gorro(deltatj-mint1, inv_alpha, tauD) )
-	#assert(),"Problemas"
+			term[...] = Aj[j]*(SD_gorro(deltatj-mint2, inv_alpha, tauD, decay=deltatj) - SD_gorro(deltatj-mint1, inv_alpha, tauD, decay=deltatj) )
+		sol_expo[active] += term
+
 	# Zero term. From 0 to t:
-	mint1 = t*(t<tau1) + tau1*(t>=tau1)
-	mint2 = t*(t<tau2) + tau2*(t>=tau2)
-	sol_expo += sigma_gas_0*np.exp(-gamma*t)*( QD(tau2, inv_alpha, tauD)*( QD(t, inv_alpha, inv_alpha)-QD(mint2, inv_alpha, inv_alpha) )- QD(tau1, inv_alpha, tauD)*( QD(t, inv_alpha, inv_alpha)-QD(mint1, inv_alpha, inv_alpha) ) + SD(mint2, inv_alpha, tauD) - SD(mint1, inv_alpha, tauD) ); # Positive and negative terms
+	active, window, tail = _time_windows(t, tau1, tau2, restrict)
+	(mint1, mint2, term, work, aux) = scratch[(slice(None),)+active]
+	(QD_t, decay) = shared[(slice(1, 3),)+active]
+	np.minimum(t[active], tau1, out=mint1)
+	np.minimum(t[active], tau2, out=mint2)
+	QD(t[active], inv_alpha, inv_alpha, out=QD_t, work=decay)
+	np.subtract(QD_t, QD(mint2, inv_alpha, inv_alpha, out=work, work=aux), out=term)
+	term *= QD_tau2_alpha
+	np.subtract(QD_t, QD(mint1, inv_alpha, inv_alpha, out=work, work=aux), out=work)
+	work *= QD_tau1_alpha
+	term -= work
+	term += SD(mint2, inv_alpha, tauD, out=work, work=aux)
+	term -= SD(mint1, inv_alpha, tauD, out=work, work=aux)
+	np.multiply(t[active], -gamma, out=decay)
+	np.exp(decay, out=decay)
+	term *= decay
+	term *= sigma_gas_0
+	sol_expo[active] += term
 
 	# Combine all the terms
-	sol_expo = mx1a*CIa*AE*nuL*sol_expo; # Multiply by the constants (including nuL)
+	sol_expo *= mx1a*CIa*AE*nuL; # Multiply by the constants (including nuL)
 	# ------------------------------------------------------------------------
 
 
@@ -1091,13 +1807,13 @@ def SolveChemEvolModel_ExponentialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0,
 
 
 # SolveChemEvolModel_InverseTerm -------------------------------------------------------------------------------
-def SolveChemEvolModel_InverseTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2, mx1a):
+def SolveChemEvolModel_InverseTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2, mx1a, constants=None):
 	'''
 	Returns the part of the solution that corresponds to the Inverse DTD.
+	constants: output of _InverseTermConstants (computed here if not provided)
 	'''
 	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	N = len(tj)
-	assert(tau2>tau1), "tau2<=tau1"
+	assert(np.all(tau2>tau1)), "tau2<=tau1"
 	#-------------------------------------
 
 	#-------------------------------------
@@ -1105,49 +1821,129 @@ def SolveChemEvolModel_InverseTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa
 	gamma = alpha
 	inv_alpha = 1./alpha;
 	N = len(tj)
-	betaj = [gamma - 1./tauj[j] for j in range(N)]
+	if constants is None: constants = _InverseTermConstants(alpha, Aj, tauj, tau0, tau1, tau2)
+	betaj = constants["betaj"]
+	expi_tau1_alpha = constants["expi_tau1_alpha"]
+	expi_tau2_alpha = constants["expi_tau2_alpha"]
 
 	#-------------------------------------
 
 	# tau0 shifts all the deltatj, tau1 and tau2
-	tau1_0 = tau1 - tau0;# We should not overwrite tau1 because it is used later
-	tau2_0 = tau2 - tau0;# We should not overwrite tau2 because it is used later
+	tau1_0 = constants["tau1_0"];# We should not overwrite tau1 because it is used later
+	tau2_0 = constants["tau2_0"];# We should not overwrite tau2 because it is used later
 	#-------------------------------------
 
 
 	# ------------------------------------------------------------------------
-	# 1) Non-Homogeneous non-trivial inverse term:
-
-	sol_inv = 0.;
+	# 1) Non-Homogeneous non-trivial inverse term, accumulated in place (the scratch arrays are reused for all the infalls).
+	# Only the times after tj+tau1 are evaluated, and the expi are only evaluated before tj+tau2 (see _time_windows):
+	infall_args = [Aj[0], tauj[0], tj[0]] if N>0 else []
+	restrict = _is_sorted_1d(t) # Before the buffers (the comparison of the times allocates a temporary)
+	sol_inv, scratch, masks = _kernel_buffers(6, t, alpha, nuL, sigma_gas_0, CIa, AI, tauI, tau0, tau1, tau2, mx1a, *infall_args)
+	shared = _shared_buffers(1, t, alpha, *infall_args)
 	for j in range(N):
+		active, window, tail = _time_windows(t, tj[j]+tau1, tj[j]+tau2, restrict)
+		(deltatj, mint2, expi_alpha_mint2, term, work, aux), (mask, expi_mask) = scratch[(slice(None),)+active], masks[(slice(None),)+active]
+		# Exponentials of t-tj, the same for all the DTD components (the shift by tau0 is a constant factor)
+		growth = shared[(0,)+active]
 		# Time variables
-		deltatj = t - tj[j]-tau0;# Shift induced by tau0:
-		mint2 = deltatj*(deltatj<tau2_0) + tau2_0*(deltatj>=tau2_0)# Already have the shift in tau0 (because of deltatj, tau2_0)
+		np.subtract(t[active], tj[j], out=deltatj)
+		deltatj -= tau0 # Shift induced by tau0
+		np.minimum(deltatj, tau2_0, out=mint2)# Already have the shift in tau0 (because of deltatj, tau2_0)
 
-		if betaj[j]!=0:
+		if np.all(betaj[j]!=0):
 			# Case alpha!=1/tauj[j]
 			inv_betaj = 1./betaj[j]
-			# From 0 to tau2:
-			sol_inv += Aj[j]*np.power(inv_betaj, 2.)*heaviside(deltatj-tau1_0)*np.exp(-gamma*deltatj)*(np.exp(betaj[j]*mint2)*_safeexpi(mint2/tauj[j])-_safeexpi(gamma*mint2)+_safeexpi(gamma*tau1_0)-_safeexpi(tau1_0/tauj[j])*np.exp(betaj[j]*deltatj)  )# Positive term
-			sol_inv -= Aj[j]*inv_betaj*heaviside(deltatj-tau1_0)*np.exp(-gamma*deltatj)*(mint2*_safeexpi(alpha*mint2)-tau1_0*_safeexpi(alpha*tau1_0) -1./alpha*(np.exp(alpha*mint2)-np.exp(alpha*tau1_0)) -_safeexpi(alpha*tau1_0)*(deltatj-tau1_0) )# Negative term
+			np.subtract(t[active], tj[j], out=growth)
+			growth *= betaj[j]
+			np.exp(growth, out=growth)
+			growth_tau0 = np.exp(-betaj[j]*tau0) # exp(betaj*deltatj) = growth*growth_tau0
+			np.multiply(alpha, mint2, out=expi_alpha_mint2)
+			_safeexpi(expi_alpha_mint2[window], out=expi_alpha_mint2[window], mask=expi_mask[window])
+			if tail is not None: expi_alpha_mint2[tail] = expi_tau2_alpha
+			# From 0 to tau2. Positive term (with an extra 1/betaj):
+			np.divide(mint2, tauj[j], out=term)
+			_safeexpi(term[window], out=term[window], mask=expi_mask[window])
+			if tail is not None: term[tail] = constants["expi_tau2_tauj"][j]
+			np.multiply(mint2, betaj[j], out=work)
+			np.exp(work, out=work)
+			term *= work
+			term -= expi_alpha_mint2
+			term += expi_tau1_alpha
+			np.multiply(growth, growth_tau0*constants["expi_tau1_tauj"][j], out=work)
+			term -= work
+			term *= inv_betaj
+			# Negative term:
+			np.multiply(mint2, expi_alpha_mint2, out=work)
+			work -= tau1_0*expi_tau1_alpha
+			np.multiply(alpha, mint2, out=aux)
+			np.exp(aux, out=aux)
+			aux -= np.exp(alpha*tau1_0)
+			aux *= 1./alpha
+			work -= aux
+			np.subtract(deltatj, tau1_0, out=aux)
+			aux *= expi_tau1_alpha
+			work -= aux
+			term -= work
+			np.greater(deltatj, tau1_0, out=mask)# heaviside(deltatj-tau1_0)
+			term *= mask
 
 			# From tau2 to t:
-			sol_inv += Aj[j]*np.power(inv_betaj,2.)*heaviside(deltatj-tau2_0)*np.exp(-gamma*deltatj)*_safeexpi(tau2_0/tauj[j])*(np.exp(betaj[j]*deltatj)-np.exp(betaj[j]*tau2_0) ); # Positive (unique term)
-			sol_inv -= Aj[j]*inv_betaj*heaviside(deltatj-tau2_0)*np.exp(-gamma*deltatj)*_safeexpi(alpha*tau2_0)*( deltatj-tau2_0 ) # Negative (unique term)
+			np.multiply(growth, growth_tau0, out=work)
+			work -= np.exp(betaj[j]*tau2_0)
+			work *= constants["expi_tau2_tauj"][j]*inv_betaj # Positive (unique term)
+			np.subtract(deltatj, tau2_0, out=aux)
+			aux *= expi_tau2_alpha
+			work -= aux # Negative (unique term)
+			np.greater(deltatj, tau2_0, out=mask)# heaviside(deltatj-tau2_0)
+			work *= mask
+			term += work
+
+			decay = growth # growth is no longer needed, so its array is reused
+			np.subtract(t[active], tj[j], out=decay)
+			decay *= -gamma
+			np.exp(decay, out=decay)
+			term *= decay
+			term *= Aj[j]*inv_betaj*np.exp(gamma*tau0)
 		else:
 			# Case alpha==1/tauj[j]
-			sol_inv += Aj[j]*np.exp(-alpha*deltatj)*heaviside( deltatj-tau1_0)*(0.5*(mint2**2)*_safeexpi(alpha*mint2) -0.5*(deltatj**2)*_safeexpi(alpha*tau1_0) + 0.5*(inv_alpha**2)*(np.exp(alpha*tau1_0) - np.exp(alpha*mint2) ) + 0.5*inv_alpha*(tau1_0*np.exp(alpha*tau1_0) - mint2*np.exp(alpha*mint2) ) + inv_alpha*(deltatj-tau1_0)*np.exp(alpha*tau1_0) + heaviside(deltatj-tau2_0)*( 0.5*_safeexpi(alpha*tau2_0)*(deltatj**2-tau2_0**2) - inv_alpha*(deltatj-tau2_0)*np.exp(alpha*tau2_0) ))# Unique term
+			term[...] = Aj[j]*np.exp(-alpha*deltatj)*heaviside( deltatj-tau1_0)*(0.5*(mint2**2)*_safeexpi(alpha*mint2) -0.5*(deltatj**2)*_safeexpi(alpha*tau1_0) + 0.5*(inv_alpha**2)*(np.exp(alpha*tau1_0) - np.exp(alpha*mint2) ) + 0.5*inv_alpha*(tau1_0*np.exp(alpha*tau1_0) - mint2*np.exp(alpha*mint2) ) + inv_alpha*(deltatj-tau1_0)*np.exp(alpha*tau1_0) + heaviside(deltatj-tau2_0)*( 0.5*_safeexpi(alpha*tau2_0)*(deltatj**2-tau2_0**2) - inv_alpha*(deltatj-tau2_0)*np.exp(alpha*tau2_0) ))# Unique term
+		sol_inv[active] += term
 
 	# Zero term.
-	deltatj = t - tau0;
-	mint2 = deltatj*(deltatj<tau2_0) + tau2_0*(deltatj>=tau2_0)
+	active, window, tail = _time_windows(t, tau1, tau2, restrict)
+	(deltatj, mint2, term, work), (mask, expi_mask) = scratch[(slice(0, 4),)+active], masks[(slice(None),)+active]
+	decay = shared[(0,)+active]
+	np.subtract(t[active], tau0, out=deltatj)
+	np.minimum(deltatj, tau2_0, out=mint2)
 	#	From 0 to tau2
-	sol_inv += sigma_gas_0*heaviside(deltatj-tau1_0)*np.exp(-gamma*deltatj)*(mint2*_safeexpi(alpha*mint2)-1./alpha*(np.exp(alpha*mint2)-np.exp(alpha*tau1_0)) -_safeexpi(alpha*tau1_0)*deltatj )# Zero term
+	np.multiply(alpha, mint2, out=term)
+	_safeexpi(term[window], out=term[window], mask=expi_mask[window])
+	if tail is not None: term[tail] = expi_tau2_alpha
+	term *= mint2
+	np.multiply(alpha, mint2, out=work)
+	np.exp(work, out=work)
+	work -= np.exp(alpha*tau1_0)
+	work *= 1./alpha
+	term -= work
+	np.multiply(deltatj, expi_tau1_alpha, out=work)
+	term -= work
+	np.greater(deltatj, tau1_0, out=mask)
+	term *= mask
 
 	# 	From tau2 to t:
-	sol_inv += sigma_gas_0*heaviside(deltatj-tau2_0)*np.exp(-gamma*deltatj)*_safeexpi(alpha*tau2_0)*( deltatj-tau2_0 ) # Zero term (unique term)
-	
-	sol_inv = mx1a*CIa*AI*tauI*nuL*sol_inv# Multiply by the constants (including nuL)
+	np.subtract(deltatj, tau2_0, out=work)
+	work *= expi_tau2_alpha
+	np.greater(deltatj, tau2_0, out=mask)
+	work *= mask
+	term += work # Zero term (unique term)
+	np.multiply(t[active], -gamma, out=decay)
+	np.exp(decay, out=decay)
+	term *= decay
+	term *= sigma_gas_0*np.exp(gamma*tau0)
+	sol_inv[active] += term
+
+	sol_inv *= mx1a*CIa*AI*tauI*nuL# Multiply by the constants (including nuL)
 	# ------------------------------------------------------------------------
 
 	return( sol_inv )
@@ -1168,7 +1964,7 @@ def SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sig
 	# Useful definitions
 	gamma = alpha
 	N = len(tj)
-	betaj = [gamma - 1./tauj[j] for j in range(N)]
+	betaj = [_betaj(gamma, tauj[j]) for j in range(N)]
 	#-------------------------------------
 
 
@@ -1177,7 +1973,7 @@ def SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sig
 	sol_nht = 0.;
 	for j in range(N):
 		deltatj = t - tj[j]
-		if betaj[j]!=0:
+		if np.all(betaj[j]!=0):
 			inv_betaj = 1./betaj[j];
 			sol_nht += Aj[j]*np.power(inv_betaj,2.)*(np.exp(-deltatj/tauj[j])-np.exp(-gamma*deltatj) )*heaviside(deltatj); # For positive j
 			sol_nht +=-Aj[j]*inv_betaj*np.exp(-gamma*deltatj)*deltatj*heaviside(deltatj)# For negative j
@@ -1195,9 +1991,65 @@ def SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sig
 # -------------------------# End of SolveChemEvolModel_InhomogeneousTrivialTerm -------------------------------------------------
 
 
+# SolveChemEvolModel_Bases --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Bases(t, chemdict, dtype=np.float64):
+	'''Returns the element-independent bases of the solution:
+	(homo, ira, typeIa) = SolveChemEvolModel_Bases(t, chemdict)
+
+	The solution is linear in sigmaX_0, yx and mx1a, so that:
+	sigma_X = sigmaX_0*homo + yx*ira + mx1a*typeIa
+	
+	homo: Homogeneous solution for sigmaX_0=1
+	ira: Non-homogeneous trivial (IRA) term for yx=1
+	typeIa: Sum of all the DTD terms (Gaussian, Exponential, Inverse) for mx1a=1
+	The keys "sigmaX_0", "yx" and "mx1a" of chemdict are not used.
+	dtype: precision of the kernels (np.float64 or np.float32, see ChemModel)'''
+	return( ChemModel(chemdict, dtype=dtype).bases(t) )
+# -------------------------# End of SolveChemEvolModel_Bases -------------------------------------------------
+
+
+# SolveChemEvolModel_LinearBases --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_LinearBases(t, chemdict):
+	'''Returns the bases of all the terms of the solution that are linear in sigmaX_0, yx, mx1a and CIa:
+	bases = SolveChemEvolModel_LinearBases(t, chemdict)
+	sigmaX = SolveChemEvolModel_FromLinearBases(bases, sigmaX_0, yx, mx1a, CIa)
+
+	bases: array with shape (5,)+t.shape. The rows are:
+	0: Homogeneous solution for sigmaX_0=1
+	1: Non-homogeneous trivial (IRA) term for yx=1
+	2, 3, 4: Gaussian, Exponential and Inverse DTD terms for mx1a=1 and CIa=1
+	so that sigma_X = sigmaX_0*bases[0] + yx*bases[1] + mx1a*CIa*(bases[2]+bases[3]+bases[4]).
+	Once the bases are computed, changing any of these four coefficients (e.g. in a yield
+	calibration, or after a new Get_CIa) is a dot product over the cached arrays.
+	The keys "sigmaX_0", "yx", "mx1a" and "CIa" of chemdict are not used.'''
+	chemdict = chemdict.copy()
+	chemdict["CIa"] = chemdict.get("CIa", 1.)
+	return( ChemModel(chemdict).linear_bases(t) )
+# -------------------------# End of SolveChemEvolModel_LinearBases -------------------------------------------------
+
+
+# SolveChemEvolModel_FromLinearBases --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_FromLinearBases(bases, sigmaX_0, yx, mx1a, CIa):
+	'''sigma_X from the output of SolveChemEvolModel_LinearBases:
+	sigmaX = SolveChemEvolModel_FromLinearBases(bases, sigmaX_0, yx, mx1a, CIa)
+
+	The coefficients may be arrays (broadcast between them). Then, the output has shape
+	coefficients.shape + t.shape, e.g. one row per value of CIa.'''
+	return( np.tensordot(_linear_coefficients(sigmaX_0, yx, mx1a, CIa), bases, axes=(0, 0)) )
+# -------------------------# End of SolveChemEvolModel_FromLinearBases -------------------------------------------------
+
+
 # SolveChemEvolModel --------------------------------------------------------------------------------------------------
-def SolveChemEvolModel(t, chemdict):
+def SolveChemEvolModel(t, chemdict, jacobian=False, dense_output=False, dtype=np.float64):
 	'''
+	Returns sigma_X(t). When jacobian is True, returns (sigma_X, jacobian), where jacobian is a dictionary with the
+	derivatives of sigma_X with respect to the parameters (see ChemModel.sigma_jacobian).
+	When dense_output is True, returns (sigma_X, dense), where dense is a callable with piecewise Chebyshev expansions of
+	sigma_X, psi and R1a in [0, max(t)] (see ChemDenseOutput), so it can be evaluated cheaply at many other times.
+	dtype: np.float64 (reference) or np.float32 (throughput mode, for large grids). See ChemModel and the README
+	for the errors of the float32 mode. The Jacobians and the dense output are only computed in float64: with another dtype,
+	jacobian=True or dense_output=True raise a ValueError.
+	Parameters of chemdict:
 	"sigmaX_0"
 	"omega"
 	"yx"
@@ -1220,138 +2072,1365 @@ def SolveChemEvolModel(t, chemdict):
 	"tau1"
 	"tau2"
 	'''
-	# Check if the chemdict parameters are correct:
-	chemdict = prepare_chemdict( chemdict );
-	# Extract the parameters common for all the DTDs:
-	sigmaX_0 = chemdict["sigmaX_0"]
+	assert(not (jacobian and dense_output)), "ERROR: jacobian and dense_output can not be used together"
+	if jacobian: return( ChemModel(chemdict, dtype=dtype).sigma_jacobian(t) )
+	if dense_output:
+		model = ChemModel(chemdict, dtype=dtype)
+		return( model.sigma(t), model.dense_output(np.max(t), t_min=min(0., np.min(t))) )
+
+	# Element-independent bases:
+	aux_homo, aux_nht, aux_typeIa = SolveChemEvolModel_Bases(t, chemdict, dtype=dtype)
+
+	# Global exact solution:
+	sigmaX_0, yx, mx1a = [np.asarray(chemdict[name], dtype=dtype) for name in ("sigmaX_0", "yx", "mx1a")]
+	sigmaX_exact = sigmaX_0*aux_homo + yx*aux_nht + mx1a*aux_typeIa
+	return( sigmaX_exact )
+# -------------------------# End of SolveChemEvolModel -------------------------------------------------
+
+
+# SolveChemEvolModel_Blocks --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Blocks(t, chemdict, block_size=2**16):
+	'''Generator of the solution on consecutive blocks of a 1D time array:
+	for (t_block, sigma_block) in SolveChemEvolModel_Blocks(t, chemdict): ...
+
+	Only one block of block_size times is evaluated at once, so the peak memory does not depend
+	on len(t) (t may be a memory-mapped array). The model is compiled once (see ChemModel).'''
+	return( ChemModel(chemdict).sigma_blocks(t, block_size) )
+# -------------------------# End of SolveChemEvolModel_Blocks -------------------------------------------------
+
+
+# SolveChemEvolModel_Streaming --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Streaming(t, chemdict, out=None, block_size=2**16):
+	'''Same as SolveChemEvolModel for a 1D time array, evaluated by blocks and written into an output buffer:
+	sigmaX = SolveChemEvolModel_Streaming(t, chemdict, out="sigma.npy")
+
+	out: None (a new array), an array with shape (len(t),) (e.g. a np.memmap), or the name of a .npy file,
+	     which is created as a memory-mapped array.
+	With a memory-mapped out (a np.memmap or a .npy file name), the peak memory is set by block_size, and not by
+	len(t) (see SolveChemEvolModel_Blocks). With out=None the whole output array is allocated in memory.
+
+	returns: out'''
+	if out is None:
+		out = np.empty(len(t))
+	elif isinstance(out, str):
+		out = np.lib.format.open_memmap(out, mode="w+", dtype=np.float64, shape=(len(t),))
+	assert(out.shape==(len(t),)), "ERROR: out must have shape (len(t),)"
+
+	start = 0
+	for (t_block, sigma_block) in SolveChemEvolModel_Blocks(t, chemdict, block_size):
+		out[start:start+len(t_block)] = sigma_block
+		start += len(t_block)
+	if isinstance(out, np.memmap): out.flush()
+	return( out )
+# -------------------------# End of SolveChemEvolModel_Streaming -------------------------------------------------
+
+
+# SolveChemEvolModel_Rate --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Rate(t, chemdict, sigmaX=None):
+	'''Time derivative of sigma_X, from the right-hand side of the model equation:
+	d sigma_X/dt = -alpha*sigma_X + yx*(1-R)*psi + mx1a*R1a
+
+	sigmaX: sigma_X(t), if already computed (e.g. by SolveChemEvolModel). Otherwise, it is computed here.'''
+	return( ChemModel(chemdict).sigma_rate(t, sigmaX=sigmaX) )
+# -------------------------# End of SolveChemEvolModel_Rate -------------------------------------------------
+
+
+# SolveChemEvolModel_Unique --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Unique(t, chemdict, tolerance=0.):
+	'''Same as SolveChemEvolModel, evaluated only once per distinct time (e.g. stellar ages of a catalogue):
+	sigmaX = SolveChemEvolModel_Unique(t, chemdict, tolerance=0.)
+
+	The distinct times are sorted, so the kernels also skip the inactive time windows. With tolerance>0, the times
+	are rounded to multiples of tolerance before merging them (see _unique_times). See ChemModel.unique'''
+	return( ChemModel(chemdict).unique("sigma", t, tolerance) )
+# -------------------------# End of SolveChemEvolModel_Unique -------------------------------------------------
+
+
+# SolveChemEvolModel_numeric --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_numeric(t, chemdict, tol=1e-8, order=10, chunk_size=4096):
+	'''Numeric reference solution of the chemical evolution equation
+	dsigma_X/dt = -alpha*sigma_X + yx*(1-R)*psi(t) + mx1a*R1a(t)
+	sigmaX = SolveChemEvolModel_numeric(t, chemdict, tol=1e-8)
+
+	Integrating the equation with the factor exp(alpha*t) and swapping the order of the integrals of the R1a term:
+	sigma_X(t) = sigmaX_0*exp(-alpha*t) + yx*(1-R)*Phi(t) + mx1a*CIa*int_0^t DTD(tau)*Phi(t-tau) dtau
+	with Phi(u) = int_0^u exp(-alpha*(u-v))*psi(v) dv.
+	Both integrals are computed with AdaptiveGaussQuadrature (Phi with relative tolerance tol/10), seeded with
+	the DTD breakpoints and the kinks at t-tj. None of the analytic terms is used, so it can be used to
+	validate SolveChemEvolModel. Phi is evaluated in blocks of chunk_size nodes to bound the memory usage.'''
+	chemdict = prepare_chemdict( chemdict )
+
+	# Extract the values of the parameters:
 	omega = chemdict["omega"];
 	yx = chemdict["yx"];
 	R = chemdict["R"];
 	nuL = chemdict["nuL"];
-	tauj = chemdict["tauj"]
-	tj = chemdict["tj"];
-	Aj = chemdict["Aj"]
-	sigma_gas_0 = chemdict["sigma_gas_0"]
-	#-------------------------------------
-	# DTD constants
 	mx1a = chemdict["mx1a"]
+	sigmaX_0 = chemdict["sigmaX_0"]
 	CIa = chemdict["CIa"]
-	#-------------------------------------
-	# Gaussian DTD parameters
-	AG_arr = chemdict.get("AG", [])	
-	sigma_p_arr = chemdict["sigma_p"]
-	taup_arr = chemdict["taup"]
-	tau1G_arr = chemdict["tau1G"]
-	tau2G_arr = chemdict["tau2G"]
-	# Exponential DTD parameters
-	AE_arr = chemdict.get("AE", [])
-	tauD_arr = chemdict["tauD"]
-	tau1E_arr = chemdict["tau1E"]
-	tau2E_arr = chemdict["tau2E"]
-	# Inverse DTD parameters
-	AI_arr = chemdict.get("AI", [])
-	tauI_arr = chemdict.get("tauI", len(AI_arr)*[1.]) # Since it is degenerated with Ai, we set it to one by default
-	tau0_arr = chemdict["tau0"]
-	tau1I_arr = chemdict["tau1I"]
-	tau2I_arr = chemdict["tau2I"]
-	# Get the number of Gaussian, Expo. and 1/t DTD terms
-	Ng, Ne, Ni = len(AG_arr), len(AE_arr), len(AI_arr)
-	#-------------------------------------
-	# Safety checks:
-	assert(len(tauj)==len(tj)), "tj, tauj lengths mismatch"
-	assert(len(Aj)==len(tj)), "tj, Aj lengths mismatch"
-	assert( (len(sigma_p_arr)==Ng) and  (len(taup_arr)==Ng) and (len(tau1G_arr)==Ng) and (len(tau2G_arr)==Ng)), "Dimensions of Gaussian DTD parameters mismatch"
-	assert( (len(tauD_arr)==Ne) and  (len(tau1E_arr)==Ne) and (len(tau2E_arr)==Ne) ), "Dimensions of Exponential DTD parameters mismatch"
-	assert( (len(tauI_arr)==Ni) and  (len(tau0_arr)==Ni) and  (len(tau1I_arr)==Ni) and (len(tau2I_arr)==Ni) ), "Dimensions of 1/t DTD parameters mismatch"
-	#-------------------------------------
-
-	# Useful definitions
+	tj = np.asarray(chemdict["tj"], dtype=np.float64)
 	alpha = (1.+omega-R)*nuL
-	# ----------------------------------------------------------------
-
-	#			ANALYTIC SOLUTION
 
-	# ---------------------------------------------------------------
+	t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+
+	def _Phi(u):
+		# Convolution of psi with exp(-alpha*u), with kinks at tj
+		u_flat = np.maximum(u.ravel(), 0.)
+		Phi = np.zeros(len(u_flat))
+		for start in range(0, len(u_flat), chunk_size):
+			u_now = u_flat[start:start+chunk_size]
+			integrand = lambda rows, v: np.exp(-alpha*(u_now[rows,None]-v))*Get_psi(v, chemdict)
+			Phi[start:start+chunk_size] = AdaptiveGaussQuadrature(integrand, np.zeros(len(u_now)), u_now, tj, rtol=0.1*tol, order=order)[0]
+		return(Phi.reshape(u.shape))
+
+	# Type Ia term, with the same breakpoints as R1a(t):
+	DTD_breakpoints = _DTD_breakpoints(chemdict)
+	breakpoints = np.concatenate([np.broadcast_to(DTD_breakpoints, (len(t), len(DTD_breakpoints))), t[:,None]-tj[None,:]], axis=1)
+	integrand = lambda rows, tau: Get_DTD_arr(tau, chemdict)*_Phi(t[rows,None]-tau)
+	typeIa = CIa*AdaptiveGaussQuadrature(integrand, np.zeros(len(t)), np.maximum(t, 0.), breakpoints, rtol=tol, order=order)[0]
+
+	sigmaX = sigmaX_0*np.exp(-alpha*t) + yx*(1.-R)*_Phi(t) + mx1a*typeIa
+	return(sigmaX)
+# -------------------------# End of SolveChemEvolModel_numeric -------------------------------------------------
+
+
+# SolveChemEvolModel_FFT --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_FFT(t, chemdict, DTD=None, dt=None, n_grid=2**16):
+	'''Solution of the chemical evolution equation for an arbitrary (tabulated) DTD:
+	sigmaX = SolveChemEvolModel_FFT(t, chemdict, DTD=None, dt=None, n_grid=2**16)
+
+	R1a is computed on a uniform grid by a FFT convolution (see R1a_FFT for DTD, dt and n_grid). Then, the Type Ia
+	term int_0^t exp(-alpha*(t-s))*R1a(s) ds is integrated exactly for R1a linear in each cell (the recurrence
+	between the cells is a first-order linear filter), and evaluated at t from the previous grid node.
+	The homogeneous and IRA terms are analytic. It costs O(n log n) for the n cells in [0, max(t)], so new DTDs
+	can be tested without fitting them with Gaussian, Exponential and 1/t components, and it is an independent
+	check of those fits.'''
+	chemdict = prepare_chemdict( chemdict.copy() )
+	omega, R, nuL = chemdict["omega"], chemdict["R"], chemdict["nuL"]
+	tauj, tj, Aj = chemdict["tauj"], chemdict["tj"], chemdict["Aj"]
+	sigma_gas_0 = chemdict["sigma_gas_0"]
+	alpha = (1.+omega-R)*nuL
+	t = np.asarray(t, dtype=np.float64)
+
+	def _integrals(s):
+		# int_0^s exp(-alpha*(s-u))*(1, u) du (a Taylor series avoids the cancellation for small alpha*s)
+		x = alpha*s
+		first = -np.expm1(-x)/alpha
+		with np.errstate(divide="ignore", invalid="ignore"):
+			second = np.where(x<1e-3, s*s*(0.5 - x/6. + x*x/24. - x**3/120.), (s-first)/alpha)
+		return( first, second )
+
+	# Type Ia term on the grid, from y_n = exp(-alpha*dt)*y_{n-1} + w0*R1a_n + w1*R1a_{n-1}:
+	dt, R1a = _R1a_FFT_grid(np.max(t, initial=0.), chemdict, DTD, dt, n_grid)
+	first, second = _integrals(dt)
+	typeIa_grid = lfilter([second/dt, first-second/dt], [1., -np.exp(-alpha*dt)], R1a)
+
+	# From the previous node to t:
+	n = np.clip(np.floor(t/dt).astype(int), 0, len(R1a)-2)
+	s = np.maximum(t-n*dt, 0.)
+	first, second = _integrals(s)
+	typeIa = np.exp(-alpha*s)*typeIa_grid[n] + R1a[n]*first + (R1a[n+1]-R1a[n])/dt*second
+	typeIa = np.where(t>0, typeIa, 0.)
+
+	homo = np.exp(-alpha*t)
+	ira = SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, 1., R)
+	return( chemdict["sigmaX_0"]*homo + chemdict["yx"]*ira + chemdict["mx1a"]*typeIa )
+# -------------------------# End of SolveChemEvolModel_FFT -------------------------------------------------
+
+
+# SolveChemEvolModel_MultiElement --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_MultiElement(t, chemdict, yx=None, mx1a=None, sigmaX_0=0., elements=None):
+	'''Solves the model for several elements (or yield sets) at once:
+	sigmaX = SolveChemEvolModel_MultiElement(t, chemdict, yx, mx1a, sigmaX_0=0.)
+	sigmaX = SolveChemEvolModel_MultiElement(t, chemdict, elements=["Fe", "O", "Si"])
+
+	The element-independent bases are computed only once (see SolveChemEvolModel_Bases).
+	yx, mx1a: arrays of yields (one value per element)
+	sigmaX_0: initial density of each element (float or array)
+	elements: list of element names in Element_yields. Overrides yx and mx1a.
+
+	returns: array with shape (n_elements, n_times)'''
+	if elements is not None:
+		yx = [Element_yields[element.lower()][0] for element in elements]
+		mx1a = [Element_yields[element.lower()][1] for element in elements]
+	assert((yx is not None) and (mx1a is not None)), "ERROR: yx and mx1a (or elements) are required"
+	yx = np.atleast_1d(np.asarray(yx, dtype=float))
+	mx1a = np.atleast_1d(np.asarray(mx1a, dtype=float))
+	sigmaX_0 = np.asarray(sigmaX_0, dtype=float) + np.zeros_like(yx)
+	assert(len(yx)==len(mx1a)), "yx, mx1a lengths mismatch"
+	assert(len(sigmaX_0)==len(yx)), "sigmaX_0, yx lengths mismatch"
+
+	# Element-independent bases:
+	aux_homo, aux_nht, aux_typeIa = SolveChemEvolModel_Bases(t, chemdict)
+
+	# Combine the bases for every element:
+	sigmaX = np.multiply.outer(sigmaX_0, aux_homo) + np.multiply.outer(yx, aux_nht) + np.multiply.outer(mx1a, aux_typeIa)
+	return( sigmaX )
+# -------------------------# End of SolveChemEvolModel_MultiElement -------------------------------------------------
+
+
+# SolveChemEvolModel_Batch --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Batch(t, batchdict):
+	'''Solves K models (parameter sets) at once:
+	sigmaX = SolveChemEvolModel_Batch(t, batchdict)
+
+	batchdict has the same keys as the chemical dictionary, in structure-of-arrays format:
+	- Scalar parameters ("omega", "nuL", "CIa", ...): float (shared) or array with shape (K,)
+	- Infall and DTD parameters ("tauj", "Aj", "AG", ...): 1D array (shared) or array with shape (K, n_infalls) or (K, n_components)
+	All the parameter sets must have the same number of infalls and DTD components.
+	The terms are evaluated on a (K, n_times) grid, without a Python loop over the parameter sets.
+
+	returns: array with shape (K, n_times)'''
+	t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+	K, batchdict = _prepare_batchdict(batchdict)
+
+	# The special case tauj==1/alpha is solved separately for each parameter set:
+	alpha = (1.+batchdict["omega"]-batchdict["R"])*batchdict["nuL"]
+	special = np.any(_betaj(alpha, batchdict["tauj"])==0, axis=0)[:,0]
+
+	sigmaX = np.zeros((K, len(t)))
+	if not np.all(special):
+		sigmaX[~special] = _SolveChemEvolModel_Batch(t, _batch_subset(batchdict, ~special))
+	for k in np.flatnonzero(special):
+		sigmaX[k] = SolveChemEvolModel(t, _batch_row_chemdict(batchdict, k))
+	return( sigmaX )
+# -------------------------# End of SolveChemEvolModel_Batch -------------------------------------------------
+
+
+# _SolveChemEvolModel_Batch --------------------------------------------------------------------------------------------------
+def _SolveChemEvolModel_Batch(t, batchdict):
+	'''Evaluates SolveChemEvolModel_Batch for parameter sets without the special case tauj==1/alpha.
+	batchdict: output of _prepare_batchdict'''
+	homo, ira, typeIa = _batch_regular_bases(t, batchdict)
+	return( batchdict["sigmaX_0"]*homo + batchdict["yx"]*ira + batchdict["mx1a"]*typeIa )
+# -------------------------# End of _SolveChemEvolModel_Batch -------------------------------------------------
+
+
+# _batch_regular_bases --------------------------------------------------------------------------------------------------
+def _batch_regular_bases(t, batchdict):
+	'''Element-independent bases (homo, ira, typeIa) of parameter sets without the special case tauj==1/alpha
+	(as SolveChemEvolModel_Bases), each with shape (K, n_times).
+	batchdict: output of _prepare_batchdict'''
+	# Extract the parameters. Scalars have shape (K, 1); infall and DTD parameters (n, K, 1)
+	omega, R, nuL = batchdict["omega"], batchdict["R"], batchdict["nuL"]
+	tauj, tj, Aj, sigma_gas_0 = batchdict["tauj"], batchdict["tj"], batchdict["Aj"], batchdict["sigma_gas_0"]
+	CIa = batchdict["CIa"]
 
+	# Useful definitions
+	alpha = (1.+omega-R)*nuL
 
-	#print("Analytical solution...")
-	# ------------------------------------------------------------------------
-	# 1) Homogeneous solution term
-	aux_homo = sigmaX_0*np.exp(-alpha*t)
-	# ------------------------------------------------------------------------
-	# 2) Non-Homogeneous trivial term:
-	aux_nht = SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, yx, R)
-	# ------------------------------------------------------------------------
-	# 3) Non-Homogeneous non-trivial gaussian term:
-	aux_nhg = 0.; # Initial value
-	for i in range(Ng):
-		aux_nhg += SolveChemEvolModel_GaussianTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AG_arr[i], taup_arr[i], sigma_p_arr[i], tau1G_arr[i], tau2G_arr[i], mx1a)
-	# ------------------------------------------------------------------------
+	# 1) Homogeneous solution term (sigmaX_0=1)
+	homo = np.exp(-alpha*t)
+	# 2) Non-Homogeneous trivial term (yx=1):
+	ira = SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, 1., R)
+	# 3) Non-Homogeneous non-trivial gaussian term (mx1a=1):
+	typeIa = np.zeros_like(homo)
+	for i in range(len(batchdict["AG"])):
+		typeIa += SolveChemEvolModel_GaussianTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, batchdict["AG"][i], batchdict["taup"][i], batchdict["sigma_p"][i], batchdict["tau1G"][i], batchdict["tau2G"][i], 1.)
 	# 4) Non-Homogeneous non-trivial exponential term:
-	aux_nhe = 0.; # Initial value
-	for i in range(Ne):
-		aux_nhe += SolveChemEvolModel_ExponentialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AE_arr[i], tauD_arr[i], tau1E_arr[i], tau2E_arr[i], mx1a)
-	# ------------------------------------------------------------------------
+	for i in range(len(batchdict["AE"])):
+		typeIa += SolveChemEvolModel_ExponentialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, batchdict["AE"][i], batchdict["tauD"][i], batchdict["tau1E"][i], batchdict["tau2E"][i], 1.)
 	# 5) Non-Homogeneous non-trivial inverse term:
-	aux_nhi = 0.; # Initial value
-	for i in range(Ni):
-		aux_nhi += SolveChemEvolModel_InverseTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, AI_arr[i], tauI_arr[i], tau0_arr[i], tau1I_arr[i], tau2I_arr[i], mx1a)
+	for i in range(len(batchdict["AI"])):
+		typeIa += SolveChemEvolModel_InverseTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, batchdict["AI"][i], batchdict["tauI"][i], batchdict["tau0"][i], batchdict["tau1I"][i], batchdict["tau2I"][i], 1.)
+	return( homo, ira, typeIa )
+# -------------------------# End of _batch_regular_bases -------------------------------------------------
+
+
+# _batch_bases --------------------------------------------------------------------------------------------------
+def _batch_bases(t, K, batchdict):
+	'''Bases of SolveChemEvolModel_Bases and gas density psi/nuL of K parameter sets, each with shape (K, n_times):
+	(homo, ira, typeIa, sigma_gas) = _batch_bases(t, K, batchdict)
+	batchdict: output of _prepare_batchdict. The special case tauj==1/alpha is solved separately for each parameter set.'''
+	t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+	alpha = (1.+batchdict["omega"]-batchdict["R"])*batchdict["nuL"]
+	special = np.any(_betaj(alpha, batchdict["tauj"])==0, axis=0)[:,0]
+
+	bases = np.zeros((4, K, len(t)))
+	if not np.all(special):
+		regular = _batch_subset(batchdict, ~special)
+		bases[:3,~special] = _batch_regular_bases(t, regular)
+		bases[3,~special] = Get_psi(t, regular)/regular["nuL"]
+	for k in np.flatnonzero(special):
+		model = ChemModel(_batch_row_chemdict(batchdict, k))
+		bases[:3,k] = model.bases(t)
+		bases[3,k] = model.psi(t)/model.nuL
+	return( tuple(bases) )
+# -------------------------# End of _batch_bases -------------------------------------------------
+
+
+# Get_psi_Batch --------------------------------------------------------------------------------------------------
+def Get_psi_Batch(t, batchdict):
+	'''SFR of K models (parameter sets) at once:
+	psi = Get_psi_Batch(t, batchdict)
+	See SolveChemEvolModel_Batch for the format of batchdict.
+
+	returns: array with shape (K, n_times)'''
+	t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+	K, batchdict = _prepare_batchdict(batchdict)
+
+	# The special case tauj==1/alpha is solved separately for each parameter set:
+	alpha = (1.+batchdict["omega"]-batchdict["R"])*batchdict["nuL"]
+	special = np.any(_betaj(alpha, batchdict["tauj"])==0, axis=0)[:,0]
+
+	psi = np.zeros((K, len(t)))
+	if not np.all(special):
+		psi[~special] = Get_psi(t, _batch_subset(batchdict, ~special))
+	for k in np.flatnonzero(special):
+		psi[k] = Get_psi(t, _batch_row_chemdict(batchdict, k))
+	return( psi )
+# -------------------------# End of Get_psi_Batch -------------------------------------------------
+
+
+# FromSigmaToAbundance_Batch --------------------------------------------------------------------------------------------------
+def FromSigmaToAbundance_Batch(t, sigmaX, batchdict):
+	'''[X/H] of K models (parameter sets) at once, from the output of SolveChemEvolModel_Batch:
+	abundance = FromSigmaToAbundance_Batch(t, sigmaX, batchdict)
+
+	returns: array with shape (K, n_times)'''
+	K, prepared = _prepare_batchdict(batchdict)
+	sigma_gas = Get_psi_Batch(t, batchdict)/prepared["nuL"];
+	abundance = _safelog10(sigmaX, sigma_gas)
+	return(abundance)
+# -------------------------# End of FromSigmaToAbundance_Batch -------------------------------------------------
+
+
+# SolveChemEvolModel_Grid --------------------------------------------------------------------------------------------------
+def SolveChemEvolModel_Grid(t, axes, chemdict, loader=None, chunk_size=512, processes=None, output=None, resume=True):
+	'''Solves the models of a grid (Cartesian product of parameter axes) with a pool of processes:
+	sigmaX = SolveChemEvolModel_Grid(t, axes, chemdict, loader=[Load_MR01_dict, Load_S05_dict])
+
+	axes: dictionary {name: values} with the parameters that change along the grid, in the order of the
+	      axes of the output. Scalar parameters ("omega", "nuL", ...): 1D arrays. Infall and DTD parameters
+	      ("tauj", "Aj", "AG", ...): 2D arrays with one row per value, e.g. {"tauj": [[0.5, 7.], [1., 7.]]}.
+	chemdict: fixed parameters of the models (those not included in axes). Not modified.
+	loader: None (the DTD is given in chemdict), a DTD loader (e.g. Load_MR01_dict) or a list of loaders.
+	      A list adds a first axis to the grid (the DTD choice). Each loader is applied once, to a copy of chemdict.
+	chunk_size: number of models per task. Each task is solved with SolveChemEvolModel_Batch.
+	processes: number of processes (default: all the cores). With processes=1, the grid is solved in this process.
+	output: None (the output is kept in memory) or the name of a .npy file, which is filled as the tasks finish
+	      (memory-mapped). Then, a second file (output+".done.npy") records the finished chunks, and with
+	      resume=True an interrupted grid is completed by solving only the missing chunks.
+
+	The infalls must be sorted by tj in all the models. The tasks only contain the DTD index and the range
+	of (flat) model indices: the time array, the axes and the prepared fixed parameters are sent once to
+	each process.
+
+	returns: array (or memmap) with shape (n_loaders,)*(loader is a list) + (len(values) for each axis) + (n_times,)'''
+	t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+
+	# Fixed parameters of each DTD (prepared once):
+	loaders = loader if isinstance(loader, (list, tuple)) else [loader]
+	base_dicts = []
+	for function in loaders:
+		base = {name: value for name, value in chemdict.items() if name not in axes}
+		if function is not None: base = function(base)
+		for name in axes: base[name] = np.asarray(axes[name], dtype=np.float64)[0] # Placeholder, for the checks
+		base = prepare_chemdict(base)
+		base_dicts.append({name: np.asarray(value, dtype=np.float64) for name, value in base.items()})
+
+	# Axes of the grid:
+	names = list(axes)
+	values = [np.asarray(axes[name], dtype=np.float64) for name in names]
+	for name, value in zip(names, values): assert(value.ndim in [1, 2]), "ERROR: the values of the axis %s must be a 1D or a 2D array"%name
+	grid_shape = tuple(len(value) for value in values)
+	n_models = int(np.prod(grid_shape))
+	n_chunks = -(-n_models//chunk_size)
+	output_shape = (len(loaders),)*isinstance(loader, (list, tuple)) + grid_shape + (len(t),)
+
+	# Output and record of the finished chunks:
+	if output is None:
+		sigmaX = np.zeros(output_shape)
+		done = np.zeros((len(loaders), n_chunks), dtype=bool)
+	else:
+		done_file = output + ".done.npy"
+		if resume and os.path.exists(output) and os.path.exists(done_file):
+			sigmaX = np.lib.format.open_memmap(output, mode="r+")
+			done = np.lib.format.open_memmap(done_file, mode="r+")
+			assert(sigmaX.shape==output_shape) and (done.shape==(len(loaders), n_chunks)), "ERROR: the grid in %s does not match (use resume=False to overwrite it)"%output
+		else:
+			sigmaX = np.lib.format.open_memmap(output, mode="w+", dtype=np.float64, shape=output_shape)
+			done = np.lib.format.open_memmap(done_file, mode="w+", dtype=bool, shape=(len(loaders), n_chunks))
+	flat = sigmaX.reshape(len(loaders), n_models, len(t)) # A view (also for memmaps)
+
+	tasks = [(d, c*chunk_size, min((c+1)*chunk_size, n_models)) for d in range(len(loaders)) for c in range(n_chunks) if not done[d, c]]
+	state = (t, names, values, grid_shape, base_dicts)
+	if processes==1:
+		_grid_initializer(state)
+		results = map(_grid_chunk, tasks)
+	else:
+		pool = multiprocessing.Pool(processes, initializer=_grid_initializer, initargs=(state,))
+		results = pool.imap_unordered(_grid_chunk, tasks)
+	try:
+		for (d, start, stop), sigma_chunk in results:
+			flat[d, start:stop] = sigma_chunk
+			if output is not None: sigmaX.flush() # The chunk is saved before being marked as done
+			done[d, start//chunk_size] = True
+			if output is not None: done.flush()
+	finally:
+		if processes!=1:
+			pool.terminate()
+			pool.join()
+	return( sigmaX )
+# -------------------------# End of SolveChemEvolModel_Grid -------------------------------------------------
+
+
+# _grid_initializer --------------------------------------------------------------------------------------------------
+_grid_state = None
+def _grid_initializer(state):
+	'''Stores the data shared by all the tasks of SolveChemEvolModel_Grid in the (worker) process'''
+	global _grid_state
+	_grid_state = state
+# -------------------------# End of _grid_initializer -------------------------------------------------
+
+
+# _grid_chunk --------------------------------------------------------------------------------------------------
+def _grid_chunk(task):
+	'''Solves the models start:stop (flat indices of the grid) with the DTD d. task = (d, start, stop)'''
+	(d, start, stop) = task
+	t, names, values, grid_shape, base_dicts = _grid_state
+	index = np.unravel_index(np.arange(start, stop), grid_shape)
+	batchdict = base_dicts[d].copy()
+	for name, value, idx in zip(names, values, index): batchdict[name] = value[idx]
+	return( task, SolveChemEvolModel_Batch(t, batchdict) )
+# -------------------------# End of _grid_chunk -------------------------------------------------
 
-	# Global exact solution:
-	sigmaX_exact = aux_homo + aux_nht + aux_nhg + aux_nhe + aux_nhi
-	return( sigmaX_exact )
-# -------------------------# End of SolveChemEvolModel -------------------------------------------------
 
 
 
 # ChemicalSolutionVerifier --------------------------------------------------------------------------
-def ChemicalSolutionVerifier(t, chemdict):
+def ChemicalSolutionVerifier(t, chemdict, method="gradient", step=1e-3, full_output=False):
 	'''Evaluates the difference between the numerical evaluation of the dsigma/dt term and the left-hand side term of the equation.
-	ChemicalSolutionVerifier(t, chemdict)
-	t: time (at least four values are required)'''
+	ChemicalSolutionVerifier(t, chemdict, method="gradient")
+	t: time (at least four values are required). The output corresponds to the sorted times.
+	method: "gradient": np.gradient of sigma_X on the nodes t. The first and last nodes, and the nodes at both sides of each tj are nan (ill-defined gradient).
+	        "stencil": fourth-order central finite difference (five-point stencil) around each node, with a step h (at most step) reduced
+	        so that the stencil never crosses a breakpoint of the solution (tj, and tj+tau1, tj+tau2 of each DTD component, see
+	        _abundance_breakpoints). The nodes on a breakpoint are nan. It is still a finite-difference check: the derivative has a
+	        truncation error O(h**4*|d^5 sigma_X/dt^5|) plus a round-off error ~1e-13*sigma_X/h, much smaller than with "gradient", but not zero.
+	The model is compiled once (see ChemModel), and sigma_X, psi and R1a are evaluated with it.
+	full_output: also returns the sorted times and the scale of the right-hand side, |alpha*sigma_X|+|yx*(1-R)*psi|+|mx1a*R1a|, at each node'''
 	assert(len(t)>3), "ERROR: More time nodes are needed"
+	assert(method in ["gradient", "stencil"]), "ERROR: method must be gradient or stencil"
 
-	chemdict = prepare_chemdict( chemdict );
+	model = ChemModel(chemdict)
 	# Sort the time array:
-	t = np.sort(t);
-
-	# Extract the values of the parameters:
-	omega = chemdict["omega"];
-	yx = chemdict["yx"];
-	R = chemdict["R"];
-	nuL = chemdict["nuL"];
-	mx1a = chemdict["mx1a"]
-	#-------------------------------------
-
-	# Compute the SFR(t) and the TypeIa SNe rate
-	psi_function = Get_psi(t, chemdict);
-	R1a_function = R1a_analytic(t, chemdict);
+	t = np.sort(np.asarray(t, dtype=np.float64).ravel());
+
+	if method=="gradient":
+		sigmaX = model.sigma(t)
+		# Compute the num. derivative
+		left_hand = np.gradient(sigmaX,t)
+		# Mask the initial and the last points because the numerical gradient is worse:
+		left_hand[[0, -1]] = np.nan;
+		# Mask also the nodes at both sides of tj (ill-defined gradient): t[n]<=tj<t[n+1]
+		tj = model.tj[(model.tj>=t[0]) & (model.tj<=t[-1])]
+		n = np.searchsorted(t, tj, side="right")-1
+		n = n[n<len(t)-1]
+		left_hand[n] = np.nan
+		left_hand[n+1] = np.nan
+	else:
+		# Distance to the nearest breakpoint (t=0 included) and step of each node:
+		breakpoints = np.concatenate([[-np.inf], _abundance_breakpoints(model.chemdict, -np.inf, np.inf), [np.inf]])
+		k = np.searchsorted(breakpoints, t)
+		distance = np.minimum(t-breakpoints[k-1], breakpoints[k]-t)
+		h = np.minimum(step, 0.25*distance) # The stencil (+-2h) stays at distance/2 from the breakpoints
+		nodes = t + np.multiply.outer([0., -2., -1., 1., 2.], h)
+		sigma_nodes = model.unique("sigma", nodes) # One sorted evaluation for the nodes and the stencils
+		sigmaX = sigma_nodes[0]
+		with np.errstate(divide="ignore", invalid="ignore"):
+			left_hand = (sigma_nodes[1] - 8.*sigma_nodes[2] + 8.*sigma_nodes[3] - sigma_nodes[4])/(12.*h)
+		left_hand[h<=0] = np.nan
 
-	# Solve the Equation
-	sigmaX = SolveChemEvolModel(t, chemdict);
 	# Compute the right-hand side of the equation
-	right_hand = -nuL*sigmaX*(1.+omega-R) + yx*(1.-R)*psi_function + mx1a*R1a_function;
-	# Compute the num. derivative
-	left_hand = np.gradient(sigmaX,t)
-
-	# Mask the initial point because the numerical gradient is worse:
-	left_hand[0] = np.nan;
-	# Mask also the nodes at both sides of tj (ill-defined gradient)
-	tj = chemdict["tj"];
-	for k in range(len(tj)):
-		if (tj[k]<t[0]) or (tj[k]>t[-1]): continue;#tj unused
-		n = 0;
-		while(n<(len(t)-1)):
-			if (t[n]<=tj[k]) and (tj[k]<t[n+1]):
-				left_hand[n:n+2] = np.nan
-				break;
-			n = n+1;
-	# Mask the last point because the numerical gradient is worse:
-	left_hand[-1] = np.nan;
+	psi_term = model.yx*(1.-model.R)*model.psi(t)
+	R1a_term = model.mx1a*model.r1a(t)
+	right_hand = -model.alpha*sigmaX + psi_term + R1a_term;
+	if full_output: return( left_hand-right_hand, t, np.abs(model.alpha*sigmaX)+np.abs(psi_term)+np.abs(R1a_term) )
 	return(left_hand-right_hand);
 #--------------------------ChemicalSolutionVerifier-----------------------------------
 
 
+# Fuzz_ChemicalSolutions --------------------------------------------------------------------------
+def Fuzz_ChemicalSolutions(n_models=1000, seed=0, families=("gaussian", "exponential", "inverse"), n_infalls=3, n_times=256, t_max=14., special_cases=True, processes=None, chunk_size=50, n_worst=10):
+	'''Checks the analytic solution for random (but numerically reasonable) models, as RandomTester.py:
+	report = Fuzz_ChemicalSolutions(n_models=1000, seed=0)
+
+	Each model has n_infalls infalls and one DTD component of a random family, and it is checked with
+	ChemicalSolutionVerifier(method="stencil") on n_times nodes between 0 and t_max. The error of a model is
+	max|left-hand - right-hand|/max(scale of the right-hand side) over the nodes.
+	special_cases: some models have tauj[0]=1/alpha (a quarter of them) or, for the exponential DTD, tauD=tauj[0] (half of them)
+	seed: the model k only depends on (seed, k) (see _fuzz_chemdict), so the report does not depend on processes or chunk_size.
+	processes: number of processes (default: all the cores). With processes=1, the models are checked in this process.
+
+	returns: dictionary with "errors" (array with shape (n_models,)), "families" (array with the DTD family of each model),
+	    and "worst": list of the n_worst largest errors, as dictionaries with "index", "error", "family" and "chemdict"'''
+	settings = (seed, tuple(families), n_infalls, n_times, t_max, special_cases)
+	tasks = [(settings, start, min(start+chunk_size, n_models)) for start in range(0, n_models, chunk_size)]
+	errors = np.zeros(n_models)
+	if processes==1:
+		results = map(_fuzz_chunk, tasks)
+	else:
+		pool = multiprocessing.Pool(processes)
+		results = pool.imap_unordered(_fuzz_chunk, tasks)
+	try:
+		for (_, start, stop), chunk_errors in results:
+			errors[start:stop] = chunk_errors
+	finally:
+		if processes!=1:
+			pool.terminate()
+			pool.join()
+
+	model_families = np.array([_fuzz_chemdict(settings, k)[1] for k in range(n_models)])
+	worst = []
+	for k in np.argsort(-np.nan_to_num(errors, nan=np.inf))[:n_worst]:
+		chemdict, family = _fuzz_chemdict(settings, k)
+		worst.append({"index": int(k), "error": errors[k], "family": family, "chemdict": chemdict})
+	return( {"errors": errors, "families": model_families, "worst": worst} )
+# -------------------------# End of Fuzz_ChemicalSolutions -------------------------------------------------
+
+
+# _fuzz_chemdict --------------------------------------------------------------------------
+def _fuzz_chemdict(settings, k):
+	'''Random model k of Fuzz_ChemicalSolutions (same distributions as RandomTester.py): (chemdict, family)
+	settings = (seed, families, n_infalls, n_times, t_max, special_cases)'''
+	(seed, families, n_infalls, n_times, t_max, special_cases) = settings
+	rng = np.random.default_rng([seed, k])
+
+	# Generate random model parameters:
+	chemdict = dict()
+	for name in ["sigmaX_0", "omega", "yx", "R", "nuL", "sigma_gas_0", "CIa", "mx1a"]: chemdict[name] = rng.random()
+	chemdict["tauj"] = 0.2 + 10*rng.random(n_infalls)
+	chemdict["tj"] = np.sort(t_max*rng.random(n_infalls))
+	chemdict["Aj"] = rng.random(n_infalls)
+	if special_cases and (rng.random()<0.25): chemdict["tauj"][0] = 1./((1.+chemdict["omega"]-chemdict["R"])*chemdict["nuL"]) # Case alpha==1/tauj
+
+	family = families[rng.integers(len(families))]
+	if family=="gaussian":
+		chemdict["AG"] = rng.random()
+		chemdict["taup"] = rng.random()
+		chemdict["sigma_p"] = 0.01+rng.random()# Avoid numerical instabilities due to small numerators
+		chemdict["tau1G"] = 0.1+5*rng.random()
+		chemdict["tau2G"] = chemdict["tau1G"] + 5*rng.random()
+	elif family=="exponential":
+		chemdict["AE"] = rng.random()
+		chemdict["tauD"] = chemdict["tauj"][0] if (special_cases and rng.random()<0.5) else rng.random() # Case tauD==tauj
+		chemdict["tau1E"] = 0.1+5*rng.random()
+		chemdict["tau2E"] = chemdict["tau1E"] + 5*rng.random()
+	else:
+		chemdict["tauI"] = rng.random()
+		chemdict["AI"] = rng.random()
+		chemdict["tau1I"] = 0.1+5*rng.random()
+		chemdict["tau2I"] = chemdict["tau1I"] + (t_max-chemdict["tau1I"])*rng.random()
+		chemdict["tau0"] = 0.8*chemdict["tau1I"]*rng.random()# Tau0 between 0 and tau1
+	return( chemdict, family )
+# -------------------------# End of _fuzz_chemdict -------------------------------------------------
+
+
+# _fuzz_chunk --------------------------------------------------------------------------
+def _fuzz_chunk(task):
+	'''Errors of the models start:stop of Fuzz_ChemicalSolutions. task = (settings, start, stop)'''
+	(settings, start, stop) = task
+	t = np.linspace(0., settings[4], settings[3])
+	errors = np.zeros(stop-start)
+	with contextlib.redirect_stdout(io.StringIO()): # The kernels report the special cases
+		for k in range(start, stop):
+			difference, _, scale = ChemicalSolutionVerifier(t, _fuzz_chemdict(settings, k)[0], method="stencil", full_output=True)
+			errors[k-start] = np.nanmax(np.abs(difference))/np.max(scale)
+	return( task, errors )
+# -------------------------# End of _fuzz_chunk -------------------------------------------------
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#
+# 				 COMPILED MODEL
+#
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# ChemModel --------------------------------------------------------------------------
+class ChemModel:
+	'''Chemical evolution model compiled from a chemical dictionary:
+	model = ChemModel(chemdict, dtype=np.float64)
+
+	The dictionary is checked (prepare_chemdict) and its parameters are frozen into float64
+	arrays only once. All the time-independent constants of each (DTD component, infall) pair
+	are also computed here, so evaluating the model on a new time grid only pays for the
+	time-dependent work:
+
+	model.sigma(t): sigma_X(t) (as SolveChemEvolModel)
+	model.sigma_blocks(t): generator of (t_block, sigma_block) (as SolveChemEvolModel_Blocks)
+	model.bases(t): (homo, ira, typeIa) bases of sigma_X (as SolveChemEvolModel_Bases)
+	model.linear_bases(t): bases with the Type Ia term split per DTD family (as SolveChemEvolModel_LinearBases)
+	model.psi(t): SFR (as Get_psi)
+	model.ipsi(t): stellar mass formed from t=0 (as Get_ipsi)
+	model.r1a(t): TypeIa SNe rate (as R1a_analytic)
+	model.abundance(t): [X/H] (as FromSigmaToAbundance)
+	model.sigma_rate(t): d sigma_X/dt (as SolveChemEvolModel_Rate)
+	model.sigma_jacobian(t), model.r1a_jacobian(t): value and derivatives with respect to the parameters
+	model.unique("sigma", t): any of the above, evaluated once per distinct time (as SolveChemEvolModel_Unique)
+	model.dense_output(t_max): piecewise Chebyshev expansions of sigma, psi and r1a (see ChemDenseOutput)
+
+	The components of each DTD family are stacked into column arrays (n_components, 1), so each
+	family is evaluated by a single call of its kernel over a (n_components, n_times) broadcast
+	(the loop over the infalls remains inside the kernels). The times are processed in blocks of
+	max_elements/n_components values to cap the peak memory.
+
+	dtype: precision of the time-dependent arrays of sigma, bases, linear_bases, psi, r1a and abundance (see _check_dtype).
+	With np.float32, the times and the outputs are float32, and the parameters and constants of the Gaussian and
+	Inverse terms (computed in float64) are rounded to float32 once, so their kernels move half the memory. The
+	Exponential terms are evaluated in float64 from the float32 times. The errors of this mode are measured by
+	Benchmark.py --precision (see the README). The Jacobians, ipsi and dense_output are computed in float64.
+
+	The input dictionary is not modified. Build a new ChemModel if the parameters change.'''
+
+	# Names of the key parameters
+	_fields_gauss = ["AG", "sigma_p", "taup", "tau1G", "tau2G"]
+	_fields_exp = ["AE", "tauD", "tau1E", "tau2E"]
+	_fields_inv = ["AI", "tauI", "tau0", "tau1I", "tau2I"]
+	_fields_infall = ["tj", "Aj", "tauj"]
+	_linear_terms = ("homo", "ira", "gaussian", "exponential", "inverse") # Rows of linear_bases
+	max_elements = 2**16 # Maximum size of the (n_components, n_times) blocks (small enough to stay in cache)
+
+	def __init__(self, chemdict, dtype=np.float64):
+		chemdict = prepare_chemdict( chemdict.copy() )
+		self.dtype = _check_dtype(dtype)
+
+		# Freeze the parameters into read-only contiguous arrays:
+		for name in self._fields_gauss + self._fields_exp + self._fields_inv + self._fields_infall:
+			chemdict[name] = _frozen_array(chemdict[name])
+		self.chemdict = chemdict
+
+		# Parameters common for all the DTDs:
+		self.omega = float(chemdict["omega"])
+		self.R = float(chemdict["R"])
+		self.nuL = float(chemdict["nuL"])
+		self.sigma_gas_0 = float(chemdict["sigma_gas_0"])
+		self.tauj, self.tj, self.Aj = chemdict["tauj"], chemdict["tj"], chemdict["Aj"]
+		self.CIa = float(chemdict["CIa"])
+		# Element parameters (optional: they are only needed by sigma and abundance)
+		self.sigmaX_0 = chemdict.get("sigmaX_0", None)
+		self.yx = chemdict.get("yx", None)
+		self.mx1a = chemdict.get("mx1a", None)
+
+		# Safety checks:
+		assert(len(self.tauj)==len(self.tj)), "tj, tauj lengths mismatch"
+		assert(len(self.Aj)==len(self.tj)), "tj, Aj lengths mismatch"
+
+		# Useful definitions
+		self.alpha = (1.+self.omega-self.R)*self.nuL
+		alpha, Aj, tauj = self.alpha, self.Aj, self.tauj
+
+		# Infall parameters with shape (n_infalls, 1, 1), so that tj[j] broadcasts with the component columns:
+		self.infall_args = tuple(x[:,None,None] for x in (Aj, tauj, self.tj))
+		Aj_c, tauj_c, tj_c = self.infall_args
+
+		# Parameters (as columns) and time-independent constants of each DTD family:
+		self.gaussian_terms, self.exponential_terms, self.inverse_terms = self._compile_terms(alpha, Aj_c, tauj_c)
+		if self.dtype!=np.float64:
+			# The Exponential terms stay in float64: their kernels cancel large exponentials, which loses up to 3e-2
+			# (relative) in float32 (see Benchmark.py --precision), and they only evaluate exp (cheap in float64).
+			cast = lambda x: np.asarray(x, dtype=self.dtype)
+			cast_terms = lambda terms: tuple(cast(x) for x in terms[:-1]) + ({name: cast(value) for name, value in terms[-1].items()},)
+			self.gaussian_terms, self.inverse_terms = cast_terms(self.gaussian_terms), cast_terms(self.inverse_terms)
+
+	# -------------------------------------------------------------------
+	def _compile_terms(self, alpha, Aj_c, tauj_c, unit_amplitudes=False):
+		'''(gaussian_terms, exponential_terms, inverse_terms): parameters (as columns) and constants of each DTD family.
+		unit_amplitudes: AG, AE and AI are replaced by ones (to get the terms of each component, see _family_rows)'''
+		columns = lambda fields: [self.chemdict[name][:,None] for name in fields]
+		amplitude = lambda A: np.ones_like(A) if unit_amplitudes else A
+		(AG, sigma_p, taup, tau1, tau2) = columns(self._fields_gauss)
+		gaussian_terms = (amplitude(AG), taup, sigma_p, tau1, tau2, _GaussianTermConstants(alpha, Aj_c, tauj_c, taup, sigma_p, tau1, tau2))
+		(AE, tauD, tau1, tau2) = columns(self._fields_exp)
+		exponential_terms = (amplitude(AE), tauD, tau1, tau2, _ExponentialTermConstants(alpha, Aj_c, tauj_c, tauD, tau1, tau2))
+		(AI, tauI, tau0, tau1, tau2) = columns(self._fields_inv)
+		inverse_terms = (amplitude(AI), tauI, tau0, tau1, tau2, _InverseTermConstants(alpha, Aj_c, tauj_c, tau0, tau1, tau2))
+		return( gaussian_terms, exponential_terms, inverse_terms )
+
+	# -------------------------------------------------------------------
+	def _family(self, kernel, terms, t, *extra, CIa=None):
+		'''Sum over the components of a DTD family: kernel(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, CIa, *params, *extra, constants=constants)
+		CIa: by default, the CIa of the model. The infall parameters are cast to the dtype of the family parameters (see ChemModel)'''
+		params, constants = terms[:-1], terms[-1]
+		Aj_c, tauj_c, tj_c = [x.astype(params[0].dtype, copy=False) for x in self.infall_args]
+		if CIa is None: CIa = self.CIa
+		t = np.asarray(t, dtype=self.dtype)
+		function = lambda t_block: kernel(t_block, self.alpha, self.nuL, Aj_c, tauj_c, tj_c, self.sigma_gas_0, CIa, *(params+extra), constants=constants)
+		return( _sum_over_components(function, t, len(params[0]), self.max_elements) )
+
+	# -------------------------------------------------------------------
+	def linear_bases(self, t):
+		'''Bases of the terms of sigma_X that are linear in sigmaX_0, yx, mx1a and CIa. See SolveChemEvolModel_LinearBases'''
+		alpha, nuL, Aj, tauj, tj, sigma_gas_0 = self.alpha, self.nuL, self.Aj, self.tauj, self.tj, self.sigma_gas_0
+		t = np.asarray(t, dtype=self.dtype)
+
+		bases = np.empty((len(self._linear_terms),)+t.shape, dtype=self.dtype)
+		# 1) Homogeneous solution term (sigmaX_0=1)
+		bases[0] = np.exp(-alpha*t)
+		# 2) Non-Homogeneous trivial term (yx=1):
+		bases[1] = SolveChemEvolModel_InhomogeneousTrivialTerm(t, alpha, nuL, Aj, tauj, tj, sigma_gas_0, 1., self.R)
+		# 3-5) Non-Homogeneous non-trivial terms of each DTD family (mx1a=1, CIa=1):
+		bases[2] = self._family(SolveChemEvolModel_GaussianTerm, self.gaussian_terms, t, 1., CIa=1.)
+		bases[3] = self._family(SolveChemEvolModel_ExponentialTerm, self.exponential_terms, t, 1., CIa=1.)
+		bases[4] = self._family(SolveChemEvolModel_InverseTerm, self.inverse_terms, t, 1., CIa=1.)
+		return( bases )
+
+	# -------------------------------------------------------------------
+	def linear_coefficients(self, sigmaX_0=None, yx=None, mx1a=None, CIa=None):
+		'''Coefficients of linear_bases (those not provided are taken from the model). See _linear_coefficients'''
+		return( _linear_coefficients(self.sigmaX_0 if sigmaX_0 is None else sigmaX_0, self.yx if yx is None else yx, self.mx1a if mx1a is None else mx1a, self.CIa if CIa is None else CIa) )
+
+	# -------------------------------------------------------------------
+	def bases(self, t):
+		'''Element-independent bases (homo, ira, typeIa). See SolveChemEvolModel_Bases'''
+		aux_homo, aux_nht, aux_gauss, aux_expo, aux_inv = self.linear_bases(t)
+		return( aux_homo, aux_nht, self.CIa*(aux_gauss+aux_expo+aux_inv) )
+
+	# -------------------------------------------------------------------
+	def sigma(self, t):
+		'''sigma_X(t). See SolveChemEvolModel'''
+		assert((self.sigmaX_0 is not None) and (self.yx is not None) and (self.mx1a is not None)), "ERROR: sigmaX_0, yx and mx1a are required (see add_element)"
+		aux_homo, aux_nht, aux_typeIa = self.bases(t)
+		sigmaX_0, yx, mx1a = [np.asarray(x, dtype=self.dtype) for x in (self.sigmaX_0, self.yx, self.mx1a)]
+		return( sigmaX_0*aux_homo + yx*aux_nht + mx1a*aux_typeIa )
+
+	# -------------------------------------------------------------------
+	def sigma_blocks(self, t, block_size=2**16):
+		'''Generator of (t_block, sigma_block) pairs over a 1D time array. See SolveChemEvolModel_Blocks'''
+		assert(np.ndim(t)==1), "ERROR: t must be a 1D array"
+		for start in range(0, len(t), block_size):
+			t_block = np.array(t[start:start+block_size], dtype=np.float64) # Only this block is read (e.g. from a memmap)
+			yield( t_block, self.sigma(t_block) )
+
+	# -------------------------------------------------------------------
+	def psi(self, t):
+		'''SFR psi(t). See Get_psi'''
+		return( Get_psi(t, self.chemdict, dtype=self.dtype) )
+
+	# -------------------------------------------------------------------
+	def ipsi(self, t):
+		'''Primitive of psi(t), vanishing at t=0. See Get_ipsi'''
+		return( Get_ipsi(t, self.chemdict) )
+
+	# -------------------------------------------------------------------
+	def r1a(self, t, separated_terms=False):
+		'''TypeIa SNe rate. See R1a_analytic'''
+		R1a_g = self._family(R1a_analytic_gaussian, self.gaussian_terms, t)
+		R1a_e = self._family(R1a_analytic_exponential, self.exponential_terms, t)
+		R1a_i = self._family(R1a_analytic_inverse, self.inverse_terms, t)
+
+		# Prepare the output
+		if separated_terms:
+			return([R1a_g,R1a_e,R1a_i])
+		else:
+			return(R1a_g+R1a_e+R1a_i)
+
+	# -------------------------------------------------------------------
+	def abundance(self, t, sigmaX=None):
+		'''[X/H] at the time t. If sigmaX is not given, it is computed with self.sigma(t). See FromSigmaToAbundance'''
+		if sigmaX is None: sigmaX = self.sigma(t)
+		sigma_gas = self.psi(t)/self.nuL;
+		return( _safelog10(sigmaX, sigma_gas) )
+
+	# -------------------------------------------------------------------
+	def unique(self, method, t, tolerance=0.):
+		'''Evaluates getattr(self, method)(t) (e.g. "sigma", "psi", "r1a" or "abundance") only once per distinct time,
+		and scatters the result back to the shape of t (see _unique_times). The method must return an array with the shape of its times.'''
+		t_unique, inverse = _unique_times(t, tolerance)
+		return( getattr(self, method)(t_unique)[inverse].reshape(np.shape(t)) )
+
+	# -------------------------------------------------------------------
+	def dense_output(self, t_max, t_min=0., rtol=1e-10, atol=0., order=24, quantities=("sigma", "psi", "r1a"), max_panels=10000):
+		'''Piecewise Chebyshev expansions of the quantities (methods of the model) in [t_min, t_max]. See ChemDenseOutput
+		Only for float64 models: the adaptive fit would resolve the float32 round-off noise (ValueError otherwise).'''
+		if self.dtype!=np.float64: raise ValueError("ERROR: the dense output is only computed in float64 (the model has dtype %s)"%self.dtype.name)
+		return( ChemDenseOutput(self, t_max, t_min=t_min, rtol=rtol, atol=atol, order=order, quantities=quantities, max_panels=max_panels) )
+
+	# -------------------------------------------------------------------
+	def sigma_rate(self, t, sigmaX=None):
+		'''d sigma_X/dt from the right-hand side of the model equation (sigmaX: self.sigma(t) if not given). See SolveChemEvolModel_Rate'''
+		if sigmaX is None: sigmaX = self.sigma(t)
+		return( -self.alpha*sigmaX + self.yx*(1.-self.R)*self.psi(t) + self.mx1a*self.r1a(t) )
+
+	# -------------------------------------------------------------------
+	def _tangent_state(self):
+		'''alpha, sigma_gas_0, (Aj, tauj, tj) and the DTD terms (with unit amplitudes) carrying the derivatives (see _Dual)
+		with respect to the parameters of the gas evolution. Tangents: 0: alpha, 1: sigma_gas_0, 2 to N+1: tauj, N+2 to 2N+1: Aj'''
+		if self.dtype!=np.float64: raise ValueError("ERROR: the Jacobians are only computed in float64 (the model has dtype %s)"%self.dtype.name)
+		N = len(self.tj)
+		identity = np.eye(2+2*N)
+		alpha = _Dual(self.alpha, identity[0])
+		sigma_gas_0 = _Dual(self.sigma_gas_0, identity[1])
+		tauj = _Dual(self.tauj, identity[:,2:N+2])
+		Aj = _Dual(self.Aj, identity[:,N+2:])
+		infall_args = (Aj[:,None,None], tauj[:,None,None], self.tj[:,None,None])
+		return( alpha, sigma_gas_0, (Aj, tauj, self.tj), infall_args, self._compile_terms(alpha, *infall_args[:2], unit_amplitudes=True) )
+
+	# -------------------------------------------------------------------
+	def _family_rows(self, kernel, terms, t, alpha, sigma_gas_0, infall_args, *extra):
+		'''Terms of each component of a DTD family for unit amplitude and CIa=1, with their derivatives (see _tangent_state):
+		(value, derivatives), with shapes (n_components, n_times) and (n_tangents, n_components, n_times). t is 1D'''
+		params, constants = terms[:-1], terms[-1]
+		n_components, n_tangents = len(params[0]), len(alpha.der)
+		value, derivatives = np.zeros((n_components,)+t.shape), np.zeros((n_tangents, n_components)+t.shape)
+		block = max(1, self.max_elements//max(1, n_components*n_tangents))
+		for start in range(0, len(t)*(n_components>0), block):
+			rows = kernel(t[start:start+block], alpha, self.nuL, *infall_args, sigma_gas_0, 1., *(params+extra), constants=constants)
+			value[:,start:start+block], derivatives[:,:,start:start+block] = rows.val, rows.der
+		return( value, derivatives )
+
+	# -------------------------------------------------------------------
+	def _typeIa_jacobian(self, kernels, t, *extra):
+		'''Type Ia terms for CIa=1 (sum over all the DTD families, with their derivatives), and the rows of each
+		component (the derivatives with respect to AG, AE and AI) for the kernels of (gaussian, exponential, inverse)'''
+		alpha, sigma_gas_0, infall, infall_args, families = self._tangent_state()
+		total = _Dual(np.zeros(t.shape), np.zeros((len(alpha.der),)+t.shape))
+		amplitude_rows = dict()
+		for name, kernel, terms, own_terms in zip(("AG", "AE", "AI"), kernels, families, (self.gaussian_terms, self.exponential_terms, self.inverse_terms)):
+			value, derivatives = self._family_rows(kernel, terms, t, alpha, sigma_gas_0, infall_args, *extra)
+			amplitudes = own_terms[0][:,0]
+			total.val += amplitudes@value
+			total.der += np.tensordot(derivatives, amplitudes, axes=(1, 0))
+			amplitude_rows[name] = value
+		return( total, amplitude_rows, (alpha, sigma_gas_0, infall) )
+
+	# -------------------------------------------------------------------
+	def _gas_jacobian(self, jacobian, d_alpha, derivatives, shape):
+		'''Adds the derivatives with respect to omega, nuL (the part through alpha), R (the part through alpha), sigma_gas_0, tauj and Aj,
+		from the derivatives with respect to the tangents of _tangent_state (d_alpha: at fixed nuL)'''
+		N = len(self.tj)
+		jacobian["omega"] = self.nuL*d_alpha
+		jacobian["nuL"] = jacobian.get("nuL", 0.) + (1.+self.omega-self.R)*d_alpha
+		jacobian["R"] = jacobian.get("R", 0.) - self.nuL*d_alpha
+		jacobian["sigma_gas_0"] = derivatives[1]
+		jacobian["tauj"] = derivatives[2:N+2]
+		jacobian["Aj"] = derivatives[N+2:]
+		if np.any(_betaj(self.alpha, self.tauj)==0):
+			# The kernels use the limit alpha=1/tauj, whose derivatives do not hold for the derivatives with respect to alpha and tauj:
+			for name in ("omega", "nuL", "R", "tauj"): jacobian[name] = np.full(np.shape(jacobian[name]), np.nan)
+		return( {name: np.reshape(value, np.shape(value)[:-1]+shape) for name, value in jacobian.items()} )
+
+	# -------------------------------------------------------------------
+	def sigma_jacobian(self, t):
+		'''sigma_X(t) and its derivatives with respect to the parameters:
+		(sigmaX, jacobian) = model.sigma_jacobian(t)
+
+		jacobian: dictionary with the derivatives d sigma_X/d theta for theta in "sigmaX_0", "yx", "mx1a", "CIa", "omega", "nuL", "R"
+		and "sigma_gas_0" (arrays with the shape of t), and "tauj", "Aj", "AG", "AE", "AI" (one row per infall or DTD component).
+		The derivatives are computed by the analytic kernels alongside sigma_X (forward mode, see _Dual).
+		The derivatives with respect to omega, nuL, R and tauj are nan when alpha==1/tauj for some infall.'''
+		assert((self.sigmaX_0 is not None) and (self.yx is not None) and (self.mx1a is not None)), "ERROR: sigmaX_0, yx and mx1a are required (see add_element)"
+		t = np.asarray(t, dtype=np.float64)
+		t_flat = t.ravel()
+		kernels = (SolveChemEvolModel_GaussianTerm, SolveChemEvolModel_ExponentialTerm, SolveChemEvolModel_InverseTerm)
+		typeIa, amplitude_rows, (alpha, sigma_gas_0, (Aj, tauj, tj)) = self._typeIa_jacobian(kernels, t_flat, 1.)
+		homo = np.exp(-self.alpha*t_flat)
+		ira = SolveChemEvolModel_InhomogeneousTrivialTerm(t_flat, alpha, self.nuL, Aj, tauj, tj, sigma_gas_0, 1., 0.)# yx=1, R=0
+		sigmaX_0, yx, mx1a, CIa = self.sigmaX_0, self.yx, self.mx1a, self.CIa
+
+		# sigma_X and its derivatives (at fixed nuL) with respect to the tangents:
+		sigmaX = sigmaX_0*homo + yx*(1.-self.R)*ira.val + mx1a*CIa*typeIa.val
+		derivatives = yx*(1.-self.R)*ira.der + mx1a*CIa*typeIa.der
+		d_alpha = derivatives[0] - t_flat*sigmaX_0*homo
+		jacobian = dict()
+		jacobian["sigmaX_0"] = homo
+		jacobian["yx"] = (1.-self.R)*ira.val
+		jacobian["mx1a"] = CIa*typeIa.val
+		jacobian["CIa"] = mx1a*typeIa.val
+		for name, rows in amplitude_rows.items(): jacobian[name] = mx1a*CIa*rows
+		jacobian["nuL"] = (sigmaX - sigmaX_0*homo)/self.nuL # The inhomogeneous terms are proportional to nuL
+		jacobian["R"] = -yx*ira.val
+		return( sigmaX.reshape(t.shape), self._gas_jacobian(jacobian, d_alpha, derivatives, t.shape) )
+
+	# -------------------------------------------------------------------
+	def r1a_jacobian(self, t):
+		'''TypeIa SNe rate and its derivatives with respect to the parameters:
+		(R1a, jacobian) = model.r1a_jacobian(t)
+
+		jacobian: as in sigma_jacobian, with the keys "CIa", "omega", "nuL", "R", "sigma_gas_0", "tauj", "Aj", "AG", "AE" and "AI".'''
+		t = np.asarray(t, dtype=np.float64)
+		t_flat = t.ravel()
+		kernels = (R1a_analytic_gaussian, R1a_analytic_exponential, R1a_analytic_inverse)
+		typeIa, amplitude_rows, _ = self._typeIa_jacobian(kernels, t_flat)
+		R1a = self.CIa*typeIa.val
+		derivatives = self.CIa*typeIa.der
+		jacobian = dict()
+		jacobian["CIa"] = typeIa.val
+		for name, rows in amplitude_rows.items(): jacobian[name] = self.CIa*rows
+		jacobian["nuL"] = R1a/self.nuL # R1a is proportional to nuL
+		return( R1a.reshape(t.shape), self._gas_jacobian(jacobian, derivatives[0], derivatives, t.shape) )
+# ------------------------ End of ChemModel ----------------------
+
+
+
+# ChemDenseOutput --------------------------------------------------------------------------
+class ChemDenseOutput:
+	'''Dense output of a compiled model: piecewise Chebyshev expansions of sigma_X, psi and R1a in [t_min, t_max]
+	dense = ChemModel(chemdict).dense_output(t_max=13.8, rtol=1e-10)
+
+	dense(t), dense.sigma(t): sigma_X(t)
+	dense.psi(t): SFR
+	dense.r1a(t): TypeIa SNe rate
+	dense.abundance(t): [X/H] (from the expansions of sigma_X and psi)
+	dense.error: estimated maximum absolute error of each quantity
+	dense.n_evals: number of times where the model was evaluated to build the expansions
+
+	The interval is split at the times where the quantities are not smooth (the infall times tj, and tj+tau1, tj+tau2
+	of the DTD components, see _abundance_breakpoints) and each piece is bisected until the expansions of all the
+	quantities have an error below rtol times their maximum on it (see AdaptiveChebyshevFit). All the pieces are evaluated
+	with one call of the model per bisection level, and afterwards each time only costs a Clenshaw recurrence of the given
+	order (see ChebyshevEvaluate). The times outside [t_min, t_max] are evaluated with the model.
+	Near a zero of a quantity (e.g. sigma_X at t->0 when sigmaX_0=0), the error relative to its value is larger than rtol,
+	as that of the analytic solution itself.'''
+
+	def __init__(self, model, t_max, t_min=0., rtol=1e-10, atol=0., order=24, quantities=("sigma", "psi", "r1a"), max_panels=10000):
+		self.model = model
+		self.t_min, self.t_max = float(t_min), float(t_max)
+		self.quantities = tuple(quantities)
+		methods = [getattr(model, name) for name in self.quantities]
+		f = lambda x: np.stack([method(x) for method in methods])
+		breakpoints = _abundance_breakpoints(model.chemdict, self.t_min, self.t_max)
+		self.edges, coefficients, error, self.n_evals = AdaptiveChebyshevFit(f, self.t_min, self.t_max, breakpoints, rtol=rtol, atol=atol, order=order, max_panels=max_panels)
+		self.coefficients = dict(zip(self.quantities, coefficients))
+		self.error = dict(zip(self.quantities, error))
+
+	# -------------------------------------------------------------------
+	def _evaluate(self, name, t):
+		'''Expansion of the quantity at the times t (the model outside [t_min, t_max])'''
+		assert(name in self.coefficients), "ERROR: %s is not in the quantities of the dense output"%name
+		t = np.asarray(t, dtype=np.float64)
+		values = ChebyshevEvaluate(self.edges, self.coefficients[name], t)
+		outside = (t<self.t_min) | (t>self.t_max)
+		if np.any(outside): values[outside] = getattr(self.model, name)(t[outside])
+		return( values )
+
+	# -------------------------------------------------------------------
+	def __call__(self, t):
+		'''sigma_X(t)'''
+		return( self._evaluate("sigma", t) )
+
+	def sigma(self, t):
+		'''sigma_X(t). See ChemModel.sigma'''
+		return( self._evaluate("sigma", t) )
+
+	def psi(self, t):
+		'''SFR psi(t). See ChemModel.psi'''
+		return( self._evaluate("psi", t) )
+
+	def r1a(self, t):
+		'''TypeIa SNe rate. See ChemModel.r1a'''
+		return( self._evaluate("r1a", t) )
+
+	def abundance(self, t, sigmaX=None):
+		'''[X/H] at the time t. If sigmaX is not given, it is computed with self.sigma(t). See ChemModel.abundance'''
+		if sigmaX is None: sigmaX = self.sigma(t)
+		sigma_gas = self.psi(t)/self.model.nuL
+		return( _safelog10(sigmaX, sigma_gas) )
+# ------------------------ End of ChemDenseOutput ----------------------
+
+
+
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#
+# 				 MDF ASSOCIATED FUNCTIONS
+#
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# Get_MDF --------------------------------------------------------------------------------------------------
+def Get_MDF(chemdict, bins, t_min=0., t_max=13.8, accuracy=1e-3, solar_FeH=0., density=False, n_initial=256, max_nodes=10**6, full_output=False):
+	'''Metallicity distribution function: [Fe/H] histogram of the stars formed between t_min and t_max,
+	weighted by the SFR (as np.histogram):
+	hist, edges = Get_MDF(chemdict, bins=np.linspace(-3., 1., 81))
+
+	bins: edges of the [Fe/H] bins
+	solar_FeH: solar value subtracted from FromSigmaToAbundance (e.g. -2.752, see Example_Fig7.py)
+	accuracy: maximum fraction of the stellar mass that may be assigned to a wrong bin (see _mdf_sampling)
+	density: if True, the histogram is normalised as a probability density (as np.histogram)
+	full_output: also returns a dictionary with the time nodes, the number of evaluations and the error bound
+
+	The weights are the stellar masses formed in each time interval (Get_ipsi), i.e. the mass of stars
+	(not yet returned to the gas) per bin. Only the Fe yields of Element_yields are used (sigmaX_0=0).'''
+	model = ChemModel(chemdict)
+	edges = [np.asarray(bins, dtype=np.float64)]
+	coordinates = lambda t: _mdf_abundances(model, t, ["fe"]) - solar_FeH
+	hist, info = _mdf_histogram(model, coordinates, edges, t_min, t_max, accuracy, density, n_initial, max_nodes)
+	if full_output: return(hist, edges[0], info)
+	return(hist, edges[0])
+# -------------------------# End of Get_MDF -------------------------------------------------
+
+
+# Get_MDF_2D --------------------------------------------------------------------------------------------------
+def Get_MDF_2D(chemdict, element, bins, t_min=0., t_max=13.8, accuracy=1e-3, solar_FeH=0., solar_XFe=0., density=False, n_initial=256, max_nodes=10**6, full_output=False):
+	'''2D distribution of ([Fe/H], [X/Fe]) of the stars formed between t_min and t_max, weighted by the SFR
+	(as np.histogram2d):
+	hist, edges_FeH, edges_XFe = Get_MDF_2D(chemdict, "O", bins=(np.linspace(-3., 1., 81), np.linspace(-0.5, 1., 61)))
+
+	element: name of X in Element_yields
+	bins: (edges of the [Fe/H] bins, edges of the [X/Fe] bins)
+	solar_FeH, solar_XFe: solar values subtracted from the abundances
+	The other arguments are described in Get_MDF. hist has shape (len(edges_FeH)-1, len(edges_XFe)-1)'''
+	model = ChemModel(chemdict)
+	edges = [np.asarray(edge, dtype=np.float64) for edge in bins]
+	assert(len(edges)==2), "ERROR: bins must contain the [Fe/H] and [X/Fe] edges"
+	def coordinates(t):
+		FeH, XH = _mdf_abundances(model, t, ["fe", element])
+		with np.errstate(invalid="ignore"): # [X/Fe] is nan (dropped) where sigma_Fe=sigma_X=0
+			return( np.stack([FeH-solar_FeH, XH-FeH-solar_XFe]) )
+	hist, info = _mdf_histogram(model, coordinates, edges, t_min, t_max, accuracy, density, n_initial, max_nodes)
+	if full_output: return(hist, edges[0], edges[1], info)
+	return(hist, edges[0], edges[1])
+# -------------------------# End of Get_MDF_2D -------------------------------------------------
+
+
+# _mdf_abundances --------------------------------------------------------------------------------------------------
+def _mdf_abundances(model, t, elements):
+	'''[X/H] of several elements (yields of Element_yields, sigmaX_0=0) from one evaluation of the bases of a ChemModel.
+	[X/H]=-inf where sigma_X=0 (e.g. at t=0).
+	returns: array with shape (len(elements), len(t))'''
+	aux_homo, aux_nht, aux_typeIa = model.bases(t)
+	sigma_gas = model.psi(t)/model.nuL
+	yx, mx1a = np.array([Element_yields[element.lower()] for element in elements]).T
+	sigmaX = np.multiply.outer(yx, aux_nht) + np.multiply.outer(mx1a, aux_typeIa)
+	abundance = _safelog10(sigmaX, np.broadcast_to(sigma_gas, sigmaX.shape))
+	abundance[sigmaX==0] = -np.inf # Below any bin (_safelog10 returns 0)
+	return( abundance )
+# -------------------------# End of _mdf_abundances -------------------------------------------------
+
+
+# _mdf_sampling --------------------------------------------------------------------------------------------------
+def _mdf_sampling(model, coordinates, edges, t_min, t_max, accuracy=1e-3, n_initial=256, max_nodes=10**6):
+	'''Adaptive time sampling for the histograms of Get_MDF and Get_MDF_2D:
+	(t, x, bin_index, ipsi, info) = _mdf_sampling(model, coordinates, edges, t_min, t_max)
+
+	coordinates: function of t returning the histogram variables, array with shape (n_dim, len(t))
+	edges: list with the bin edges of each variable
+
+	The mass formed in each interval [t[i], t[i+1]] is ipsi[i+1]-ipsi[i] (analytic). If x(t[i]) and x(t[i+1])
+	fall in the same bin, the mass of the interval is assigned exactly (for x monotonic within the interval),
+	so only the intervals whose end points are in different bins can be misassigned. Those intervals are
+	bisected until their total mass is below accuracy*(total mass): the sampling is refined only around the
+	times where x(t) crosses a bin edge, and more where [Fe/H](t) changes fast.
+	Each iteration evaluates the model once, at the midpoints of all the intervals to be split (those with
+	a mass above the mean mass of the intervals that cross an edge).
+	The initial nodes are n_initial uniform times plus the start of the infalls.
+
+	returns: the time nodes, the coordinates and bin indices (-1 or len(edges)-1 when out of range) at them,
+	the primitive of psi at them and a dictionary with the number of evaluations and the error bound'''
+	assert(t_max>t_min), "ERROR: t_max must be GREATER than t_min"
+	tj = np.asarray(model.tj)
+	t = np.unique(np.concatenate([np.linspace(t_min, t_max, n_initial), tj[(tj>t_min) & (tj<t_max)]]))
+	x = coordinates(t)
+	ipsi = model.ipsi(t)
+	total = ipsi[-1]-ipsi[0]
+	min_step = 1e-12*(t_max-t_min)
+
+	def _bin_index(x):
+		index = np.stack([np.searchsorted(edge, xk, side="right")-1 for edge, xk in zip(edges, x)])
+		for k, edge in enumerate(edges): index[k, x[k]==edge[-1]] = len(edge)-2 # The last bin includes its right edge
+		return(index)
+
+	index = _bin_index(x)
+	n_evals = len(t)
+	while True:
+		mass = np.diff(ipsi)
+		crossing = np.any(index[:,1:]!=index[:,:-1], axis=0)
+		error = np.sum(mass[crossing])
+		if (error<=accuracy*total) or (n_evals>=max_nodes): break
+		split = crossing & (mass>error/np.count_nonzero(crossing)) & (np.diff(t)>min_step)
+		if not np.any(split): break
+		position = np.flatnonzero(split)+1
+		t_new = 0.5*(t[position-1]+t[position])
+		x_new = coordinates(t_new)
+		t = np.insert(t, position, t_new)
+		x = np.insert(x, position, x_new, axis=1)
+		ipsi = np.insert(ipsi, position, model.ipsi(t_new))
+		index = np.insert(index, position, _bin_index(x_new), axis=1)
+		n_evals += len(t_new)
+
+	info = {"t":t, "n_evals":n_evals, "error_bound":error/total if total>0 else 0.}
+	return(t, x, index, ipsi, info)
+# -------------------------# End of _mdf_sampling -------------------------------------------------
+
+
+# _mdf_histogram --------------------------------------------------------------------------------------------------
+def _mdf_histogram(model, coordinates, edges, t_min, t_max, accuracy, density, n_initial, max_nodes):
+	'''Histogram of the stellar mass on the adaptive sampling of _mdf_sampling. The mass of each interval
+	is split in two halves, assigned to the bins of its end points (out-of-range halves are dropped, as in np.histogram)'''
+	t, x, index, ipsi, info = _mdf_sampling(model, coordinates, edges, t_min, t_max, accuracy, n_initial, max_nodes)
+	shape = tuple(len(edge)-1 for edge in edges)
+	half_mass = 0.5*np.diff(ipsi)
+
+	hist = np.zeros(int(np.prod(shape)))
+	for end in [index[:,:-1], index[:,1:]]:
+		valid = np.all((end>=0) & (end<np.array(shape)[:,None]), axis=0)
+		hist += np.bincount(np.ravel_multi_index(end[:,valid], shape), half_mass[valid], minlength=len(hist))
+	hist = hist.reshape(shape)
+
+	if density:
+		volume = np.diff(edges[0])
+		for edge in edges[1:]: volume = np.multiply.outer(volume, np.diff(edge))
+		hist = hist/(hist.sum()*volume)
+	return(hist, info)
+# -------------------------# End of _mdf_histogram -------------------------------------------------
+
+
+
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#
+# 				 ABUNDANCE THRESHOLD FUNCTIONS
+#
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# Get_time_at_abundance --------------------------------------------------------------------------------------------------
+def Get_time_at_abundance(threshold, chemdict, t_min=0., t_max=13.8, ratio_to=None, solar=0., n_initial=64, tol=1e-10, max_iter=100, full_output=False):
+	'''First time (after t_min) at which the abundance reaches each threshold:
+	t = Get_time_at_abundance(threshold, chemdict)
+	t = Get_time_at_abundance([-1., 0.], chemdict, solar=-2.752)# [X/H] relative to the Sun
+	t = Get_time_at_abundance(0.3, chemdict_O, ratio_to="Fe", solar=0.646)# [O/Fe] (numerator: chemdict)
+
+	threshold: value or array of values (any shape) of [X/H] (X: the element of chemdict, see add_element),
+	    or of [X/Y] if ratio_to=Y is given (Y: name in Element_yields, with sigmaX_0=0)
+	solar: solar value subtracted from the abundances (as in Example_Fig7.py)
+
+	The abundance is first sampled on n_initial uniform times, the infall times tj and the times where the TypeIa
+	rate is not smooth (tj+tau1 and tj+tau2 of each DTD component). The intervals where the time derivative
+	changes its sign are bisected until the abundance is monotonic in every interval (or the interval is shorter
+	than 1000*tol). Then, for all the thresholds at once, the first interval where abundance-threshold changes
+	its sign is refined with a bracketed Newton method. The derivative is analytic (see _abundance_and_rate),
+	and a bisection step is used when the Newton step leaves the bracket or does not halve |abundance-threshold|.
+
+	returns: array with the shape of threshold (nan if the threshold is not reached between t_min and t_max)
+	    If full_output, also a dictionary with the number of evaluations and of Newton iterations'''
+	assert(t_max>t_min), "ERROR: t_max must be GREATER than t_min"
+	threshold = np.asarray(threshold, dtype=np.float64)
+	target = threshold.ravel() + solar
+	model = ChemModel(chemdict)
+	assert((model.sigmaX_0 is not None) and (model.yx is not None) and (model.mx1a is not None)), "ERROR: sigmaX_0, yx and mx1a are required (see add_element)"
+	yields = [(model.sigmaX_0, model.yx, model.mx1a)]
+	if ratio_to is not None: yields.append( (0.,)+Element_yields[ratio_to.lower()] )
+
+	n_evals = [0]
+	def evaluate(t):
+		n_evals[0] += len(t)
+		(x, rate) = _abundance_and_rate(model, t, yields[0])
+		if ratio_to is not None:
+			(x_den, rate_den) = _abundance_and_rate(model, t, yields[1])
+			with np.errstate(invalid="ignore"):
+				x, rate = x-x_den, rate-rate_den
+		return(x, rate)
+
+	# 1) Monotonic intervals:
+	nodes = np.unique(np.concatenate([np.linspace(t_min, t_max, n_initial), _abundance_breakpoints(model.chemdict, t_min, t_max)]))
+	x, rate = evaluate(nodes)
+	for _ in range(max_iter):
+		with np.errstate(invalid="ignore"):
+			turning = (np.sign(rate[:-1])*np.sign(rate[1:])<0) & (np.diff(nodes)>1000*tol)
+		if not np.any(turning): break
+		position = np.flatnonzero(turning)+1
+		t_new = 0.5*(nodes[position-1]+nodes[position])
+		x_new, rate_new = evaluate(t_new)
+		nodes, x, rate = np.insert(nodes, position, t_new), np.insert(x, position, x_new), np.insert(rate, position, rate_new)
+
+	# 2) First bracket of each threshold:
+	t_cross = np.full(len(target), np.nan)
+	with np.errstate(invalid="ignore"):
+		f = x[None,:]-target[:,None]
+		bracket = (f[:,:-1]*f[:,1:]<=0)
+	found = np.any(bracket, axis=1)
+	k = np.argmax(bracket, axis=1)[found]
+	a, b, fa, fb = nodes[k], nodes[k+1], f[found,k], f[found,k+1]
+	rows = np.flatnonzero(found)
+
+	# 3) Bracketed Newton (vectorized over the thresholds). Start at the bisection of the bracket:
+	exact = (fa==0)
+	t_cross[rows[exact]] = a[exact]
+	keep = ~exact
+	rows, a, b, fa, fb = rows[keep], a[keep], b[keep], fa[keep], fb[keep]
+	t_now = 0.5*(a+b)
+	f_old = np.full(len(rows), np.inf)
+	n_iter = 0
+	while len(rows)>0 and n_iter<max_iter:
+		n_iter += 1
+		x_now, rate_now = evaluate(t_now)
+		f_now = x_now-target[rows]
+		# Update the brackets (the sign of f_now is compared with the sign of f at a):
+		left = (np.sign(f_now)==np.sign(fa))
+		a, fa = np.where(left, t_now, a), np.where(left, f_now, fa)
+		b, fb = np.where(left, b, t_now), np.where(left, fb, f_now)
+		# Newton step, or bisection if it leaves the bracket or |f| is not halved:
+		with np.errstate(divide="ignore", invalid="ignore"):
+			t_next = t_now - f_now/rate_now
+		bisect = ~((t_next>a) & (t_next<b)) | ~(np.abs(f_now)<=0.5*f_old)
+		t_next = np.where(bisect, 0.5*(a+b), t_next)
+		done = (f_now==0) | (np.abs(t_next-t_now)<tol) | ((b-a)<tol)
+		t_cross[rows[done]] = np.where(f_now==0, t_now, t_next)[done]
+		rows, a, b, fa, fb, f_old, t_now = rows[~done], a[~done], b[~done], fa[~done], fb[~done], np.abs(f_now)[~done], t_next[~done]
+	t_cross[rows] = t_now # Not converged in max_iter iterations (within the bracket)
+
+	t_cross = t_cross.reshape(threshold.shape)
+	if full_output: return(t_cross, {"n_evals":n_evals[0], "n_iter":n_iter, "nodes":nodes})
+	return(t_cross)
+# -------------------------# End of Get_time_at_abundance -------------------------------------------------
+
+
+# _abundance_breakpoints --------------------------------------------------------------------------------------------------
+def _abundance_breakpoints(chemdict, t_min, t_max):
+	'''Times between t_min and t_max where the derivative of the abundances is not smooth:
+	the infall times tj, and tj+tau1, tj+tau2 of every DTD component (including tj=0 for the initial gas)'''
+	tj = np.concatenate([[0.], np.asarray(chemdict["tj"], dtype=np.float64)])
+	delays = np.concatenate([np.asarray(chemdict[name], dtype=np.float64) for name in ["tau1G", "tau2G", "tau1E", "tau2E", "tau1I", "tau2I"]])
+	times = np.concatenate([tj, (tj[:,None]+delays[None,:]).ravel()])
+	return( np.unique(times[(times>t_min) & (times<t_max)]) )
+# -------------------------# End of _abundance_breakpoints -------------------------------------------------
+
+
+# _abundance_and_rate --------------------------------------------------------------------------------------------------
+def _abundance_and_rate(model, t, element_yields):
+	'''[X/H] and its time derivative from a ChemModel:
+	(abundance, rate) = _abundance_and_rate(model, t, (sigmaX_0, yx, mx1a))
+
+	With the equation of ChemicalSolutionVerifier, dsigma_X/dt = -alpha*sigma_X + yx*(1-R)*psi + mx1a*R1a,
+	and dsigma_gas/dt = I - alpha*sigma_gas, the alpha terms cancel in d[X/H]/dt:
+	ln(10)*d[X/H]/dt = (yx*(1-R)*psi + mx1a*R1a)/sigma_X - I/sigma_gas'''
+	sigmaX_0, yx, mx1a = element_yields
+	t = np.asarray(t, dtype=np.float64)
+	aux_homo, aux_nht, aux_typeIa = model.bases(t)
+	sigmaX = sigmaX_0*aux_homo + yx*aux_nht + mx1a*aux_typeIa
+	psi = model.psi(t)
+	sigma_gas = psi/model.nuL
+
+	# Infall rate:
+	Aj, tauj, tj = [np.asarray(x)[:,None] for x in (model.Aj, model.tauj, model.tj)]
+	infall = np.sum(Aj*np.exp(-np.maximum(t-tj, 0.)/tauj)*(t>=tj), axis=0)
+
+	with np.errstate(divide="ignore", invalid="ignore"):
+		abundance = np.log10(sigmaX/sigma_gas)
+		rate = ((yx*(1.-model.R)*psi + mx1a*model.r1a(t))/sigmaX - infall/sigma_gas)/np.log(10.)
+	abundance[sigmaX==0] = -np.inf # Also where sigma_gas=0 (e.g. t=0 without initial gas): [X/H]->-inf when t->0
+	return(abundance, rate)
+# -------------------------# End of _abundance_and_rate -------------------------------------------------
+
+
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#
+# 				 LIKELIHOOD FUNCTIONS
+#
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+# Get_loglikelihood --------------------------------------------------------------------------------------------------
+def Get_loglikelihood(ages, observations, chemdict, present_day_time=13.8, solar=None, block_size=2**16, time_tolerance=0., full_output=False):
+	'''Gaussian log-likelihood of a sample of stars with ages and abundance measurements:
+	logL = Get_loglikelihood(ages, {"Fe/H": (FeH, eFeH), "O/Fe": (OFe, eOFe)}, chemdict, solar={"Fe/H": -2.752, "O/Fe": 0.646})
+
+	ages: stellar ages (Gyr), in any order. The model is evaluated exactly at the formation times present_day_time-ages.
+	observations: dictionary {"X/H" or "X/Y": (values, uncertainties)} with one value per star. The elements are the keys
+	    of Element_yields (with sigmaX_0=0), and the uncertainties may be a float. Stars with nan values (or non-positive
+	    uncertainties) are not used for that ratio.
+	solar: dictionary of solar values subtracted from the model ratios (zero by default)
+	logL = -0.5*sum( ((model-values)/uncertainties)**2 + log(2*pi*uncertainties**2) )
+	The stars are sorted by formation time and evaluated in blocks of block_size stars, so only block-sized model arrays
+	are kept in memory. The model is evaluated once per distinct formation time.
+	time_tolerance: if positive, the formation times are rounded to multiples of it (see _unique_times).
+	logL=-inf if a star has no model counterpart (e.g. formed before t=0).
+	full_output: also returns a dictionary with the chi2 and the number of measurements of each ratio.'''
+	model = ChemModel(chemdict)
+	def model_bases(t):
+		aux_homo, aux_nht, aux_typeIa = model.bases(t)
+		return( aux_nht[None], aux_typeIa[None], (model.psi(t)/model.nuL)[None] )
+	loglike, info = _stellar_loglikelihood(present_day_time-np.asarray(ages, dtype=np.float64), observations, solar, model_bases, 1, block_size, time_tolerance)
+	if full_output: return( loglike[0], {key: {name: value[0] if key=="chi2" else value for name, value in values.items()} for key, values in info.items()} )
+	return( loglike[0] )
+# -------------------------# End of Get_loglikelihood -------------------------------------------------
+
+
+# Get_loglikelihood_Batch --------------------------------------------------------------------------------------------------
+def Get_loglikelihood_Batch(ages, observations, batchdict, present_day_time=13.8, solar=None, block_size=2**14, time_tolerance=0., full_output=False):
+	'''Log-likelihood of K models (parameter sets) at once, for the same sample of stars:
+	logL = Get_loglikelihood_Batch(ages, observations, batchdict)
+
+	See Get_loglikelihood for the arguments and SolveChemEvolModel_Batch for the format of batchdict
+	(the keys "sigmaX_0", "yx" and "mx1a" are not used). Each block of stars is evaluated for all the
+	parameter sets at once, with (K, block_size) arrays.
+
+	returns: array with shape (K,)'''
+	K, prepared = _prepare_batchdict(batchdict)
+	model_bases = lambda t: _batch_bases(t, K, prepared)[1:]
+	loglike, info = _stellar_loglikelihood(present_day_time-np.asarray(ages, dtype=np.float64), observations, solar, model_bases, K, block_size, time_tolerance)
+	if full_output: return( loglike, info )
+	return( loglike )
+# -------------------------# End of Get_loglikelihood_Batch -------------------------------------------------
+
+
+# _stellar_loglikelihood --------------------------------------------------------------------------------------------------
+def _stellar_loglikelihood(t, observations, solar, model_bases, K, block_size, time_tolerance=0.):
+	'''Log-likelihood of K models (see Get_loglikelihood):
+	(loglike, info) = _stellar_loglikelihood(t, observations, solar, model_bases, K, block_size, time_tolerance)
+
+	t: formation times of the stars (any order and shape)
+	model_bases(t_block): (ira, typeIa, sigma_gas), arrays with shape (K, len(t_block)) for a sorted 1D block of times
+	The sum does not depend on the order of the stars, so they are evaluated in blocks of the sorted times
+	(which restricts the kernels to the active time windows, see _time_windows). The equal times of a block
+	(after rounding them to multiples of time_tolerance) are evaluated only once.
+	loglike: array with shape (K,). info: {"chi2": {ratio: array (K,)}, "n_measurements": {ratio: int}}'''
+	t = np.asarray(t, dtype=np.float64).ravel()
+	if time_tolerance>0: t = np.round(t/time_tolerance)*time_tolerance
+	ratios = _parse_ratios(observations, solar, t.size)
+	order = np.argsort(t, kind="stable")
+
+	loglike = np.zeros(K)
+	info = {"chi2": {name: np.zeros(K) for name in ratios}, "n_measurements": {name: 0 for name in ratios}}
+	for start in range(0, t.size, block_size):
+		stars = order[start:start+block_size]
+		t_unique, inverse = _unique_times(t[stars])
+		ira, typeIa, sigma_gas = model_bases(t_unique)
+		log_sigma = dict() # log10 of the densities at the distinct times of this block, computed once per element
+		for name, (numerator, denominator, values, errors, solar_value) in ratios.items():
+			value, error = values[stars], errors[stars]
+			used = np.isfinite(value) & np.isfinite(error) & (error>0)
+			if not np.any(used): continue
+			for element in (numerator, denominator):
+				if element in log_sigma: continue
+				yx, mx1a = Element_yields[element] if element!="h" else (None, None)
+				with np.errstate(divide="ignore"): # log10(0)=-inf (no counterpart)
+					log_sigma[element] = np.log10(sigma_gas if element=="h" else yx*ira + mx1a*typeIa)
+			nodes = inverse[used]
+			with np.errstate(invalid="ignore"):
+				residual = (log_sigma[numerator][:,nodes] - log_sigma[denominator][:,nodes] - solar_value - value[used])/error[used]
+			chi2 = np.square(residual).sum(-1)
+			chi2[np.isnan(chi2)] = np.inf # -inf-(-inf): neither element is produced yet
+			info["chi2"][name] += chi2
+			info["n_measurements"][name] += int(np.count_nonzero(used))
+			loglike -= 0.5*(chi2 + np.sum(np.log(2.*np.pi*np.square(error[used]))))
+	return( loglike, info )
+# -------------------------# End of _stellar_loglikelihood -------------------------------------------------
+
+
+# _parse_ratios --------------------------------------------------------------------------------------------------
+def _parse_ratios(observations, solar, n_stars):
+	'''Checks the observations of Get_loglikelihood: {name: (numerator, denominator, values, uncertainties, solar value)},
+	with the element names in lower case ("h" for hydrogen) and the arrays flattened (n_stars values)'''
+	solar = dict() if solar is None else solar
+	ratios = dict()
+	for name, (values, errors) in observations.items():
+		elements = name.strip("[]").lower().split("/")
+		assert(len(elements)==2), "ERROR: %s is not a ratio X/Y"%name
+		for element in elements: assert((element=="h") or (element in Element_yields.keys())), "Element %s not included yet"%element
+		assert(elements[0]!="h"), "ERROR: the numerator of %s must be an element of Element_yields"%name
+		values = np.asarray(values, dtype=np.float64).ravel()
+		assert(values.size==n_stars), "ERROR: %s must have one value per star"%name
+		errors = np.broadcast_to(np.asarray(errors, dtype=np.float64), np.shape(observations[name][0])).ravel()
+		ratios[name] = (elements[0], elements[1], values, errors, float(solar.get(name, 0.)))
+	return( ratios )
+# -------------------------# End of _parse_ratios -------------------------------------------------
+
+
 
 
 
@@ -1361,6 +3440,11 @@ def ChemicalSolutionVerifier(t, chemdict):
 #
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+# Yields per element: (yx, mx1a) -------------------------------------------
+Element_yields = {"fe":(5.6E-4, 6.26E-01), "o":(1.022E-2, 1.43E-01), "si":(8.5*1E-4, 0.154)}
+# ---------------------------------------------------------------------------
+
+
 # ---------------------------------------------------------------------------
 def add_element(chemdict, element="Fe", sigmaX_0=0.):
 	''' Adds the yields associated with the element "element".
@@ -1371,22 +3455,12 @@ def add_element(chemdict, element="Fe", sigmaX_0=0.):
 	element = element.lower();
 	chemdict = chemdict.copy()
 
-	assert(element in ["fe","o","si"]), "Element %s not included yet"%element
+	assert(element in Element_yields.keys()), "Element %s not included yet"%element
 
 	chemdict["sigmaX_0"] = 0.; # Add sigmaX_0
 
-	if element=="fe":
-		# Specific values for the iron:
-		chemdict["yx"] = 5.6E-4
-		chemdict["mx1a"] = 6.26E-01
-	if element =="o":
-		# Specific values for the oxygen:
-		chemdict["yx"] = 1.022E-2
-		chemdict["mx1a"] = 1.43E-01
-	if element=="si":
-		# Specific values for the silicon:
-		chemdict["yx"] = 8.5*1E-4
-		chemdict["mx1a"] = 0.154
+	# Specific values for the element:
+	chemdict["yx"], chemdict["mx1a"] = Element_yields[element]
 	return(chemdict);
 
 # ------------------- End of add_element ---------------------------------
@@ -1409,7 +3483,7 @@ def _separate_cases(alpha, tauj, tj, Aj):
 	new_tj = []
 	new_tauj = []
 	for j in range(N):
-		if tauj[j]==inv_alpha:
+		if _betaj(alpha, tauj[j])==0:
 			Aj_gorro.append(Aj[j])
 			tj_gorro.append(tj[j])
 		else:
@@ -1420,6 +3494,14 @@ def _separate_cases(alpha, tauj, tj, Aj):
 # ------------------- End of _separate_cases ---------------------------------
 
 
+# _linear_coefficients ---------------------------------------------------------
+def _linear_coefficients(sigmaX_0, yx, mx1a, CIa):
+	'''Coefficients of the linear bases (homo, ira, gaussian, exponential, inverse), stacked along the first axis'''
+	sigmaX_0, yx, mx1a, CIa = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) for x in (sigmaX_0, yx, mx1a, CIa)])
+	return( np.stack([sigmaX_0, yx, mx1a*CIa, mx1a*CIa, mx1a*CIa]) )
+# ------------------- End of _linear_coefficients ---------------------------------
+
+
 
 # prepare_chemdict ----------------------------------------------------------------------
 def prepare_chemdict(chemdict):
@@ -1513,57 +3595,166 @@ def prepare_chemdict(chemdict):
 # ------------------- End of prepare_chemdict ---------------------------------
 
 
+# _prepare_batchdict ----------------------------------------------------------------------
+def _prepare_batchdict(batchdict):
+	''' Checks a batch dictionary (structure-of-arrays of K parameter sets) and broadcasts its values:
+	- Scalar parameters: float or array with shape (K,) -> array with shape (K, 1)
+	- Infall and DTD parameters: 1D array or array with shape (K, n) -> array with shape (n, K, 1)
+	The input dictionary is not modified.
+	(K, batchdict) = _prepare_batchdict(batchdict)'''
+
+	# Names of the key parameters - - - - - - - - - - - - - - - - - -
+	fields_gauss = ["AG", "sigma_p", "taup", "tau1G", "tau2G"]
+	fields_exp = ["AE", "tauD", "tau1E", "tau2E"]
+	fields_inv = ["AI", "tauI", "tau0", "tau1I", "tau2I"]
+	fields_infall = ["tj", "Aj", "tauj"]
+	fields_scalar = ["sigmaX_0", "omega", "yx", "R", "nuL", "sigma_gas_0", "mx1a", "CIa"]
+	# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+	batchdict = batchdict.copy()
+
+	# Common tau1 and tau2 (see prepare_chemdict):
+	for (A, tau1, tau2) in [("AG", "tau1G", "tau2G"), ("AE", "tau1E", "tau2E"), ("AI", "tau1I", "tau2I")]:
+		if ("tau1" in batchdict.keys()) and not (tau1 in batchdict.keys()) and (A in batchdict.keys()): batchdict[tau1] = batchdict["tau1"];
+		if ("tau2" in batchdict.keys()) and not (tau2 in batchdict.keys()) and (A in batchdict.keys()): batchdict[tau2] = batchdict["tau2"];
+	batchdict.pop("tau1", None)
+	batchdict.pop("tau2", None)
+	# tauI is degenerated with AI, so it is set to one by default
+	if ("AI" in batchdict.keys()) and not ("tauI" in batchdict.keys()): batchdict["tauI"] = np.ones_like(np.asarray(batchdict["AI"], dtype=np.float64))
+
+	# Convert to arrays and get the number of parameter sets:
+	for name in fields_scalar:
+		if name in batchdict.keys(): batchdict[name] = np.asarray(batchdict[name], dtype=np.float64)
+	for name in fields_gauss + fields_exp + fields_inv + fields_infall:
+		if name in batchdict.keys(): batchdict[name] = np.atleast_1d(np.asarray(batchdict[name], dtype=np.float64))
+	K_values = [batchdict[name].shape[0] for name in fields_scalar if (name in batchdict.keys()) and (batchdict[name].ndim==1)]
+	K_values += [batchdict[name].shape[0] for name in fields_gauss + fields_exp + fields_inv + fields_infall if (name in batchdict.keys()) and (batchdict[name].ndim==2)]
+	assert(len(set(K_values))<=1), "ERROR: the number of parameter sets is not the same for all the parameters"
+	K = K_values[0] if len(K_values)>0 else 1
+
+	# Broadcast the scalar parameters to shape (K, 1):
+	for name in fields_scalar:
+		if name in batchdict.keys():
+			assert(batchdict[name].ndim<=1), "ERROR: %s must be a float or an array with shape (K,)"%name
+			batchdict[name] = np.broadcast_to(batchdict[name], (K,))[:,None]
+
+	# Broadcast the infall and DTD parameters to shape (n, K, 1):
+	for fields, family in [(fields_gauss, "gaussian DTD"), (fields_exp, "exponential DTD"), (fields_inv, "inverse DTD"), (fields_infall, "infall")]:
+		if not (fields[0] in batchdict.keys()):
+			for name in fields: batchdict[name] = np.zeros((0, K, 1))
+			continue
+		for name in fields:
+			assert(name in batchdict.keys()), "Error in " + family + ": no " + name + " in input dictionary"
+			assert(batchdict[name].ndim<=2), "ERROR: %s must be a 1D array or an array with shape (K, n)"%name
+			batchdict[name] = np.ascontiguousarray(np.broadcast_to(batchdict[name], (K, batchdict[name].shape[-1])).T)[:,:,None]
+		for name in fields[1:]: assert(batchdict[name].shape==batchdict[fields[0]].shape), "Dimensions in " + family + " parameters mismatch"
+
+	# Check tau1<=tau2 and tau0<tau1:
+	assert(np.all(batchdict["tau1G"]<=batchdict["tau2G"])), "  ERROR: tau1G must be LOWER than tau2G"
+	assert(np.all(batchdict["tau1E"]<=batchdict["tau2E"])), "  ERROR: tau1E must be LOWER than tau2E"
+	assert(np.all(batchdict["tau1I"]<=batchdict["tau2I"])), "  ERROR: tau1I must be LOWER than tau2I"
+	assert(np.all(batchdict["tau0"]<batchdict["tau1I"])), "  ERROR: tau0 must be LOWER than tau1I"
+	return(K, batchdict)
+# ------------------- End of _prepare_batchdict ---------------------------------
+
+
+# _batch_subset ----------------------------------------------------------------------
+def _batch_subset(batchdict, rows):
+	''' Selects the parameter sets "rows" of a prepared batch dictionary (see _prepare_batchdict)'''
+	subset = dict()
+	for name, value in batchdict.items():
+		subset[name] = value[rows] if value.ndim==2 else value[:,rows]
+	return(subset)
+# ------------------- End of _batch_subset ---------------------------------
+
+
+# _batch_row_chemdict ----------------------------------------------------------------------
+def _batch_row_chemdict(batchdict, k):
+	''' Chemical dictionary of the k-th parameter set of a prepared batch dictionary (see _prepare_batchdict)'''
+	chemdict = dict()
+	for name, value in batchdict.items():
+		chemdict[name] = float(value[k,0]) if value.ndim==2 else list(value[:,k,0])
+	return(chemdict)
+# ------------------- End of _batch_row_chemdict ---------------------------------
+
+
 
 
 # Helpful functions -----------------------------------------------------------
 
 
 # ------------------------------------------
-def QD(x, a, c):
-	'''Used in A.7'''
-	num = a*c*np.exp((c-a)/(c*a)*x)*(a!=c) -x*(a==c);
+def QD(x, a, c, out=None, work=None):
+	'''Used in A.7. With out (and the scratch array work), it is evaluated in place'''
 	den = (a-c)*(a!=c) +1.*(a==c);
-	return(num/den);
+	if out is None:
+		num = a*c*np.exp((c-a)/(c*a)*x)*(a!=c) -x*(a==c);
+		return(num/den);
+	np.multiply((c-a)/(c*a), x, out=out)
+	np.exp(out, out=out)
+	out *= a*c*(a!=c)
+	np.multiply(x, a==c, out=work)
+	out -= work
+	out /= den
+	return(out);
 # ------------------------------------------
 
 
 # ------------------------------------------
-def PD(x, a, b, c):
-	'''Used in A.8'''
-	num = a*b*c*np.exp((c-b)/(b*c)*x)*((a!=c) & (b!=c)) - a*x*(c==b) + b*((c-b)*x-c*b)*np.exp((c-b)/(b*c)*x)*(c==a);
+def PD(x, a, b, c, out=None, work=None):
+	'''Used in A.8. With out (and the scratch array work), it is evaluated in place'''
 	den = (a-c)*(b-c)*((a!=c) & (b!=c)) + (a-c)*(c==b) + (b-c)**2*(c==a)
-	return(c*num/den);
+	if out is None:
+		num = a*b*c*np.exp((c-b)/(b*c)*x)*((a!=c) & (b!=c)) - a*x*(c==b) + b*((c-b)*x-c*b)*np.exp((c-b)/(b*c)*x)*(c==a);
+		return(c*num/den);
+	np.multiply((c-b)/(b*c), x, out=out)
+	np.exp(out, out=out)
+	np.multiply(c-b, x, out=work)
+	work -= c*b
+	work *= b*(c==a)
+	work += a*b*c*((a!=c) & (b!=c))
+	out *= work
+	np.multiply(a*(c==b), x, out=work)
+	out -= work
+	out *= c/den
+	return(out);
 # ------------------------------------------
 
 
 # ------------------------------------------
-def SD(x, a, c):
-	'''Used in A.9'''
-	num = (a**2*c**2)*np.exp( (c-a)/(a*c)*x )*(c!=a) + 0.5*x**2*(c==a)
+def SD(x, a, c, out=None, work=None):
+	'''Used in A.9. With out (and the scratch array work), it is evaluated in place'''
 	den = (a-c)**2*(c!=a) + 1.*(c==a)
-	return(num/den);
+	if out is None:
+		num = (a**2*c**2)*np.exp( (c-a)/(a*c)*x )*(c!=a) + 0.5*x**2*(c==a)
+		return(num/den);
+	np.multiply((c-a)/(a*c), x, out=out)
+	np.exp(out, out=out)
+	out *= (a**2*c**2)*(c!=a)
+	np.multiply(x, x, out=work)
+	work *= 0.5*(c==a)
+	out += work
+	out /= den
+	return(out);
 # ------------------------------------------
 
 
 # ------------------------------------------------
 def QD_gorro(x,y,a,c):
 	'''Aux. function associated with the exponential term of the DTD'''
-	if(a!=c):
-		result = a*c/(a-c)**2*(np.exp( (c-a)*x/c/a)*(c*a + (c-a)*(y-x)) )
-	else:
-		result = - 0.5*(y-x)**2
+	same = 1.*np.equal(a, c)
+	result = a*c/((a-c)**2+same)*(np.exp( (c-a)*x/c/a)*(c*a + (c-a)*(y-x)) )*(1.-same) - 0.5*(y-x)**2*same
 	return(result);
 # ------------------------------------------------
 
 
 # ------------------------------------------------
-def SD_gorro(x,a,c):
-	'''Aux. function associated with the exponential term of the DTD'''
-	if(a!=c):
-		aux = (c-a)/c/a
-		result = (1./aux)**3*( -1. + np.exp( -aux*x )*(1. + aux*x + 0.5*(aux*x)**2) )
-	else:
-		result = -(x**3)/6.
+def SD_gorro(x,a,c,decay=0.):
+	'''Aux. function associated with the exponential term of the DTD.
+	It is multiplied by exp(-decay/c), combined with its exponential (no overflow for small c when decay>=x)'''
+	same = 1.*np.equal(a, c)
+	aux = (c-a)/c/a + same
+	result = (1./aux)**3*( -np.exp(-decay/c) + np.exp( -x/a-(decay-x)/c*(1.-same)-decay/c*same )*(1. + aux*x + 0.5*(aux*x)**2) )*(1.-same) - (x**3)/6.*np.exp(-decay/c)*same
 
 	result = result*heaviside(x)
 	return(result);
@@ -0,0 +1,177 @@
+'''Forward-mode dual numbers for the analytic Jacobians of CheapTools (see ChemModel.sigma_jacobian).
+
+x = Dual(val, der) is an array of values val with their first derivatives der (der.shape = (n_tangents,)+val.shape),
+so the analytic kernels compute the derivatives alongside the values, sharing all their intermediates.
+
+Supported operations (anything else raises a TypeError, instead of silently dropping the derivatives):
+  * Differentiable ufuncs (DIFFERENTIABLE), also with out= (as in the in-place kernels): np.add, np.subtract,
+    np.multiply, np.true_divide, np.negative, np.absolute, np.exp, np.expm1, np.log, np.sqrt, np.square,
+    np.power (only with respect to the base), np.minimum, np.maximum and scipy.special.erf, erfc and expi.
+    The operators +, -, *, /, ** (and +=, -=, *=, /=), unary - and abs() call them.
+  * Non-differentiable ufuncs (NON_DIFFERENTIABLE), evaluated on the values and returning plain arrays:
+    the comparisons (also the operators <, <=, >, >=, ==, !=), the logical ufuncs, np.isfinite, np.isnan,
+    np.isinf and np.signbit. Their output can not be a Dual.
+  * NumPy functions (FUNCTIONS): np.shape, np.ndim, np.where (the condition is taken from the values) and
+    np.stack with axis=0.
+  * Basic indexing and slicing (views of the values and of the derivatives), item assignment, len() and iteration.
+Reductions (np.sum, ufunc.reduce...) and the other ufuncs and NumPy functions are not supported.
+'''
+import numpy as np
+from scipy.special import erf, erfc, expi
+
+# -----------------------------------------------
+#Dual
+#DIFFERENTIABLE
+#NON_DIFFERENTIABLE
+#FUNCTIONS
+# -----------------------------------------------
+
+
+# Dual--------------------------------------------
+class Dual:
+	'''Value and first derivatives (forward mode) of an array, for the analytic Jacobians:
+	x = Dual(val, der), with der.shape = (n_tangents,)+val.shape
+	See the supported operations in the docstring of the module'''
+	__array_priority__ = 1000
+	__hash__ = None
+
+	def __init__(self, val, der):
+		self.val = np.asarray(val, dtype=np.float64)
+		self.der = np.asarray(der, dtype=np.float64)
+
+	@classmethod
+	def zeros(cls, shape, n_tangents):
+		return( cls(np.zeros(shape), np.zeros((n_tangents,)+tuple(shape))) )
+
+	@classmethod
+	def empty(cls, shape, n_tangents):
+		return( cls(np.empty(shape), np.empty((n_tangents,)+tuple(shape))) )
+
+	shape = property(lambda self: self.val.shape)
+	ndim = property(lambda self: self.val.ndim)
+	size = property(lambda self: self.val.size)
+	def __len__(self): return( len(self.val) )
+	def __iter__(self): return( (self[k] for k in range(len(self))) )
+	def __repr__(self): return( "Dual(%r, %r)"%(self.val, self.der) )
+
+	# Indexing (views of both the value and the tangents):
+	def _der_index(self, index):
+		return( (slice(None),)+(index if isinstance(index, tuple) else (index,)) )
+	def __getitem__(self, index):
+		return( Dual(self.val[index], self.der[self._der_index(index)]) )
+	def __setitem__(self, index, value):
+		self.val[index] = value.val if isinstance(value, Dual) else value
+		target = self.der[self._der_index(index)]
+		target[...] = Dual._tangents(value, target.ndim-1, len(self.der)) if isinstance(value, Dual) else 0.
+
+	@staticmethod
+	def _tangents(x, ndim, n_tangents):
+		'''Tangents of x with the shape (n_tangents, 1, ..., 1)+x.shape (ndim axes after the first one), to broadcast with other arrays'''
+		if not isinstance(x, Dual): return( 0. )
+		return( x.der.reshape((n_tangents,)+(1,)*(ndim-x.ndim)+x.shape) )
+
+	# Arithmetic and comparison operators (evaluated by the ufuncs):
+	__add__ = lambda self, other: np.add(self, other)
+	__radd__ = lambda self, other: np.add(other, self)
+	__sub__ = lambda self, other: np.subtract(self, other)
+	__rsub__ = lambda self, other: np.subtract(other, self)
+	__mul__ = lambda self, other: np.multiply(self, other)
+	__rmul__ = lambda self, other: np.multiply(other, self)
+	__truediv__ = lambda self, other: np.true_divide(self, other)
+	__rtruediv__ = lambda self, other: np.true_divide(other, self)
+	__pow__ = lambda self, other: np.power(self, other)
+	__neg__ = lambda self: np.negative(self)
+	__abs__ = lambda self: np.absolute(self)
+	__gt__ = lambda self, other: np.greater(self, other)
+	__ge__ = lambda self, other: np.greater_equal(self, other)
+	__lt__ = lambda self, other: np.less(self, other)
+	__le__ = lambda self, other: np.less_equal(self, other)
+	__eq__ = lambda self, other: np.equal(self, other)
+	__ne__ = lambda self, other: np.not_equal(self, other)
+	def __iadd__(self, other): return( np.add(self, other, out=self) )
+	def __isub__(self, other): return( np.subtract(self, other, out=self) )
+	def __imul__(self, other): return( np.multiply(self, other, out=self) )
+	def __itruediv__(self, other): return( np.true_divide(self, other, out=self) )
+
+	def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+		if method!="__call__": raise TypeError("ERROR: %s.%s is not supported by Dual (see DualNumbers)"%(ufunc.__name__, method))
+		values = [x.val if isinstance(x, Dual) else x for x in inputs]
+		if out is not None: out = out[0] if isinstance(out, tuple) else out
+		if ufunc in NON_DIFFERENTIABLE:
+			if isinstance(out, Dual): raise TypeError("ERROR: the output of %s can not be a Dual (it does not propagate derivatives)"%ufunc.__name__)
+			return( ufunc(*values, **kwargs) if out is None else ufunc(*values, out=out, **kwargs) )
+		if ufunc not in DIFFERENTIABLE: raise TypeError("ERROR: %s is not supported by Dual (see DualNumbers)"%ufunc.__name__)
+		value = np.asarray(ufunc(*values, **kwargs))
+		n_tangents = next(len(x.der) for x in inputs+(out,) if isinstance(x, Dual))
+		tangents = 0.
+		for x, partial in zip(inputs, DIFFERENTIABLE[ufunc](*values, value)):
+			if not isinstance(x, Dual): continue
+			if partial is None: raise TypeError("ERROR: %s is only differentiable with respect to its first argument"%ufunc.__name__)
+			tangents = tangents + Dual._tangents(x, value.ndim, n_tangents)*partial
+		if np.shape(tangents)!=(n_tangents,)+value.shape: tangents = np.array(np.broadcast_to(tangents, (n_tangents,)+value.shape))
+		if out is None: return( Dual(value, tangents) )
+		if not isinstance(out, Dual): raise TypeError("ERROR: the output of %s must be a Dual to keep the derivatives"%ufunc.__name__)
+		out.val[...] = value # The output may be one of the inputs (in place), so it is written at the end
+		out.der[...] = tangents.reshape((n_tangents,)+(1,)*(out.ndim-value.ndim)+value.shape)
+		return( out )
+
+	def __array_function__(self, func, types, args, kwargs):
+		if func not in FUNCTIONS or (func is np.stack and kwargs.get("axis", 0)!=0):
+			raise TypeError("ERROR: np.%s is not supported by Dual (see DualNumbers)"%func.__name__)
+		return( FUNCTIONS[func](*args, **kwargs) )
+# -------------------------# End of Dual -------------------------------------------------
+
+
+# DIFFERENTIABLE--------------------------------------------
+# Partial derivatives of the differentiable ufuncs, as functions of the input values and the output
+# (None: not differentiable with respect to that argument):
+DIFFERENTIABLE = {
+	np.add: lambda x, y, r: (1., 1.),
+	np.subtract: lambda x, y, r: (1., -1.),
+	np.multiply: lambda x, y, r: (y, x),
+	np.true_divide: lambda x, y, r: (1./y, -r/y),
+	np.negative: lambda x, r: (-1.,),
+	np.absolute: lambda x, r: (np.sign(x),),
+	np.exp: lambda x, r: (r,),
+	np.expm1: lambda x, r: (r+1.,),
+	np.log: lambda x, r: (1./x,),
+	np.sqrt: lambda x, r: (0.5/r,),
+	np.square: lambda x, r: (2.*x,),
+	np.power: lambda x, y, r: (y*np.power(x, y-1.), None),
+	np.minimum: lambda x, y, r: (x<=y, x>y),
+	np.maximum: lambda x, y, r: (x>=y, x<y),
+	erf: lambda x, r: (2./np.sqrt(np.pi)*np.exp(-np.square(x)),),
+	erfc: lambda x, r: (-2./np.sqrt(np.pi)*np.exp(-np.square(x)),),
+	expi: lambda x, r: (np.exp(x)/x,),
+}
+# -----------------------------------------------------
+
+# NON_DIFFERENTIABLE--------------------------------------------
+# Ufuncs evaluated on the values (piecewise constant outputs):
+NON_DIFFERENTIABLE = (np.greater, np.greater_equal, np.less, np.less_equal, np.equal, np.not_equal,
+					  np.logical_and, np.logical_or, np.logical_xor, np.logical_not, np.isfinite, np.isnan, np.isinf, np.signbit)
+# -----------------------------------------------------
+
+# FUNCTIONS--------------------------------------------
+def _where(condition, x, y):
+	'''np.where with the condition taken from the values, and the tangents of the selected array'''
+	condition = condition.val if isinstance(condition, Dual) else condition
+	n_tangents = next(len(a.der) for a in (x, y) if isinstance(a, Dual))
+	value = np.where(condition, x.val if isinstance(x, Dual) else x, y.val if isinstance(y, Dual) else y)
+	tangents = np.where(condition, Dual._tangents(x, value.ndim, n_tangents), Dual._tangents(y, value.ndim, n_tangents))
+	return( Dual(value, np.broadcast_to(tangents, (n_tangents,)+value.shape)) )
+
+def _stack(arrays, axis=0):
+	'''np.stack along the first axis (the plain arrays have zero tangents)'''
+	n_tangents = next(len(a.der) for a in arrays if isinstance(a, Dual))
+	arrays = [a if isinstance(a, Dual) else Dual(a, np.zeros((n_tangents,)+np.shape(a))) for a in arrays]
+	return( Dual(np.stack([a.val for a in arrays]), np.stack([a.der for a in arrays], axis=1)) )
+
+# NumPy functions supported by Dual (see Dual.__array_function__):
+FUNCTIONS = {
+	np.shape: lambda a: a.shape,
+	np.ndim: lambda a: a.ndim,
+	np.where: _where,
+	np.stack: _stack,
+}
+# -----------------------------------------------------
@@ -33,21 +33,14 @@ for key, value in Model_and_infall_parameters.items(): dict_MR01[key] = value; #
 # Compute CIa
 dict_MR01["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_MR01, present_day_time=today)
 
-# Now add the values of the elements, with zero initial density:
-dict_MR01_Fe = add_element(dict_MR01, "Fe", 0.0);
-dict_MR01_O = add_element(dict_MR01, "O", 0.0);
-dict_MR01_Si = add_element(dict_MR01, "Si", 0.0);
-del(dict_MR01)
-
-# Solve the models for all the elements simultaneously:
-Sol_MR01_Fe = SolveChemEvolModel( t_gyr, dict_MR01_Fe)
-Sol_MR01_O = SolveChemEvolModel( t_gyr, dict_MR01_O)
-Sol_MR01_Si = SolveChemEvolModel( t_gyr, dict_MR01_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_MR01_Fe, Sol_MR01_O, Sol_MR01_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_MR01, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_MR01_Fe = FromSigmaToAbundance(t_gyr, Sol_MR01_Fe, dict_MR01_Fe)
-Abund_MR01_O = FromSigmaToAbundance(t_gyr, Sol_MR01_O, dict_MR01_O)
-Abund_MR01_Si = FromSigmaToAbundance(t_gyr, Sol_MR01_Si, dict_MR01_Si)
+Abund_MR01_Fe = FromSigmaToAbundance(t_gyr, Sol_MR01_Fe, dict_MR01)
+Abund_MR01_O = FromSigmaToAbundance(t_gyr, Sol_MR01_O, dict_MR01)
+Abund_MR01_Si = FromSigmaToAbundance(t_gyr, Sol_MR01_Si, dict_MR01)
+del(dict_MR01)
 #-------------------------------------------------------------------
 
 
@@ -59,21 +52,14 @@ for key, value in Model_and_infall_parameters.items(): dict_M06[key] = value; #
 dict_M06 = prepare_chemdict(dict_M06) # Check the format
 # Compute CIa
 dict_M06["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_M06, present_day_time=today)
-# Now add the values of the elements, with zero initial density:
-dict_M06_Fe = add_element(dict_M06, "Fe", 0.0);
-dict_M06_O = add_element(dict_M06, "O", 0.0);
-dict_M06_Si = add_element(dict_M06, "Si", 0.0);
-del(dict_M06)
-
-# Solve the models for all the elements simultaneously:
-Sol_M06_Fe = SolveChemEvolModel( t_gyr, dict_M06_Fe)
-Sol_M06_O = SolveChemEvolModel( t_gyr, dict_M06_O)
-Sol_M06_Si = SolveChemEvolModel( t_gyr, dict_M06_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_M06_Fe, Sol_M06_O, Sol_M06_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_M06, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_M06_Fe = FromSigmaToAbundance(t_gyr, Sol_M06_Fe, dict_M06_Fe)
-Abund_M06_O = FromSigmaToAbundance(t_gyr, Sol_M06_O, dict_M06_O)
-Abund_M06_Si = FromSigmaToAbundance(t_gyr, Sol_M06_Si, dict_M06_Si)
+Abund_M06_Fe = FromSigmaToAbundance(t_gyr, Sol_M06_Fe, dict_M06)
+Abund_M06_O = FromSigmaToAbundance(t_gyr, Sol_M06_O, dict_M06)
+Abund_M06_Si = FromSigmaToAbundance(t_gyr, Sol_M06_Si, dict_M06)
+del(dict_M06)
 #-------------------------------------------------------------------
 
 
@@ -86,21 +72,14 @@ for key, value in Model_and_infall_parameters.items(): dict_S05[key] = value; #
 dict_S05 = prepare_chemdict(dict_S05) # Check the format
 # Compute CIa
 dict_S05["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_S05, present_day_time=today)
-# Now add the values of the elements, with zero initial density:
-dict_S05_Fe = add_element(dict_S05, "Fe", 0.0);
-dict_S05_O = add_element(dict_S05, "O", 0.0);
-dict_S05_Si = add_element(dict_S05, "Si", 0.0);
-del(dict_S05)
-
-# Solve the models for all the elements simultaneously:
-Sol_S05_Fe = SolveChemEvolModel( t_gyr, dict_S05_Fe)
-Sol_S05_O = SolveChemEvolModel( t_gyr, dict_S05_O)
-Sol_S05_Si = SolveChemEvolModel( t_gyr, dict_S05_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_S05_Fe, Sol_S05_O, Sol_S05_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_S05, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_S05_Fe = FromSigmaToAbundance(t_gyr, Sol_S05_Fe, dict_S05_Fe)
-Abund_S05_O = FromSigmaToAbundance(t_gyr, Sol_S05_O, dict_S05_O)
-Abund_S05_Si = FromSigmaToAbundance(t_gyr, Sol_S05_Si, dict_S05_Si)
+Abund_S05_Fe = FromSigmaToAbundance(t_gyr, Sol_S05_Fe, dict_S05)
+Abund_S05_O = FromSigmaToAbundance(t_gyr, Sol_S05_O, dict_S05)
+Abund_S05_Si = FromSigmaToAbundance(t_gyr, Sol_S05_Si, dict_S05)
+del(dict_S05)
 #-------------------------------------------------------------------
 
 
@@ -113,21 +92,14 @@ for key, value in Model_and_infall_parameters.items(): dict_T08[key] = value; #
 dict_T08 = prepare_chemdict(dict_T08) # Check the format
 # Compute CIa
 dict_T08["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_T08, present_day_time=today)
-# Now add the values of the elements, with zero initial density:
-dict_T08_Fe = add_element(dict_T08, "Fe", 0.0);
-dict_T08_O = add_element(dict_T08, "O", 0.0);
-dict_T08_Si = add_element(dict_T08, "Si", 0.0);
-del(dict_T08)
-
-# Solve the models for all the elements simultaneously:
-Sol_T08_Fe = SolveChemEvolModel( t_gyr, dict_T08_Fe)
-Sol_T08_O = SolveChemEvolModel( t_gyr, dict_T08_O)
-Sol_T08_Si = SolveChemEvolModel( t_gyr, dict_T08_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_T08_Fe, Sol_T08_O, Sol_T08_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_T08, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_T08_Fe = FromSigmaToAbundance(t_gyr, Sol_T08_Fe, dict_T08_Fe)
-Abund_T08_O = FromSigmaToAbundance(t_gyr, Sol_T08_O, dict_T08_O)
-Abund_T08_Si = FromSigmaToAbundance(t_gyr, Sol_T08_Si, dict_T08_Si)
+Abund_T08_Fe = FromSigmaToAbundance(t_gyr, Sol_T08_Fe, dict_T08)
+Abund_T08_O = FromSigmaToAbundance(t_gyr, Sol_T08_O, dict_T08)
+Abund_T08_Si = FromSigmaToAbundance(t_gyr, Sol_T08_Si, dict_T08)
+del(dict_T08)
 #------------------------------------------------------------
 
 
@@ -140,21 +112,14 @@ for key, value in Model_and_infall_parameters.items(): dict_G05Wide[key] = value
 # Compute CIa
 dict_G05Wide["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_G05Wide, present_day_time=today)
 
-# Now add the values of the elements, with zero initial density:
-dict_G05Wide_Fe = add_element(dict_G05Wide, "Fe", 0.0);
-dict_G05Wide_O = add_element(dict_G05Wide, "O", 0.0);
-dict_G05Wide_Si = add_element(dict_G05Wide, "Si", 0.0);
-del(dict_G05Wide)
-
-# Solve the models for all the elements simultaneously:
-Sol_G05Wide_Fe = SolveChemEvolModel( t_gyr, dict_G05Wide_Fe)
-Sol_G05Wide_O = SolveChemEvolModel( t_gyr, dict_G05Wide_O)
-Sol_G05Wide_Si = SolveChemEvolModel( t_gyr, dict_G05Wide_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_G05Wide_Fe, Sol_G05Wide_O, Sol_G05Wide_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_G05Wide, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_G05Wide_Fe = FromSigmaToAbundance(t_gyr, Sol_G05Wide_Fe, dict_G05Wide_Fe)
-Abund_G05Wide_O = FromSigmaToAbundance(t_gyr, Sol_G05Wide_O, dict_G05Wide_O)
-Abund_G05Wide_Si = FromSigmaToAbundance(t_gyr, Sol_G05Wide_Si, dict_G05Wide_Si)
+Abund_G05Wide_Fe = FromSigmaToAbundance(t_gyr, Sol_G05Wide_Fe, dict_G05Wide)
+Abund_G05Wide_O = FromSigmaToAbundance(t_gyr, Sol_G05Wide_O, dict_G05Wide)
+Abund_G05Wide_Si = FromSigmaToAbundance(t_gyr, Sol_G05Wide_Si, dict_G05Wide)
+del(dict_G05Wide)
 #-------------------------------------------------------------------
 
 
@@ -168,21 +133,14 @@ for key, value in Model_and_infall_parameters.items(): dict_G05Close[key] = valu
 # Compute CIa
 dict_G05Close["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_G05Close, present_day_time=today)
 
-# Now add the values of the elements, with zero initial density:
-dict_G05Close_Fe = add_element(dict_G05Close, "Fe", 0.0);
-dict_G05Close_O = add_element(dict_G05Close, "O", 0.0);
-dict_G05Close_Si = add_element(dict_G05Close, "Si", 0.0);
-del(dict_G05Close)
-
-# Solve the models for all the elements simultaneously:
-Sol_G05Close_Fe = SolveChemEvolModel( t_gyr, dict_G05Close_Fe)
-Sol_G05Close_O = SolveChemEvolModel( t_gyr, dict_G05Close_O)
-Sol_G05Close_Si = SolveChemEvolModel( t_gyr, dict_G05Close_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_G05Close_Fe, Sol_G05Close_O, Sol_G05Close_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_G05Close, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_G05Close_Fe = FromSigmaToAbundance(t_gyr, Sol_G05Close_Fe, dict_G05Close_Fe)
-Abund_G05Close_O = FromSigmaToAbundance(t_gyr, Sol_G05Close_O, dict_G05Close_O)
-Abund_G05Close_Si = FromSigmaToAbundance(t_gyr, Sol_G05Close_Si, dict_G05Close_Si)
+Abund_G05Close_Fe = FromSigmaToAbundance(t_gyr, Sol_G05Close_Fe, dict_G05Close)
+Abund_G05Close_O = FromSigmaToAbundance(t_gyr, Sol_G05Close_O, dict_G05Close)
+Abund_G05Close_Si = FromSigmaToAbundance(t_gyr, Sol_G05Close_Si, dict_G05Close)
+del(dict_G05Close)
 #-------------------------------------------------------------------
 
 
@@ -196,21 +154,14 @@ for key, value in Model_and_infall_parameters.items(): dict_P08[key] = value; #
 # Compute CIa
 dict_P08["CIa"] = Get_CIa(TypeIa_SNe_ratio, Area, dict_P08, present_day_time=today)
 
-# Now add the values of the elements, with zero initial density:
-dict_P08_Fe = add_element(dict_P08, "Fe", 0.0);
-dict_P08_O = add_element(dict_P08, "O", 0.0);
-dict_P08_Si = add_element(dict_P08, "Si", 0.0);
-del(dict_P08)
-
-# Solve the models for all the elements simultaneously:
-Sol_P08_Fe = SolveChemEvolModel( t_gyr, dict_P08_Fe)
-Sol_P08_O = SolveChemEvolModel( t_gyr, dict_P08_O)
-Sol_P08_Si = SolveChemEvolModel( t_gyr, dict_P08_Si)
+# Solve the models for all the elements simultaneously (with zero initial density):
+Sol_P08_Fe, Sol_P08_O, Sol_P08_Si = SolveChemEvolModel_MultiElement( t_gyr, dict_P08, elements=["Fe", "O", "Si"], sigmaX_0=0.0)
 
 # From sigma (surface density) to abundance:
-Abund_P08_Fe = FromSigmaToAbundance(t_gyr, Sol_P08_Fe, dict_P08_Fe)
-Abund_P08_O = FromSigmaToAbundance(t_gyr, Sol_P08_O, dict_P08_O)
-Abund_P08_Si = FromSigmaToAbundance(t_gyr, Sol_P08_Si, dict_P08_Si)
+Abund_P08_Fe = FromSigmaToAbundance(t_gyr, Sol_P08_Fe, dict_P08)
+Abund_P08_O = FromSigmaToAbundance(t_gyr, Sol_P08_O, dict_P08)
+Abund_P08_Si = FromSigmaToAbundance(t_gyr, Sol_P08_Si, dict_P08)
+del(dict_P08)
 #-------------------------------------------------------------------
 
 
@@ -1,8 +1,300 @@
+import multiprocessing
+import os
+import sys
+import tempfile
 from CheapTools import *
+from DualNumbers import Dual
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+# Deterministic checks with fixed parameters (those of QuickTest.py with two infalls and the MR01 DTD),
+# so that any failure can be reproduced. Each check stops the script with an AssertionError if it fails.
+# Run only these checks (without the random tests and the plots below) with:  python RandomTester.py --checks
+def check_chemdict(loader=Load_MR01_dict):
+	chemdict = {"omega" : 0.4, "R" : 0.285, "nuL" : 2., "sigma_gas_0" : 1E-8, "tauj" : np.array([7., 0.5]), "tj" : np.array([0., 1.3]), "Aj" : np.array([9.98, 3.])}
+	chemdict = add_element(chemdict, "Fe", 0.01)
+	chemdict = loader(chemdict)
+	chemdict["CIa"] = Get_CIa(0.54/100.*1E9, np.pi*(20.**2-3.**2)*1E6, chemdict, present_day_time=13.8)
+	return( chemdict )
+
+def perturbed(chemdict, name, h, k=None):
+	chemdict = chemdict.copy()
+	chemdict[name] = chemdict[name] + (h if k is None else h*np.eye(len(chemdict[name]))[k])
+	return( chemdict )
+
+def abundance(t, chemdict, element):
+	'''[X/H] with the yields of Element_yields (sigmaX_0=0), from one SolveChemEvolModel'''
+	chemdict = add_element(chemdict, element)
+	return( FromSigmaToAbundance(t, SolveChemEvolModel(t, chemdict.copy()), chemdict) )
+
+t_check = np.linspace(0., 13.8, 400)
+chemdict = check_chemdict()
+sigma_check = SolveChemEvolModel(t_check, chemdict.copy())
+
+# SolveChemEvolModel_MultiElement against one SolveChemEvolModel per element (add_element):
+sigma_elements = SolveChemEvolModel_MultiElement(t_check, chemdict, sigmaX_0=[0.01, 0.02, 0.], elements=["Fe", "O", "Si"])
+for k, (element, sigmaX_0) in enumerate(zip(["Fe", "O", "Si"], [0.01, 0.02, 0.])):
+	single = add_element(chemdict, element)
+	single["sigmaX_0"] = sigmaX_0
+	sigma = SolveChemEvolModel(t_check, single)
+	assert(np.max(np.abs(sigma_elements[k]-sigma))<=1e-14*np.max(sigma)), "ERROR: SolveChemEvolModel_MultiElement differs from SolveChemEvolModel (%s)"%element
+# ChemModel against the functions it replaces:
+model = ChemModel(chemdict)
+assert(np.array_equal(model.sigma(t_check), sigma_check)), "ERROR: ChemModel.sigma and SolveChemEvolModel differ"
+assert(np.array_equal(model.psi(t_check), Get_psi(t_check, chemdict.copy()))), "ERROR: ChemModel.psi and Get_psi differ"
+# SolveChemEvolModel_Batch against one SolveChemEvolModel per parameter set (the second one has tauj=1/alpha):
+batchdict = chemdict.copy()
+batchdict["omega"] = np.array([0.4, 0.6, 0.3])
+batchdict["nuL"] = np.array([2., 1.5, 2.5])
+alpha = (1.+batchdict["omega"]-chemdict["R"])*batchdict["nuL"]
+batchdict["tauj"] = np.array([[7., 0.5], [3., 1./alpha[1]], [7., 2.]])
+batchdict["AG"] = np.outer([1., 0.5, 2.], chemdict["AG"])
+sigma_batch = SolveChemEvolModel_Batch(t_check, batchdict)
+for k in range(3):
+	single = chemdict.copy()
+	single.update(omega=batchdict["omega"][k], nuL=batchdict["nuL"][k], tauj=batchdict["tauj"][k], AG=batchdict["AG"][k])
+	sigma = SolveChemEvolModel(t_check, single)
+	assert(np.max(np.abs(sigma_batch[k]-sigma))<=1e-12*np.max(sigma)), "ERROR: SolveChemEvolModel_Batch differs from SolveChemEvolModel (parameter set %d)"%k
+# The analytic solution against the adaptive numeric references, which do not use the analytic terms:
+reference = SolveChemEvolModel_numeric(t_check, chemdict.copy(), tol=1e-10)
+assert(np.max(np.abs(sigma_check-reference))<=1e-10*np.max(reference)), "ERROR: SolveChemEvolModel and SolveChemEvolModel_numeric differ"
+reference = R1a_numeric(t_check, chemdict.copy(), tol=1e-10)
+assert(np.max(np.abs(R1a_analytic(t_check, chemdict.copy())-reference))<=1e-10*np.max(reference)), "ERROR: R1a_analytic and R1a_numeric differ"
+# SolveChemEvolModel_FromLinearBases with new coefficients (two values of CIa at once) against SolveChemEvolModel:
+bases = SolveChemEvolModel_LinearBases(t_check, chemdict)
+sigma_linear = SolveChemEvolModel_FromLinearBases(bases, 0.02, 1E-3, 0.3, chemdict["CIa"]*np.array([0.5, 2.]))
+for k, factor in enumerate([0.5, 2.]):
+	single = chemdict.copy()
+	single.update(sigmaX_0=0.02, yx=1E-3, mx1a=0.3, CIa=chemdict["CIa"]*factor)
+	sigma = SolveChemEvolModel(t_check, single)
+	assert(np.max(np.abs(sigma_linear[k]-sigma))<=1e-13*np.max(sigma)), "ERROR: SolveChemEvolModel_FromLinearBases differs from SolveChemEvolModel"
+# SolveChemEvolModel_Grid (two DTDs, 3x2 models in chunks of 4) and its resumption, against SolveChemEvolModel:
+base = {name: value for name, value in chemdict.items() if name not in ChemModel._fields_gauss+ChemModel._fields_exp+ChemModel._fields_inv}
+axes = {"omega": [0.3, 0.4, 0.6], "tauj": [[7., 0.5], [3., 2.]]}
+loaders = [Load_MR01_dict, Load_S05_dict]
+with tempfile.TemporaryDirectory() as directory:
+	output = os.path.join(directory, "grid.npy")
+	grid = SolveChemEvolModel_Grid(t_check, axes, base, loader=loaders, chunk_size=4, processes=1, output=output)
+	# Interrupted run: the last chunk (the models with omega=0.6) is not finished
+	done = np.load(output+".done.npy", mmap_mode="r+")
+	done[:,-1] = False
+	grid[:,2] = np.nan
+	done.flush(); grid.flush()
+	del grid, done
+	grid = np.array(SolveChemEvolModel_Grid(t_check, axes, base, loader=loaders, chunk_size=4, processes=1, output=output))
+for d, loader in enumerate(loaders):
+	for i, omega in enumerate(axes["omega"]):
+		for j, tauj in enumerate(axes["tauj"]):
+			single = loader(base.copy())
+			single.update(omega=omega, tauj=np.array(tauj))
+			sigma = SolveChemEvolModel(t_check, single)
+			assert(np.max(np.abs(grid[d,i,j]-sigma))<=1e-12*np.max(sigma)), "ERROR: SolveChemEvolModel_Grid differs from SolveChemEvolModel (model %d, %d, %d)"%(d, i, j)
+# SolveChemEvolModel_Blocks and SolveChemEvolModel_Streaming (into a .npy file) with blocks that do not divide len(t):
+sigma = np.concatenate([sigma_block for (t_block, sigma_block) in SolveChemEvolModel_Blocks(t_check, chemdict, block_size=37)])
+assert(np.max(np.abs(sigma-sigma_check))<=1e-13*np.max(sigma_check)), "ERROR: SolveChemEvolModel_Blocks differs from SolveChemEvolModel"
+with tempfile.TemporaryDirectory() as directory:
+	sigma = SolveChemEvolModel_Streaming(t_check, chemdict, out=os.path.join(directory, "sigma.npy"), block_size=37)
+	assert(np.max(np.abs(sigma-sigma_check))<=1e-13*np.max(sigma_check)), "ERROR: SolveChemEvolModel_Streaming differs from SolveChemEvolModel"
+	del sigma
+# Shuffled times, with duplicates and negative times (the kernels are not restricted to the active windows), where tj>0,
+# also at t=tj-tauj>0 (expi(0) of the inverse DTD before its window):
+t_sorted = np.sort(np.concatenate([t_check, t_check[::7], [-1., -0.1], np.maximum(chemdict["tj"]-chemdict["tauj"], 0.)]))
+permutation = np.random.RandomState(0).permutation(len(t_sorted))
+sigma = SolveChemEvolModel(t_sorted, chemdict.copy())[permutation]
+assert(np.max(np.abs(SolveChemEvolModel(t_sorted[permutation], chemdict.copy())-sigma))<=1e-13*np.max(sigma)), "ERROR: SolveChemEvolModel differs for unsorted times"
+# Get_ipsi (with an infall at tauj=1/alpha) against the cumulative trapezoidal rule of Get_psi on a fine grid,
+# and the cumulative stellar-mass helpers against each other:
+special = chemdict.copy()
+special["tauj"] = np.array([1./((1.+chemdict["omega"]-chemdict["R"])*chemdict["nuL"]), 0.5])
+t_fine = np.linspace(0., 13.8, 2*10**5+1)
+psi = Get_psi(t_fine, special.copy())
+reference = np.concatenate([[0.], np.cumsum(0.5*(psi[1:]+psi[:-1])*np.diff(t_fine))])
+assert(np.max(np.abs(Get_ipsi(t_fine, special)-reference))<=1e-8*reference[-1]), "ERROR: Get_ipsi differs from the integral of Get_psi"
+assert(Get_ipsi(0., special)==0.), "ERROR: Get_ipsi must vanish at t=0"
+formed = Get_stellar_mass(t_check, special, locked=False)
+assert(np.array_equal(formed, Get_ipsi(t_check, special))), "ERROR: Get_stellar_mass(locked=False) differs from Get_ipsi"
+assert(np.max(np.abs(formed-Get_returned_mass(t_check, special)-Get_stellar_mass(t_check, special)))<=1e-14*np.max(formed)), "ERROR: Get_stellar_mass(locked=False)-Get_returned_mass differs from Get_stellar_mass"
+sigma_gas = Get_psi(t_check[1:], special.copy())/special["nuL"]
+assert(np.allclose(Get_gas_fraction(t_check[1:], special)*(sigma_gas+Get_stellar_mass(t_check[1:], special)), sigma_gas, rtol=1e-14, atol=0.)), "ERROR: Get_gas_fraction"
+# Get_MDF against a histogram of [Fe/H] on a fine uniform grid, weighted by the mass formed in each step
+# (at most a fraction accuracy of the stellar mass may be in a wrong bin):
+bins = np.linspace(-3., 1., 41)
+hist, edges = Get_MDF(chemdict, bins, accuracy=1e-3)
+t_fine = np.linspace(0., 13.8, 2*10**5+1)
+t_mid = 0.5*(t_fine[1:]+t_fine[:-1])
+fedict = chemdict.copy()
+fedict.update(sigmaX_0=0., yx=Element_yields["fe"][0], mx1a=Element_yields["fe"][1])
+mass = np.diff(Get_ipsi(t_fine, chemdict.copy()))
+reference, _ = np.histogram(FromSigmaToAbundance(t_mid, SolveChemEvolModel(t_mid, fedict.copy()), fedict), edges, weights=mass)
+assert(np.sum(np.abs(hist-reference))<=1e-3*np.sum(mass)), "ERROR: Get_MDF differs from the histogram on a fine grid"
+# Get_time_at_abundance against the first time of the fine grid where [Fe/H] reaches each threshold
+# (-0.42554 is first reached just before the second infall, which then dilutes Fe below it; 1 is never reached):
+FeH = FromSigmaToAbundance(t_fine[1:], SolveChemEvolModel(t_fine[1:], fedict.copy()), fedict)+2.752
+threshold = np.array([-4., -1., -0.42554, -0.2, 0., 0.1, 1.])
+t_threshold = Get_time_at_abundance(threshold, fedict, solar=-2.752)
+assert(np.isnan(t_threshold[-1])), "ERROR: Get_time_at_abundance must return nan for a threshold that is not reached"
+t_threshold, threshold = t_threshold[:-1], threshold[:-1]
+first = np.array([np.argmax(FeH>=x) for x in threshold])+1
+assert(np.all(t_fine[first-1]<t_threshold) and np.all(t_threshold<=t_fine[first])), "ERROR: Get_time_at_abundance does not return the first crossing"
+FeH = FromSigmaToAbundance(t_threshold, SolveChemEvolModel(t_threshold, fedict.copy()), fedict)+2.752
+assert(np.max(np.abs(FeH-threshold))<=1e-9), "ERROR: [Fe/H] at the times of Get_time_at_abundance differs from the thresholds"
+# Jacobians of sigma_X and R1a against central finite differences:
+sigma, jacobian = SolveChemEvolModel(t_check, chemdict.copy(), jacobian=True)
+assert(np.allclose(sigma, sigma_check, rtol=1e-13, atol=0.)), "ERROR: SolveChemEvolModel(jacobian=True) changes sigma_X"
+r1a, r1a_jacobian = R1a_analytic(t_check, chemdict.copy(), jacobian=True)
+assert(np.allclose(r1a, R1a_analytic(t_check, chemdict.copy()), rtol=1e-13, atol=0.)), "ERROR: R1a_analytic(jacobian=True) changes R1a"
+for function, derivatives, names in [(SolveChemEvolModel, jacobian, ["sigmaX_0", "yx", "mx1a"]), (R1a_analytic, r1a_jacobian, [])]:
+	for name in names+["CIa", "AG", "AE", "AI", "omega", "nuL", "R", "sigma_gas_0", "tauj", "Aj"]:
+		for k in ([None] if np.ndim(chemdict[name])==0 else range(len(chemdict[name]))):
+			h = 1e-6*max(abs(chemdict[name] if k is None else chemdict[name][k]), 1.)
+			difference = (function(t_check, perturbed(chemdict, name, h, k)) - function(t_check, perturbed(chemdict, name, -h, k)))/(2.*h)
+			derivative = derivatives[name] if k is None else derivatives[name][k]
+			assert(np.max(np.abs(derivative-difference))<=1e-5*np.max(np.abs(difference))), "ERROR: Jacobian of %s with respect to %s"%(function.__name__, name)
+# SolveChemEvolModel_Rate against a central difference of sigma_X, away from the breakpoints (tj, tj+tau1, tj+tau2):
+loaded = prepare_chemdict(chemdict.copy())
+breakpoints = np.add.outer(loaded["tj"], np.concatenate([[0.]]+[loaded[name] for name in ["tau1G", "tau2G", "tau1E", "tau2E", "tau1I", "tau2I"]])).ravel()
+breakpoints = np.unique(breakpoints[breakpoints<=13.8])
+h = 1e-4
+t_rate = np.linspace(0.01, 13.7, 2000)
+t_rate = t_rate[np.min(np.abs(np.subtract.outer(t_rate, breakpoints)), axis=1)>4.*h]
+difference = (SolveChemEvolModel(t_rate+h, chemdict.copy())-SolveChemEvolModel(t_rate-h, chemdict.copy()))/(2.*h)
+assert(np.max(np.abs(SolveChemEvolModel_Rate(t_rate, chemdict.copy())-difference))<=1e-6*np.max(np.abs(difference))), "ERROR: SolveChemEvolModel_Rate differs from the derivative of sigma_X"
+# Dual propagates the derivatives of the supported operations, and rejects the others:
+x = Dual(np.linspace(0.5, 2., 4), np.eye(4))
+y = np.exp(-x)*erf(x)/x
+assert(np.allclose(np.diag(y.der), np.exp(-x.val)*(2./np.sqrt(np.pi)*np.exp(-x.val**2)/x.val - erf(x.val)/x.val - erf(x.val)/x.val**2), rtol=1e-14)), "ERROR: derivatives of Dual"
+for unsupported in (np.sin, np.sum, np.cumsum):
+	try:
+		unsupported(x)
+	except TypeError:
+		pass
+	else:
+		raise AssertionError("ERROR: %s should raise a TypeError with Dual"%unsupported.__name__)
+# Get_loglikelihood (blocks of 128 stars, repeated ages, missing [O/Fe]) against the sum over the stars,
+# and Get_loglikelihood_Batch against one Get_loglikelihood per parameter set:
+rng = np.random.RandomState(1)
+ages = np.round(13.8*rng.rand(1000), 2)
+FeH = abundance(13.8-ages, chemdict, "Fe") + 2.752 + 0.1*rng.randn(1000)
+OFe = abundance(13.8-ages, chemdict, "O") - abundance(13.8-ages, chemdict, "Fe") - 0.646 + 0.05*rng.randn(1000)
+OFe[::7] = np.nan
+observations = {"Fe/H": (FeH, 0.1+0.05*rng.rand(1000)), "O/Fe": (OFe, 0.05)}
+solar = {"Fe/H": -2.752, "O/Fe": 0.646}
+logL = Get_loglikelihood(ages, observations, chemdict, solar=solar, block_size=128)
+reference = 0.
+for name, (numerator, denominator) in {"Fe/H": ("Fe", None), "O/Fe": ("O", "Fe")}.items():
+	values, errors = observations[name]
+	used = np.isfinite(values)
+	errors = np.broadcast_to(errors, values.shape)[used]
+	ratio = abundance(13.8-ages[used], chemdict, numerator) - (0. if denominator is None else abundance(13.8-ages[used], chemdict, denominator)) - solar[name]
+	reference -= 0.5*np.sum(np.square((ratio-values[used])/errors) + np.log(2.*np.pi*np.square(errors)))
+assert(abs(logL-reference)<=1e-12*abs(reference)), "ERROR: Get_loglikelihood differs from the sum over the stars"
+def check_loglikelihood_batch(batchdict):
+	logL_batch = Get_loglikelihood_Batch(ages, observations, batchdict, solar=solar, block_size=128)
+	for k in range(len(logL_batch)):
+		single = chemdict.copy()
+		single.update(omega=batchdict["omega"][k], nuL=batchdict["nuL"][k], tauj=batchdict["tauj"][k], AG=batchdict["AG"][k])
+		logL = Get_loglikelihood(ages, observations, single, solar=solar)
+		assert(abs(logL_batch[k]-logL)<=1e-10*abs(logL)), "ERROR: Get_loglikelihood_Batch differs from Get_loglikelihood (parameter set %d)"%k
+
+# (the second parameter set has tauj=1/alpha with alpha-1/tauj exactly zero)
+likedict = batchdict.copy()
+likedict["nuL"] = np.array([2., 2., 2.5])
+likedict["omega"] = np.array([0.4, 0.4, 0.3])
+alpha = (1.+likedict["omega"]-chemdict["R"])*likedict["nuL"]
+likedict["tauj"] = np.array([[7., 0.5], [3., 1./alpha[1]], [7., 2.]])
+check_loglikelihood_batch(likedict)
+# SolveChemEvolModel_Unique (shuffled times with duplicates), also with the times rounded to multiples of tolerance:
+t_repeated = np.random.RandomState(2).permutation(np.concatenate([t_check, t_check[::3], t_check[::5]]))
+sigma = SolveChemEvolModel(t_repeated, chemdict.copy())
+assert(np.max(np.abs(SolveChemEvolModel_Unique(t_repeated, chemdict.copy())-sigma))<=1e-13*np.max(sigma)), "ERROR: SolveChemEvolModel_Unique differs from SolveChemEvolModel"
+sigma = SolveChemEvolModel(np.round(t_repeated/1e-2)*1e-2, chemdict.copy())
+assert(np.max(np.abs(SolveChemEvolModel_Unique(t_repeated, chemdict.copy(), tolerance=1e-2)-sigma))<=1e-13*np.max(sigma)), "ERROR: SolveChemEvolModel_Unique(tolerance>0) differs from SolveChemEvolModel on the rounded times"
+# ChemicalSolutionVerifier(method="stencil"): nan on the breakpoints (which are included in the nodes), and
+# round-off errors elsewhere:
+t_nodes = np.union1d(t_check, breakpoints)
+difference, t_sorted, scale = ChemicalSolutionVerifier(t_nodes, chemdict.copy(), method="stencil", full_output=True)
+on_breakpoint = np.isin(t_sorted, breakpoints)
+assert(np.all(np.isnan(difference[on_breakpoint])) and np.all(np.isfinite(difference[~on_breakpoint]))), "ERROR: ChemicalSolutionVerifier(method='stencil') must be nan only on the breakpoints"
+assert(np.max(np.abs(difference[~on_breakpoint]))<=1e-9*np.max(scale)), "ERROR: ChemicalSolutionVerifier(method='stencil') finds an error in the solution"
+# Fuzz_ChemicalSolutions: the models only depend on (seed, k), so the report does not depend on the processes or chunks
+# (with the spawn or forkserver start methods the workers would run this script again, so they are only used with fork):
+report = Fuzz_ChemicalSolutions(n_models=20, seed=3, processes=1)
+other = Fuzz_ChemicalSolutions(n_models=20, seed=3, processes=2 if multiprocessing.get_start_method()=="fork" else 1, chunk_size=3)
+assert(np.array_equal(report["errors"], other["errors"]) and np.array_equal(report["families"], other["families"])), "ERROR: Fuzz_ChemicalSolutions depends on the processes"
+assert([w["index"] for w in report["worst"]]==[w["index"] for w in other["worst"]]), "ERROR: Fuzz_ChemicalSolutions depends on the processes"
+# Models with tauj=1/alpha set in floating point (alpha-1/tauj=-2E-16, the special case alpha==1/tauj) for the three
+# DTD families (the Exponential one with a small tauD), against the adaptive numeric reference:
+special = {name: value for name, value in chemdict.items() if name not in ChemModel._fields_gauss+ChemModel._fields_exp+ChemModel._fields_inv}
+special.update(omega=0.6, nuL=1.5)
+alpha = (1.+special["omega"]-special["R"])*special["nuL"]
+special["tauj"] = np.array([1./alpha, 0.5])
+assert(alpha-1./special["tauj"][0]!=0.)
+for family, special_dtd in [("Gaussian", Load_S05_dict(special)), ("Exponential", dict(special, AE=[1.], tauD=[0.01], tau1E=[0.03], tau2E=[13.8])), ("Inverse", Load_T08_dict(special))]:
+	reference = SolveChemEvolModel_numeric(t_check, special_dtd.copy(), tol=1e-11)
+	assert(np.max(np.abs(SolveChemEvolModel(t_check, special_dtd.copy())-reference))<=1e-10*np.max(reference)), "ERROR: SolveChemEvolModel with tauj=1/alpha differs from SolveChemEvolModel_numeric (%s DTD)"%family
+# and Get_loglikelihood_Batch with the parameter sets of the batch check (the second one has alpha-1/tauj=-2E-16):
+check_loglikelihood_batch(batchdict)
+# and the random models of Fuzz_ChemicalSolutions (a quarter of them have tauj[0]=1/alpha set in floating point):
+assert(np.nanmax(report["errors"])<=1e-6), "ERROR: Fuzz_ChemicalSolutions finds an error in the solution"
+# Dense output (rtol=1E-10) against the model, at times that are not its fit nodes:
+model = ChemModel(chemdict)
+dense = model.dense_output(13.8, rtol=1E-10)
+t_random = np.sort(13.8*rng.rand(10000))
+for name in dense.quantities:
+	reference = getattr(model, name)(t_random)
+	assert(np.max(np.abs(getattr(dense, name)(t_random)-reference))<=1E-10*np.max(np.abs(reference))), "ERROR: the dense output of %s differs from ChemModel"%name
+late = t_random>0.1
+assert(np.max(np.abs(dense.abundance(t_random[late])-FromSigmaToAbundance(t_random[late], model.sigma(t_random[late]), chemdict)))<=1E-8), "ERROR: the dense output of [X/H] differs from ChemModel"
+sigma, dense = SolveChemEvolModel(t_check, chemdict.copy(), dense_output=True)
+assert(np.array_equal(sigma, sigma_check)), "ERROR: SolveChemEvolModel(dense_output=True) changes sigma_X"
+# SolveChemEvolModel_FFT and R1a_FFT (DTD of chemdict tabulated) against the analytic solution, for the bundled DTDs:
+# the relative errors are below 3E-4 with the default grid, and decrease with a finer grid (as dt**2 for the smooth DTDs)
+for loader in [Load_MR01_dict, Load_S05_dict, Load_MVP06_dict, Load_P08_dict, Load_T08_dict]:
+	loaded = check_chemdict(loader)
+	sigma, r1a = SolveChemEvolModel(t_check, loaded.copy()), R1a_analytic(t_check, loaded.copy())
+	errors = [[np.max(np.abs(SolveChemEvolModel_FFT(t_check, loaded.copy(), n_grid=n_grid)-sigma))/np.max(sigma),
+			   np.max(np.abs(R1a_FFT(t_check, loaded.copy(), n_grid=n_grid)-r1a))/np.max(r1a)] for n_grid in [2**14, 2**16]]
+	assert(np.max(errors[1])<=3E-4), "ERROR: SolveChemEvolModel_FFT or R1a_FFT differ from the analytic solution (%s)"%loader.__name__
+	assert(np.all(np.array(errors[0])>2.*np.array(errors[1]))), "ERROR: the error of SolveChemEvolModel_FFT or R1a_FFT does not decrease with dt (%s)"%loader.__name__
+dt = 13.8/2**16
+table = Get_DTD_arr(dt*np.arange(2**16+1), prepare_chemdict(chemdict.copy()))
+assert(np.array_equal(SolveChemEvolModel_FFT(t_check, chemdict.copy(), DTD=table, dt=dt), SolveChemEvolModel_FFT(t_check, chemdict.copy()))), "ERROR: SolveChemEvolModel_FFT with the tabulated DTD of chemdict differs from DTD=None"
+# float32 throughput mode against the float64 reference, with the error bounds of the README (bundled DTDs):
+late = t_check>=0.1
+for loader in [Load_MR01_dict, Load_S05_dict, Load_MVP06_dict, Load_P08_dict, Load_T08_dict]:
+	loaded = check_chemdict(loader)
+	for function, bound in [(SolveChemEvolModel, 6E-5), (Get_psi, 2E-6), (R1a_analytic, 2E-5)]:
+		reference, value = function(t_check, loaded.copy()), function(t_check.astype(np.float32), loaded.copy(), dtype=np.float32)
+		assert(value.dtype==np.float32), "ERROR: %s(dtype=np.float32) does not return float32"%function.__name__
+		assert(np.max(np.abs(value-reference))<=bound*np.max(reference)), "ERROR: %s in float32 differs from float64 (%s)"%(function.__name__, loader.__name__)
+	sigma = SolveChemEvolModel(t_check.astype(np.float32), loaded.copy(), dtype=np.float32)
+	FeH = FromSigmaToAbundance(t_check.astype(np.float32), sigma, loaded, dtype=np.float32)
+	reference = FromSigmaToAbundance(t_check, SolveChemEvolModel(t_check, loaded.copy()), loaded)
+	assert(np.max(np.abs(FeH-reference)[late])<=1E-4), "ERROR: [Fe/H] in float32 differs from float64 (%s)"%loader.__name__
+# The Jacobians and the dense output are only computed in float64:
+for call in [lambda: SolveChemEvolModel(t_check, chemdict.copy(), jacobian=True, dtype=np.float32),
+			 lambda: SolveChemEvolModel(t_check, chemdict.copy(), dense_output=True, dtype=np.float32),
+			 lambda: R1a_analytic(t_check, chemdict.copy(), jacobian=True, dtype=np.float32),
+			 lambda: ChemModel(chemdict, dtype=np.float32).dense_output(13.8)]:
+	try:
+		call()
+	except ValueError:
+		pass
+	else:
+		raise AssertionError("ERROR: the Jacobians and the dense output must raise a ValueError in float32")
+# Unsupported dtypes are rejected with a ValueError:
+try:
+	SolveChemEvolModel(t_check, chemdict.copy(), dtype=np.float16)
+except ValueError:
+	pass
+else:
+	raise AssertionError("ERROR: dtype=np.float16 must raise a ValueError")
+print(" Deterministic checks passed ")
+if "--checks" in sys.argv: sys.exit(0)
+# --------------------------------------------------------
+
+
 # This code performs some tests with random (but numerically reasonable) parameters to
 # check if the analytic solution is correct.
 Ninfall = 3;